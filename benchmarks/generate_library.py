@@ -0,0 +1,112 @@
+"""
+Write a synthetic ReadEra library.json for benchmarks and tests.
+
+    python benchmarks/generate_library.py library.json --books 2000 --quotes-per-book 25
+
+Books get titles, authors, annotations, folders (colls), reading state,
+Goodreads-like review notes ("year;rating;ratings count") and a
+doc_position with the page count, quotes get a text, page and insert time.
+The same arguments and seed always give the same file.
+"""
+import argparse
+import json
+import random
+
+WORDS = (
+    "love time world life heart light death night reason truth power people nature mind memory water "
+    "silence beauty freedom history river mountain stone house garden window shadow dream morning voice "
+    "friend mother father child city road letter book story question answer fear hope desire body soul "
+    "language money work war peace summer winter fire earth sky moment years thing place woman man"
+    ).split()
+COMMON_WORDS = "the and of to a in that is it was he for with as his on be at by i this had not are but from or have".split()
+FOLDER_NAMES = ["Novels", "Sci-fi", "Essays", "Poetry", "History", "Philosophy", "Biography", "Classics",
+                "Science", "Travel", "Drama", "Short stories"]
+
+# Dec 2019 .. Dec 2025 in milliseconds
+FIRST_TIME = 1575158400000
+LAST_TIME = 1766473200000
+
+
+##################################################
+# FUNCTION: write a synthetic library file
+##################################################
+def generate_library(path, books=1000, quotes_per_book=20, folders=5, review_ratio=0.8,
+                     position_ratio=0.9, active_ratio=0.97, seed=1):
+    """
+    Write the library and return (books, quotes) written. The number of
+    quotes of a book varies a lot around quotes_per_book, like in real
+    libraries: many books without quotes, a few with hundreds.
+    """
+    rnd = random.Random(seed)
+    # a few frequent words and a long tail, roughly like real text
+    vocabulary = WORDS + [f"{word}{suffix}" for word in WORDS for suffix in ("s", "ed", "ing", "ness")]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    authors = [f"{rnd.choice(['Anna', 'Peter', 'Maria', 'John', 'Eva', 'Laszlo', 'Emily', 'Jorge'])} "
+               f"Author{i}" for i in range(max(1, books // 3))]
+
+    docs = []
+    quote_count = 0
+    for number in range(books):
+        author = rnd.choice(authors)
+        title = f"{author} - {' '.join(rnd.choices(vocabulary, weights, k=rnd.randint(1, 5))).title()} {number}"
+        pages = rnd.choice([120, 200, 280, 350, 480, 700, 1100])
+        # about 30% of the books have no quotes, the mean stays quotes_per_book
+        count = int(rnd.expovariate(0.7 / quotes_per_book)) if quotes_per_book and rnd.random() < 0.7 else 0
+        citations = []
+        for _ in range(count):
+            insert_time = rnd.randint(FIRST_TIME, LAST_TIME)
+            citations.append({
+                "note_body": get_sentence(rnd, vocabulary, weights),
+                "note_page": rnd.randint(1, pages),
+                "note_insert_time": insert_time
+                })
+        quote_count += len(citations)
+
+        have_read = rnd.random() < 0.4
+        data = {
+            "doc_active": 1 if rnd.random() < active_ratio else 0,
+            # some titles start with numbers or symbols, the tool strips them
+            "doc_file_name_title": f"{rnd.choice(['', '', '01 ', '_', '[2] '])}{title}",
+            "doc_authors": author,
+            "user_authors": author if rnd.random() < 0.3 else "",
+            "doc_annotation": get_sentence(rnd, vocabulary, weights) if rnd.random() < 0.5 else "",
+            "file_modified_time": rnd.randint(FIRST_TIME, LAST_TIME),
+            "doc_activity_time": rnd.randint(FIRST_TIME, LAST_TIME) if have_read or rnd.random() < 0.2 else 0,
+            "doc_have_read_time": rnd.randint(FIRST_TIME, LAST_TIME) if have_read else 0,
+            "doc_position": json.dumps({"pagesCount": pages}) if rnd.random() < position_ratio else ""
+            }
+        reviews = []
+        if rnd.random() < review_ratio:
+            ratings_count = rnd.choice([f"{rnd.randint(1, 999)}", f"{rnd.randint(1, 999)}k{rnd.randint(0, 9)}"])
+            reviews.append({"note_body": f"{rnd.randint(1700, 2024)};{rnd.uniform(2.5, 4.9):.2f};{ratings_count}"})
+        docs.append({"uri": f"content://synthetic/{number}", "data": data, "reviews": reviews, "citations": citations})
+
+    colls = [{"data": {"coll_title": name}, "docs": [doc["uri"] for doc in docs if rnd.random() < 1.0 / folders]}
+             for name in FOLDER_NAMES[:folders]]
+    with open(path, "w", encoding="utf8") as file:
+        json.dump({"version": 1, "docs": docs, "colls": colls}, file, ensure_ascii=False)
+    return books, quote_count
+
+def get_sentence(rnd, vocabulary, weights):
+    # short and long quotes, with common words and punctuation
+    words = []
+    for _ in range(rnd.choice([4, 8, 15, 30, 60, 120])):
+        words.append(rnd.choice(COMMON_WORDS) if rnd.random() < 0.35 else rnd.choices(vocabulary, weights)[0])
+        if rnd.random() < 0.08:
+            words[-1] += ","
+    return ' '.join(words).capitalize() + rnd.choice([".", ".", "!", "?", "..."])
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Write a synthetic ReadEra library.json")
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--books", type=int, default=1000)
+    arg_parser.add_argument("--quotes-per-book", type=float, default=20)
+    arg_parser.add_argument("--folders", type=int, default=5, choices=range(1, len(FOLDER_NAMES) + 1))
+    arg_parser.add_argument("--review-ratio", type=float, default=0.8, help="books with a review note")
+    arg_parser.add_argument("--position-ratio", type=float, default=0.9, help="books with a page count")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+    book_count, quote_count = generate_library(args.path, args.books, args.quotes_per_book, args.folders,
+                                               args.review_ratio, args.position_ratio, seed=args.seed)
+    print(f"{args.path}: {book_count} books, {quote_count} quotes")
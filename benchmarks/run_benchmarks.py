@@ -0,0 +1,246 @@
+"""
+Time the hot paths of readera-collection-cli.py on synthetic libraries
+and save the results as JSON, so versions can be compared.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --scales 1000 10000 --compare old-results.json
+
+Every scale is a number of quotes, a library of that size is generated
+(with a fixed seed) into a temporary folder. Each phase is timed and its
+peak traced memory (tracemalloc) is recorded. Tracing slows Python down,
+so the times are higher than in normal use, but comparable between runs.
+
+The phases call functions of the script, so the harness measures the
+script next to it. To compare versions, run the harness of each version
+and pass the results of one to --compare.
+
+The quote memory case builds a library of --memory-quotes quotes (200k by
+default) and compares the memory of the columnar QuoteStore with the
+per-quote objects it replaced, rebuilt here from the same quotes.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from generate_library import generate_library
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "readera-collection-cli.py")
+QUOTES_PER_BOOK = 20
+SIMILAR_LOOKUPS = 20
+SEARCH_SCREEN_GROUPS = 3
+SEARCH_QUERIES = ["love", "time world", "light*", '"the river"', "death OR silence", "=ounta", "~hart"]
+MEMORY_QUOTES = 200000
+
+
+class ObjectQuote:
+    """
+    A quote as it was kept before the QuoteStore: an object with an
+    instance dictionary, in a list of long and of short quotes per book.
+    """
+    def __init__(self, text, page_number):
+        self.text = text
+        self.page = page_number
+
+
+##################################################
+# FUNCTION: load the script as a module
+##################################################
+def load_script(path):
+    spec = importlib.util.spec_from_file_location("readera_collection_cli", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+##################################################
+# FUNCTION: run and measure a phase
+##################################################
+def measure(function):
+    """
+    Return (seconds, peak traced bytes) of a call, its output is dropped.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        function()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+##################################################
+# FUNCTION: benchmark one library size
+##################################################
+def run_scale(cli, quote_count, seed):
+    """
+    Generate a library of about quote_count quotes and measure every phase,
+    return {phase: {"seconds": ..., "peak_bytes": ...}}.
+    """
+    results = {}
+
+    def record(name, function):
+        seconds, peak = measure(function)
+        results[name] = {"seconds": round(seconds, 6), "peak_bytes": peak}
+
+    def search():
+        # the groups may be made while they are read, all of them are read
+        for query in SEARCH_QUERIES:
+            list(cli.find_search_results(query)[1])
+
+    def search_first_screen():
+        for query in SEARCH_QUERIES:
+            groups = iter(cli.find_search_results(query)[1])
+            for _ in range(SEARCH_SCREEN_GROUPS):
+                next(groups, None)
+
+    def similar_quotes():
+        # the TF-IDF norms are built by the first lookup
+        cli.Similar_Quotes = None
+        books = [book for book in cli.The_Collection if book.total_q > 0]
+        for book in random.Random(seed).sample(books, min(SIMILAR_LOOKUPS, len(books))):
+            cli.find_similar_quotes(book, book.get_all_quotes_list()[0], cli.SIMILAR_QUOTES_COUNT)
+
+    def word_counts():
+        cli.Word_Statistics = None
+        cli.get_statistics_data()
+        cli.get_top_words(30)
+
+    def distribution():
+        histogram = cli.QuoteHistogram()
+        for book in cli.The_Collection:
+            if book.total_q > 0:
+                histogram.render_book(book, 100)
+        for folder in cli.Folders:
+            histogram.render_group(cli.Collection_Index.get_books(cli.Collection_Index.select(folder=folder)), 100)
+
+    def random_sampling():
+        random.seed(seed)
+        sampler = cli.QuoteSampler(cli.The_Collection, "Any length", "quotes")
+        while sampler.draw():
+            pass
+
+    def list_sorting():
+        for book_property in cli.LIST_SORT_KEYS:
+            cli.Collection_Index._sort_ranks.clear()
+            cli.list_books_by_property(book_property)
+            for folder in cli.Folders:
+                cli.list_books_by_property(book_property, folder=folder)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cli.LIBRARY_FILE = os.path.join(directory, "library.json")
+        books, quotes = generate_library(cli.LIBRARY_FILE, books=max(1, quote_count // QUOTES_PER_BOOK),
+                                         quotes_per_book=QUOTES_PER_BOOK, seed=seed)
+        record("build_the_collection", cli.build_the_collection)
+        # the search index is built by the first search, the queries are timed apart
+        record("search_index_build", lambda: cli.SearchIndex(cli.The_Collection, cli.Quote_Store))
+        cli.Search_Index = None
+        cli.get_search_index()
+        record("search", search)
+        record("search_first_screen", search_first_screen)
+        record("similar_quotes", similar_quotes)
+        record("statistics_word_counts", word_counts)
+        record("quote_distribution", distribution)
+        record("random_until_exhausted", random_sampling)
+        record("list_by_property", list_sorting)
+    return {"books": books, "quotes": quotes, "phases": results}
+
+##################################################
+# FUNCTION: compare the quote memory with the object layout
+##################################################
+def run_quote_memory(cli, quote_count, seed):
+    """
+    Generate a library of about quote_count quotes and return the memory
+    held by the collection and by its quotes: the columns of the store
+    against the per-quote objects, without the texts, which both share.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        cli.LIBRARY_FILE = os.path.join(directory, "library.json")
+        books, quotes = generate_library(cli.LIBRARY_FILE, books=max(1, quote_count // QUOTES_PER_BOOK),
+                                         quotes_per_book=QUOTES_PER_BOOK, seed=seed)
+        tracemalloc.start()
+        with redirect_stdout(io.StringIO()):
+            cli.build_the_collection()
+        collection_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    store = cli.Quote_Store
+    store_bytes = sum(sys.getsizeof(column) for column in (store.texts, store.pages, store.insert_times,
+                                                           store.lengths, store.book_ids))
+    tracemalloc.start()
+    book_quotes = []
+    for book in cli.The_Collection:
+        start, end = book.get_quote_range()
+        book_quotes.append(([ObjectQuote(store.texts[i], store.pages[i]) for i in range(start, start + book.long_q_count)],
+                            [ObjectQuote(store.texts[i], store.pages[i]) for i in range(start + book.long_q_count, end)]))
+    object_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del book_quotes
+
+    count = len(store) or 1
+    return {"books": books, "quotes": quotes, "collection_bytes": collection_bytes,
+            "store_bytes": store_bytes, "object_bytes": object_bytes,
+            "store_bytes_per_quote": round(store_bytes / count, 1),
+            "object_bytes_per_quote": round(object_bytes / count, 1)}
+
+##################################################
+# FUNCTION: print results, compared to older ones
+##################################################
+def print_results(results, baseline=None):
+    memory = results.get("quote_memory")
+    if memory:
+        print(f"\nQuote memory, {memory['quotes']} quotes in {memory['books']} books:")
+        print(f"  collection after the build {memory['collection_bytes'] / (1 << 20):9.1f} MiB")
+        print(f"  quotes without the texts: QuoteStore {memory['store_bytes'] / (1 << 20):.1f} MiB "
+              f"({memory['store_bytes_per_quote']} bytes per quote), Quote objects "
+              f"{memory['object_bytes'] / (1 << 20):.1f} MiB ({memory['object_bytes_per_quote']} bytes per quote)")
+    for scale, scale_results in results["scales"].items():
+        print(f"\n{scale} quotes (generated: {scale_results['books']} books, {scale_results['quotes']} quotes)")
+        old_phases = (baseline or {}).get("scales", {}).get(scale, {}).get("phases", {})
+        for phase, values in scale_results["phases"].items():
+            line = f"  {phase:24s} {values['seconds'] * 1000:10.1f} ms {values['peak_bytes'] / (1 << 20):9.1f} MiB"
+            if phase in old_phases and old_phases[phase]["seconds"] > 0:
+                ratio = values["seconds"] / old_phases[phase]["seconds"]
+                line += f"   x{ratio:.2f} time vs baseline"
+            print(line)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark readera-collection-cli.py on synthetic libraries")
+    arg_parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000], metavar="QUOTES")
+    arg_parser.add_argument("--output", default="benchmark-results.json")
+    arg_parser.add_argument("--compare", metavar="JSON", help="results of another version to compare with")
+    arg_parser.add_argument("--memory-quotes", type=int, default=MEMORY_QUOTES, metavar="QUOTES",
+                            help="library size of the quote memory case, 0 to skip it")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    cli = load_script(SCRIPT_PATH)
+    results = {
+        "script": os.path.abspath(SCRIPT_PATH),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "numpy": cli.np is not None,
+        "scales": {}
+        }
+    if args.memory_quotes:
+        results["quote_memory"] = run_quote_memory(cli, args.memory_quotes, args.seed)
+    for scale in args.scales:
+        results["scales"][str(scale)] = run_scale(cli, scale, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf8") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    with open(args.output, "w", encoding="utf8") as file:
+        json.dump(results, file, indent=2)
+    print(f"\nResults saved to {args.output}")
@@ -1,23 +1,176 @@
 ##################################################
 # IMPORT
 ##################################################
+import argparse
+import atexit
+import builtins
+import contextlib
+import cProfile
 import datetime
+import hashlib
+import heapq
+import io
 import json
+import math
 import os
+import pickle
 import random
 import re
+import shlex
+import signal
+import sqlite3
+import struct
 import sys
 import textwrap
+import threading
 import time
+import tracemalloc
+import zipfile
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import compress, groupby, repeat
+from operator import add, and_, ge, truediv
+
+# optional, only used to speed up the quote distribution
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 ##################################################
 # CLASSES
 ##################################################
+class QuoteStore:
+    """
+    Columnar storage of every quote. The texts are in one list, pages,
+    insert times, text lengths and book positions in typed arrays. The
+    quotes of a book are a contiguous range: its long quotes, then its
+    short quotes, so the store follows get_all_quotes_list() order.
+    """
+    __slots__ = ("texts", "pages", "insert_times", "lengths", "book_ids")
+
+    def __init__(self):
+        self.texts = []
+        self.pages = array('i')
+        self.insert_times = array('q')
+        self.lengths = array('I')
+        self.book_ids = array('I')
+
+    def add_quotes(self, quotes, book_id=0):
+        """
+        Append (text, page, insert time) tuples, return the position of the first one.
+        """
+        start = len(self.texts)
+        for text, page, insert_time in quotes:
+            self.texts.append(text)
+            self.pages.append(page)
+            self.insert_times.append(insert_time)
+            self.lengths.append(len(text))
+        self.book_ids.extend([book_id] * (len(self.texts) - start))
+        return start
+
+    def reorder(self, books):
+        """
+        Rewrite the columns in the order of the books, a book position
+        becomes its book id, so a quote position is its quote id too.
+        The quotes are copied from the store of each book, so books of
+        other stores are moved into this one, and the pending quotes of
+        a book without a store are added.
+        """
+        texts, pages, insert_times, lengths, book_ids = [], array('i'), array('q'), array('I'), array('I')
+        for position, book in enumerate(books):
+            if book.pending_quotes is not None:
+                quotes, book.pending_quotes = book.pending_quotes, None
+                book.store, book.q_start = self, len(texts)
+                if quotes:
+                    book_texts, book_pages, book_insert_times = zip(*quotes)
+                    texts += book_texts
+                    pages.extend(book_pages)
+                    insert_times.extend(book_insert_times)
+                    lengths.extend(map(len, book_texts))
+                    book_ids.extend([position] * len(quotes))
+                continue
+            store, start, end = book.store or self, book.q_start, book.q_start + book.total_q
+            book.store, book.q_start = self, len(texts)
+            texts += store.texts[start:end]
+            pages += store.pages[start:end]
+            insert_times += store.insert_times[start:end]
+            lengths += store.lengths[start:end]
+            book_ids.extend([position] * (end - start))
+        self.texts, self.pages, self.insert_times, self.lengths, self.book_ids = texts, pages, insert_times, lengths, book_ids
+
+    def __len__(self):
+        return len(self.texts)
+
+class LazyQuoteTexts:
+    """
+    Quote texts of a QuoteStore restored from the snapshot. The texts of
+    every book stay one pickled block until one of them is first read,
+    so a start only pays for the books that are actually used.
+    """
+    def __init__(self, blocks, starts):
+        # blocks[b] holds the texts from starts[b] to starts[b + 1], None once loaded
+        self.blocks = blocks
+        self.starts = starts
+        self.texts = [None] * starts[-1]
+
+    def _load_range(self, start, stop):
+        book = bisect_right(self.starts, start) - 1
+        while book < len(self.blocks) and self.starts[book] < stop:
+            block = self.blocks[book]
+            if block is not None:
+                self.texts[self.starts[book]:self.starts[book + 1]] = pickle.loads(block)
+                self.blocks[book] = None
+            book += 1
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self.texts))
+            if start < stop:
+                self._load_range(start, stop)
+            return self.texts[key]
+        text = self.texts[key]
+        if text is None:
+            if key < 0:
+                key += len(self.texts)
+            self._load_range(key, key + 1)
+            text = self.texts[key]
+        return text
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        self._load_range(0, len(self.texts))
+        return iter(self.texts)
+
+    def __sizeof__(self):
+        # the list slots and the blocks still waiting to be loaded
+        return sys.getsizeof(self.texts) + sum(sys.getsizeof(block) for block in self.blocks if block is not None)
+
 class Quote:
-    def __init__(self, text, page_number):
-        self.text = text
-        self.page = page_number
+    """
+    View of a quote in the QuoteStore, only the store and the position are held.
+    """
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def text(self):
+        return self.store.texts[self.index]
+
+    @property
+    def page(self):
+        return self.store.pages[self.index]
+
+    @property
+    def insert_time(self):
+        return self.store.insert_times[self.index]
 
     ##################################################
     # string representation
@@ -26,6 +179,11 @@ class Quote:
         return f"Quote(text={self.text}, page_number={self.page})"
 
 class Book:
+    __slots__ = ("title", "author", "folder", "file_id", "annotation", "pages_count", "published_date",
+                 "file_modified_time", "have_read_time", "activity_time", "q_per_page", "store", "q_start",
+                 "long_q_count", "total_short_q", "first_q_date", "last_q_date", "rating", "ratings_count",
+                 "pending_quotes")
+
     def __init__(self, title):
         self.title = title
         self.author = ""
@@ -38,43 +196,52 @@ class Book:
         self.have_read_time = 0
         self.activity_time = 0
         self.q_per_page = 0.0
-        self.quotes = []
-        self.short_quotes = []
-        self.selected_set = set()
+        self.store = None
+        self.q_start = 0
+        self.long_q_count = 0
+        self.total_short_q = 0
         self.first_q_date = 0
         self.last_q_date = 0
         self.rating = 0.0
         self.ratings_count = 0.0
+        self.pending_quotes = None
 
-    def add_quote(self, text, page_number, is_long=False):
-        quote = Quote(text, page_number)
-        if is_long:
-            self.quotes.append(quote)
+    def set_quotes(self, store, quotes, book_id=0):
+        # quotes: (text, page, insert time), the long ones go first, without
+        # a store they wait in pending_quotes until QuoteStore.reorder() adds them
+        long_quotes = [quote for quote in quotes if len(quote[0]) > MAX_CHAR_IN_SHORT_QUOTE]
+        short_quotes = [quote for quote in quotes if len(quote[0]) <= MAX_CHAR_IN_SHORT_QUOTE]
+        if store is None:
+            self.pending_quotes = long_quotes + short_quotes
         else:
-            self.short_quotes.append(quote)
+            self.store = store
+            self.q_start = store.add_quotes(long_quotes + short_quotes, book_id)
+        self.long_q_count = len(long_quotes)
+        self.total_short_q = len(short_quotes)
 
-    def get_all_quotes_list(self):
-        return self.quotes + self.short_quotes
+    @property
+    def quotes(self):
+        return [Quote(self.store, i) for i in range(self.q_start, self.q_start + self.long_q_count)]
 
-    def get_random_q(self):
-        all_q = self.get_all_quotes_list()
-        return self._rnd_q(all_q)
+    @property
+    def short_quotes(self):
+        start = self.q_start + self.long_q_count
+        return [Quote(self.store, i) for i in range(start, start + self.total_short_q)]
+
+    def get_all_quotes_list(self):
+        return [Quote(self.store, i) for i in range(self.q_start, self.q_start + self.total_q)]
 
-    def get_random_short_q(self):
-        return self._rnd_q(self.short_quotes)
+    def get_quote_range(self):
+        return self.q_start, self.q_start + self.total_q
 
-    def _rnd_q(self, quotes_list):
-        quotes_left = 0
-        random_quote = None
-        unselected_quotes = [q for q in quotes_list if q not in self.selected_set]
-        if unselected_quotes:
-            random_quote = random.choice(unselected_quotes)
-            self.selected_set.add(random_quote)
-            quotes_left = len(unselected_quotes) - 1
-        return random_quote, quotes_left
+    def get_quote_texts(self):
+        return self.store.texts[self.q_start:self.q_start + self.total_q]
 
-    def clear_selected_set(self):
-        self.selected_set.clear()
+    def get_quote(self, index, short_only=False):
+        # index follows the order of get_all_quotes_list() or of short_quotes
+        if short_only:
+            index += self.long_q_count
+        return Quote(self.store, self.q_start + index)
 
     ##################################################
     # @property decorator is used to define a method
@@ -82,17 +249,1363 @@ class Book:
     ##################################################
     @property
     def total_q(self):
-        return (len(self.quotes) + len(self.short_quotes))
-
-    @property
-    def total_short_q(self):
-        return len(self.short_quotes)
+        return self.long_q_count + self.total_short_q
 
     ##################################################
     # string representation
     ##################################################
     def __repr__(self):
-        return f"Book(title={self.title}, quotes={len(self.quotes)})"
+        return f"Book(title={self.title}, quotes={self.long_q_count})"
+
+class QuotePool:
+    """
+    Without-replacement pool, a draw swaps a random item with the
+    last one and pops it, so every draw is O(1).
+    """
+    def __init__(self, items):
+        self.items = list(items)
+
+    def draw(self):
+        items = self.items
+        i = random.randrange(len(items))
+        items[i], items[-1] = items[-1], items[i]
+        return items.pop()
+
+    def __len__(self):
+        return len(self.items)
+
+class OrderedQuotePool(QuotePool):
+    """
+    Without-replacement pool drawing the items of the lowest key first,
+    the items of the same key in random order. The items are sorted once,
+    a draw pops the last one.
+    """
+    def __init__(self, items, key):
+        self.items = sorted(items, key=lambda item: (key(item), random.random()), reverse=True)
+
+    def draw(self):
+        return self.items.pop()
+
+class QuoteSampler:
+    """
+    Random quotes without replacement from a list of books. In "quotes"
+    mode every remaining quote has the same chance, in "books" mode a
+    random book is chosen first (like the original behavior). With a
+    preference ("unseen" or "least-recent") and the last shown time of
+    every quote id (0 if never shown), the quotes never shown or shown
+    the longest ago come first, drawn like in "quotes" mode.
+    """
+    def __init__(self, books, length, mode="quotes", prefer="any", last_shown=None):
+        self.books = books
+        self.short_only = length == "Short only"
+        self.prefer = prefer if last_shown is not None else "any"
+        self.mode = mode if self.prefer == "any" else "quotes"
+        self.quotes_left = [getattr(book, LENGTH_TO_ATTR[length]) for book in books]
+        if self.mode == "quotes":
+            # a quote is encoded as a single int: book number + books count * quote index
+            n = len(books)
+            codes = (b + n * i for b, count in enumerate(self.quotes_left) for i in range(count))
+            if self.prefer == "any":
+                self.pool = QuotePool(codes)
+            else:
+                def get_last_shown(code):
+                    return last_shown[books[code % n].get_quote(code // n, self.short_only).index]
+                if self.prefer == "unseen":
+                    self.pool = OrderedQuotePool(codes, key=lambda code: get_last_shown(code) > 0)
+                else:
+                    self.pool = OrderedQuotePool(codes, key=get_last_shown)
+        else:
+            self.pool = QuotePool(b for b, count in enumerate(self.quotes_left) if count > 0)
+            # the quote pools of the books drawn so far, every sampler has its own
+            self.book_pools = {}
+
+    @property
+    def total_left(self):
+        return sum(self.quotes_left)
+
+    def draw(self):
+        """
+        Return (book, quote, quotes left in that book) or None if every quote was drawn.
+        """
+        if not self.pool:
+            return None
+        if self.mode == "quotes":
+            code = self.pool.draw()
+            b, index = code % len(self.books), code // len(self.books)
+            self.quotes_left[b] -= 1
+            book = self.books[b]
+            return book, book.get_quote(index, self.short_only), self.quotes_left[b]
+
+        # the book stays in the pool until its own pool runs out
+        items = self.pool.items
+        slot = random.randrange(len(items))
+        b = items[slot]
+        book_pool = self.book_pools.get(b)
+        if book_pool is None:
+            book_pool = self.book_pools[b] = QuotePool(range(self.quotes_left[b]))
+        index = book_pool.draw()
+        self.quotes_left[b] = len(book_pool)
+        if not book_pool:
+            items[slot], items[-1] = items[-1], items[slot]
+            items.pop()
+            del self.book_pools[b]
+        book = self.books[b]
+        return book, book.get_quote(index, self.short_only), self.quotes_left[b]
+
+class SeenQuotes:
+    """
+    Persistent history of the shown quotes (library.json.seen). A quote is
+    known by a stable id, a 64-bit hash of its doc uri and insert time,
+    the file holds the sorted ids and the last shown times (in seconds)
+    as two arrays: 12 bytes per shown quote. The last shown time of the
+    loaded quotes is kept by quote id, so a lookup is O(1).
+    """
+    def __init__(self, books, store, state=None):
+        ids, times = state or (array('Q'), array('I'))
+        stored = dict(zip(ids, times))
+        self.last_shown = array('I', [0]) * len(store)
+        if stored:
+            for book in books:
+                start, end = book.get_quote_range()
+                for quote_id, insert_time in enumerate(store.insert_times[start:end], start):
+                    self.last_shown[quote_id] = stored.get(get_stable_quote_id(book.file_id, insert_time), 0)
+        # {stable id: time} shown in this session, not saved yet
+        self.shown = {}
+
+    def record(self, book, quote):
+        now = int(time.time())
+        self.last_shown[quote.index] = now
+        self.shown[get_stable_quote_id(book.file_id, quote.insert_time)] = now
+
+    def merge_into(self, state):
+        """
+        Return the state (ids, times) with the quotes shown since the last
+        call added, the file may have been saved by another session since.
+        """
+        merged = dict(zip(*state)) if state else {}
+        for stable_id, shown_time in self.shown.items():
+            merged[stable_id] = max(shown_time, merged.get(stable_id, 0))
+        self.shown = {}
+        ids = array('Q', sorted(merged))
+        return ids, array('I', (merged[stable_id] for stable_id in ids))
+
+class CollectionIndex:
+    """
+    Inverted maps over The Collection, built once after loading. Every map
+    holds book positions (list index in The Collection) in ascending order,
+    so a filter costs as much as its smallest matching list.
+    """
+    def __init__(self, books, folders):
+        self.books = books
+        self.folder_of_file = {}
+        self.by_author = {}
+        self.by_folder = {}
+        self.by_century = {}
+        self.have_read = []
+        self.reading_now = []
+        self.with_quotes = []
+        self.with_annotation = []
+        self._sets = {}
+        self._sort_ranks = {}
+
+        # the first folder containing the book wins, like in the folder order
+        for folder, ids in folders.items():
+            for file_id in ids:
+                self.folder_of_file.setdefault(file_id, folder)
+
+        for position, book in enumerate(books):
+            book.folder = self.folder_of_file.get(book.file_id, "")
+            self.by_author.setdefault(book.author, []).append(position)
+            if book.folder in folders:
+                self.by_folder.setdefault(book.folder, []).append(position)
+            if book.published_date != 0:
+                # same bounds as the century filter: (c - 1) * 100 <= date < c * 100
+                self.by_century.setdefault(book.published_date // 100 + 1, []).append(position)
+            if book.have_read_time.year > 1970:
+                self.have_read.append(position)
+            if book.activity_time != 0 and book.have_read_time.year == 1970:
+                self.reading_now.append(position)
+            if book.total_q > 0:
+                self.with_quotes.append(position)
+            if book.annotation:
+                self.with_annotation.append(position)
+
+    def get_books(self, positions):
+        return [self.books[position] for position in positions]
+
+    def select(self, author=None, folder=None, century=None, with_quotes=False, positions=None):
+        """
+        Return the positions matching every given filter, the smallest
+        list is scanned and checked against the sets of the others.
+        """
+        lists = []
+        if author is not None:
+            lists.append(("author", author, self.by_author.get(author, [])))
+        if folder is not None:
+            lists.append(("folder", folder, self.by_folder.get(folder, [])))
+        if century is not None:
+            lists.append(("century", century, self.by_century.get(century, [])))
+        if with_quotes:
+            lists.append(("with_quotes", None, self.with_quotes))
+        if positions is not None:
+            lists.append((None, None, positions))
+        if not lists:
+            return list(range(len(self.books)))
+
+        lists.sort(key=lambda item: len(item[2]))
+        smallest = lists[0][2]
+        others = [self._get_set(name, key, matches) for name, key, matches in lists[1:]]
+        return [position for position in smallest if all(position in other for other in others)]
+
+    def has_sort_order(self, name):
+        return name in self._sort_ranks
+
+    def sort_positions(self, positions, name, key, reverse=False):
+        """
+        Return the positions in the order of sorted(..., key, reverse), using
+        the rank of every book in the whole Collection sorted once per name.
+        """
+        ranks = self._sort_ranks.get(name)
+        if ranks is None:
+            books = self.books
+            order = sorted(range(len(books)), key=lambda position: key(books[position]), reverse=reverse)
+            ranks = self._sort_ranks[name] = array('I', bytes(4 * len(order)))
+            for rank, position in enumerate(order):
+                ranks[position] = rank
+        # the ranks keep the stable order of sorted(), as the positions are ascending
+        return sorted(positions, key=ranks.__getitem__)
+
+    def _get_set(self, name, key, matches):
+        # sets of the maps are created on first use and kept for the session
+        if name is None:
+            return set(matches)
+        if (name, key) not in self._sets:
+            self._sets[(name, key)] = set(matches)
+        return self._sets[(name, key)]
+
+class SearchIndex:
+    """
+    Token-level inverted index over every quote of The Collection. A quote
+    id is the position of the quote in the QuoteStore (books in collection
+    order, quotes in get_all_quotes_list() order), a posting holds the ascending ids of
+    the quotes containing a token and the token count in each of them.
+    """
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+
+    def __init__(self, books, store, state=None):
+        self.books = books
+        self.store = store
+        if state:
+            self.quote_lengths, self.postings, self.vocabulary = state
+        else:
+            self._build()
+
+        # words of the titles, authors and annotations point to book positions
+        self.book_postings = {}
+        for position, book in enumerate(books):
+            for token in set(tokenize(get_book_text(book))):
+                self.book_postings.setdefault(token, []).append(position)
+
+        # BM25 length normalization of every quote
+        k1, b = self.BM25_K1, self.BM25_B
+        average_length = (sum(self.quote_lengths) / len(self.quote_lengths)) if self.quote_lengths else 0.0
+        self.quote_norms = array('d', (k1 * (1 - b + b * length / (average_length or 1.0)) for length in self.quote_lengths))
+        # BM25 weights of the searched tokens, aligned with their postings,
+        # and the positions of the postings in descending weight order
+        self.token_weights = {}
+        self.token_orders = {}
+
+    def _build(self):
+        self.quote_lengths = array('I')
+        self.postings = {}
+        for quote_id, text in enumerate(self.store.texts):
+            tokens = tokenize(text)
+            self.quote_lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = (array('I'), array('I'))
+                posting[0].append(quote_id)
+                posting[1].append(count)
+
+        # the sorted vocabulary serves prefix queries
+        self.vocabulary = sorted(self.postings)
+
+    def get_state(self):
+        return self.quote_lengths, self.postings, self.vocabulary
+
+    def get_quote(self, quote_id):
+        return self.books[self.store.book_ids[quote_id]], Quote(self.store, quote_id)
+
+    def search(self, query):
+        """
+        Return the matching quotes with their BM25 scores as LazyRankedQuotes,
+        which are scored and sorted only as far as they are read.
+        """
+        alternatives = parse_search_query(query)
+        if len(alternatives) == 1 and len(alternatives[0]) == 1 and alternatives[0][0][0] == "word":
+            # a single word: its posting holds the matches, no set is made
+            token = alternatives[0][0][1][0]
+            posting = self.postings.get(token)
+            if not posting:
+                return RankedQuotes([], [])
+            return LazyRankedQuotes(self, None, [(token, posting)])
+
+        match_sets = []
+        score_tokens = set()
+        for terms in alternatives:
+            match_sets.append(self._match_all(terms))
+            for kind, tokens in terms:
+                score_tokens.update(self._expand_term(kind, tokens))
+        matches = match_sets[0] if len(match_sets) == 1 else set().union(*match_sets)
+
+        # the tokens are added in a fixed order so the sums do not depend on the run
+        postings = ((token, self.postings.get(token)) for token in sorted(score_tokens))
+        return LazyRankedQuotes(self, matches, [(token, posting) for token, posting in postings if posting])
+
+    def _match_all(self, terms):
+        # intersect the terms starting from the rarest one
+        # every term set is a new set, the rarest one becomes the result
+        term_sets = sorted((self._match_term(kind, tokens) for kind, tokens in terms), key=len)
+        result = term_sets[0]
+        for term_set in term_sets[1:]:
+            if not result:
+                break
+            result.intersection_update(term_set)
+        return result
+
+    def _match_term(self, kind, tokens):
+        if kind == "word":
+            return set(self.postings.get(tokens[0], ((), ()))[0])
+        if kind in ("prefix", "fuzzy"):
+            result = set()
+            for token in self._expand_term(kind, tokens):
+                result.update(self.postings.get(token, ((), ()))[0])
+            return result
+
+        # phrase: quotes containing every token, verified on the lowercase text,
+        # the tokens must follow each other separated by non-word characters only
+        candidates = self._match_all([("word", [token]) for token in tokens])
+        phrase = r"\W+".join(re.escape(token) for token in tokens) + r"(?!\w)"
+        pattern, word_start_pattern = re.compile(phrase), re.compile(r"(?<!\w)" + phrase)
+        return {quote_id for quote_id in candidates
+                if self._contains_phrase(pattern, word_start_pattern, self.store.texts[quote_id].lower())}
+
+    @staticmethod
+    def _contains_phrase(pattern, word_start_pattern, text):
+        # a pattern starting with a literal is searched much faster than one
+        # starting with the lookbehind, which is only checked at the found places
+        match = pattern.search(text)
+        while match:
+            if word_start_pattern.match(text, match.start()):
+                return True
+            match = pattern.search(text, match.start() + 1)
+        return False
+
+    def _expand_term(self, kind, tokens):
+        if kind == "prefix":
+            return self._expand_prefix(tokens[0])
+        if kind == "fuzzy":
+            return [word for word in get_similar_words(tokens[0]) if word in self.postings]
+        return tokens
+
+    def _expand_prefix(self, prefix):
+        i = bisect_left(self.vocabulary, prefix)
+        expanded = []
+        while i < len(self.vocabulary) and self.vocabulary[i].startswith(prefix):
+            expanded.append(self.vocabulary[i])
+            i += 1
+        return expanded
+
+    def get_token_weights(self, token, posting):
+        """
+        Return the BM25 weights of a token in the quotes of its posting,
+        idf * (k1 + 1) * count / (count + norm). They are computed once per
+        token, the long postings of common words are not walked again.
+        """
+        weights = self.token_weights.get(token)
+        if weights is None:
+            token_ids, counts = posting
+            n = len(self.quote_lengths)
+            idf = math.log(1 + (n - len(token_ids) + 0.5) / (len(token_ids) + 0.5))
+            norms = map(self.quote_norms.__getitem__, token_ids)
+            weights = self.token_weights[token] = array('d', map((idf * (self.BM25_K1 + 1)).__mul__,
+                                                                 map(truediv, counts, map(add, counts, norms))))
+        return weights
+
+    def get_token_order(self, token, posting):
+        # positions in the posting by descending weight, ties in quote id order
+        order = self.token_orders.get(token)
+        if order is None:
+            weights = self.get_token_weights(token, posting)
+            order = self.token_orders[token] = array('I', sorted(range(len(weights)), key=weights.__getitem__,
+                                                                 reverse=True))
+        return order
+
+    def prepare_common_tokens(self, min_quotes):
+        # the weights and orders of the tokens found in at least min_quotes quotes
+        for token, quote_ids, counts in self.iter_postings():
+            if len(quote_ids) >= min_quotes:
+                self.get_token_order(token, (quote_ids, counts))
+
+    def _find_bm25_weights(self, token, posting, quote_ids, matches):
+        # (quote ids, weights) of the token in the matches, quote_ids are the sorted matches
+        token_ids = posting[0]
+        weights = self.get_token_weights(token, posting)
+
+        # the matched quotes of the posting: looked up one by one if they are
+        # few, otherwise the posting is filtered (map and compress run in C)
+        if len(token_ids) <= len(quote_ids) and matches.issuperset(token_ids):
+            # every quote of the posting matched (always the case with OR)
+            found_ids, found_weights = token_ids, weights
+        elif len(quote_ids) * SEARCH_LOOKUP_RATIO < len(token_ids):
+            found_ids, found_weights = [], []
+            for quote_id in quote_ids:
+                i = bisect_left(token_ids, quote_id)
+                if i < len(token_ids) and token_ids[i] == quote_id:
+                    found_ids.append(quote_id)
+                    found_weights.append(weights[i])
+        else:
+            is_match = list(map(matches.__contains__, token_ids))
+            found_ids = list(compress(token_ids, is_match))
+            found_weights = list(compress(weights, is_match))
+        return found_ids, found_weights
+
+    def iter_postings(self):
+        # (token, quote ids, token counts) of every token
+        return ((token, quote_ids, counts) for token, (quote_ids, counts) in self.postings.items())
+
+class RankedQuotes:
+    """
+    (quote_id, score) pairs of the matches of a search in descending score
+    order, ties in quote id order. The first pairs are taken with
+    heapq.nlargest, every match is only sorted when more are read, so the
+    first screen of results does not wait for the sort.
+    """
+    def __init__(self, quote_ids, scores):
+        # quote_ids are sorted, scores[i] is the score of quote_ids[i]
+        self.quote_ids = quote_ids
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.quote_ids)
+
+    def __iter__(self):
+        # both orders are the stable sort by descending score, the sorted
+        # one starts with the first pairs
+        first = self.get_first_results()
+        yield from first
+        if len(first) < len(self):
+            scores = self.scores
+            ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+            for i in ranked[len(first):]:
+                yield self.quote_ids[i], scores[i]
+
+    def get_first_results(self):
+        # the first pairs: a heap of the plain scores finds the smallest of
+        # them, the scores from it up are sorted
+        scores = self.scores
+        first = heapq.nlargest(SEARCH_FIRST_RESULTS, scores)
+        if not first:
+            return []
+        positions = compress(range(len(scores)), map(ge, scores, repeat(first[-1])))
+        ranked = sorted(positions, key=scores.__getitem__, reverse=True)[:SEARCH_FIRST_RESULTS]
+        return [(self.quote_ids[i], scores[i]) for i in ranked]
+
+    def get_book_scores(self, start, end):
+        # (quote_id, score) pairs of the matches in the quote id range
+        i, j = bisect_left(self.quote_ids, start), bisect_left(self.quote_ids, end)
+        return zip(self.quote_ids[i:j], self.scores[i:j])
+
+class LazyRankedQuotes(RankedQuotes):
+    """
+    RankedQuotes of a search, scored only as far as they are read. The
+    first pairs are found with the threshold algorithm: the postings of
+    the scored tokens are read together in descending weight order, every
+    quote met is scored, and the reading stops as soon as no quote not met
+    yet can score above the last of the first pairs. The long postings of
+    common words are only read at their start. Every match is scored when
+    more pairs are read, or when the quotes met would take more lookups
+    than 1 / SEARCH_THRESHOLD_RATIO of the posting entries.
+    """
+    def __init__(self, search_index, matches, postings):
+        # matches is the set of matched quote ids, None for every quote of
+        # a single posting, postings are (token, posting) pairs in token order
+        self.search_index = search_index
+        self.matches = matches
+        self.postings = postings
+        self._quote_ids = None
+        self._scores = None
+        self._weights = None
+
+    def __len__(self):
+        return len(self.postings[0][1][0]) if self.matches is None else len(self.matches)
+
+    @property
+    def quote_ids(self):
+        if self._quote_ids is None:
+            self._quote_ids = self.postings[0][1][0] if self.matches is None else sorted(self.matches)
+        return self._quote_ids
+
+    @property
+    def scores(self):
+        # the scores of every match, in the order of the sorted quote ids
+        if self._scores is None:
+            if self.matches is None:
+                token, posting = self.postings[0]
+                self._scores = list(self.search_index.get_token_weights(token, posting))
+            else:
+                quote_ids = self.quote_ids
+                scores = [0.0] * len(quote_ids)
+                position_of = None
+                for token, posting in self.postings:
+                    found_ids, found_weights = self.search_index._find_bm25_weights(token, posting, quote_ids,
+                                                                                    self.matches)
+                    if len(found_ids) == len(quote_ids):
+                        # the token is in every matched quote, the weights line up with the scores
+                        scores[:] = map(add, scores, found_weights)
+                    else:
+                        # only the found quotes are walked, the other matched quotes get no weight
+                        if position_of is None:
+                            position_of = dict(zip(quote_ids, range(len(quote_ids))))
+                        for position, weight in zip(map(position_of.__getitem__, found_ids), found_weights):
+                            scores[position] += weight
+                self._scores = scores
+        return self._scores
+
+    def get_score(self, quote_id):
+        # the tokens are added in the order of the scores, so the sums are the same
+        score = 0.0
+        for token_ids, weights in self._get_weights():
+            i = bisect_left(token_ids, quote_id)
+            if i < len(token_ids) and token_ids[i] == quote_id:
+                score += weights[i]
+        return score
+
+    def _get_weights(self):
+        # (quote ids, weights) of every posting
+        if self._weights is None:
+            self._weights = [(posting[0], self.search_index.get_token_weights(token, posting))
+                             for token, posting in self.postings]
+        return self._weights
+
+    def get_first_results(self):
+        if self._scores is None and len(self) > SEARCH_FIRST_RESULTS:
+            first = self._find_first_results()
+            if first is not None:
+                return first
+        return super().get_first_results()
+
+    def _find_first_results(self):
+        # None if the quotes met take too many lookups
+        lists = [(token_ids, weights, self.search_index.get_token_order(token, posting))
+                 for (token_ids, weights), (token, posting) in zip(self._get_weights(), self.postings)]
+        matches = self.matches
+        lookups = sum(len(token_ids) for token_ids, _, _ in lists) // SEARCH_THRESHOLD_RATIO
+        seen = set()
+        # (score, -quote_id) of the best quotes met, the smallest one first
+        best = []
+        longest = max(len(order) for _, _, order in lists)
+        for depth in range(longest):
+            # a quote not met yet has no larger weight than the ones read now
+            # in any posting, so its score is at most their sum
+            threshold = 0.0
+            for token_ids, weights, order in lists:
+                if depth < len(order):
+                    position = order[depth]
+                    threshold += weights[position]
+                    quote_id = token_ids[position]
+                    if quote_id not in seen:
+                        seen.add(quote_id)
+                        # a score looks the quote up in every posting
+                        lookups -= len(lists)
+                        if lookups < 0:
+                            return None
+                        if matches is None or quote_id in matches:
+                            item = (self.get_score(quote_id), -quote_id)
+                            if len(best) < SEARCH_FIRST_RESULTS:
+                                heapq.heappush(best, item)
+                            elif item > best[0]:
+                                heapq.heapreplace(best, item)
+            if len(best) == SEARCH_FIRST_RESULTS and best[0][0] > threshold:
+                break
+        return [(-negative_id, score) for score, negative_id in sorted(best, reverse=True)]
+
+    def get_book_scores(self, start, end):
+        if self._scores is not None:
+            return super().get_book_scores(start, end)
+        # only the matches of the book are scored
+        if self.matches is None:
+            token_ids = self.postings[0][1][0]
+            quote_ids = token_ids[bisect_left(token_ids, start):bisect_left(token_ids, end)]
+        else:
+            quote_ids = [quote_id for quote_id in range(start, end) if quote_id in self.matches]
+        return [(quote_id, self.get_score(quote_id)) for quote_id in quote_ids]
+
+class SearchGroups:
+    """
+    The matches of a search grouped per book as (book, quotes) pairs, books
+    ordered by their best scoring quote, quotes by their score. A group is
+    made when it is reached, output that stops after the first screens
+    does not group every match.
+    """
+    def __init__(self, search_index, ranked_quotes):
+        self.search_index = search_index
+        self.ranked_quotes = ranked_quotes
+
+    def __bool__(self):
+        return bool(self.ranked_quotes)
+
+    def __iter__(self):
+        store = self.search_index.store
+        grouped = set()
+        for quote_id, _ in self.ranked_quotes:
+            position = store.book_ids[quote_id]
+            if position in grouped:
+                continue
+            grouped.add(position)
+            book = self.search_index.books[position]
+            book_scores = sorted(self.ranked_quotes.get_book_scores(*book.get_quote_range()),
+                                 key=lambda item: (-item[1], item[0]))
+            yield book, [Quote(store, quote_id) for quote_id, _ in book_scores]
+
+class SimilarQuotes:
+    """
+    "More like this" over the postings of the search index: a quote is the
+    sparse TF-IDF vector of its tokens, (1 + log tf) * idf, compared by
+    cosine similarity. The idf of every token and the norm of every quote
+    are computed once from the postings. A lookup collects candidates from
+    the postings of the heaviest tokens of the query while they fit in a
+    budget, so the long postings of common words are not walked, then the
+    best candidates by partial similarity are scored exactly from their texts.
+    """
+    def __init__(self, search_index):
+        self.search_index = search_index
+        quote_count = len(search_index.quote_lengths)
+        self.idfs = {}
+        self.frequencies = {}
+        # a token missing from the index gets the largest idf
+        self.missing_idf = math.log(1 + quote_count) + 1
+        squares = [0.0] * quote_count
+        for token, quote_ids, counts in search_index.iter_postings():
+            self.frequencies[token] = len(quote_ids)
+            idf = self.idfs[token] = math.log((1 + quote_count) / (1 + len(quote_ids))) + 1
+            for quote_id, count in zip(quote_ids, counts):
+                weight = (1 + math.log(count)) * idf
+                squares[quote_id] += weight * weight
+        self.norms = array('d', map(math.sqrt, squares))
+
+    def get_vector(self, text):
+        # return {token: weight} and the norm of the vector
+        idfs, missing_idf = self.idfs, self.missing_idf
+        vector = {token: (1 + math.log(count)) * idfs.get(token, missing_idf)
+                  for token, count in Counter(tokenize(text)).items()}
+        return vector, math.sqrt(sum(weight * weight for weight in vector.values()))
+
+    def find(self, text, count, excluded=range(0)):
+        """
+        Return (quote_id, cosine similarity) pairs of the count quotes most
+        similar to text in descending order, ties in quote id order. Quote
+        ids in excluded (a range) are left out.
+        """
+        vector, norm = self.get_vector(text)
+        if not norm:
+            return []
+
+        # partial dot products over the rarest (heaviest) tokens first
+        scores = {}
+        budget = SIMILAR_POSTINGS_BUDGET
+        for token in sorted(vector, key=lambda token: (-vector[token], token)):
+            frequency = self.frequencies.get(token, 0)
+            if frequency > budget and scores:
+                continue
+            budget -= frequency
+            quote_ids, counts = self.search_index.postings.get(token, ((), ()))
+            weight = vector[token] * self.idfs.get(token, 0.0)
+            for quote_id, token_count in zip(quote_ids, counts):
+                scores[quote_id] = scores.get(quote_id, 0.0) + weight * (1 + math.log(token_count))
+        for quote_id in excluded:
+            scores.pop(quote_id, None)
+
+        # exact cosine of the best candidates by partial cosine
+        norms, texts, results = self.norms, self.search_index.store.texts, []
+        candidates = heapq.nlargest(max(SIMILAR_CANDIDATES, count), scores.items(), key=lambda item: item[1] / norms[item[0]])
+        for quote_id, _ in candidates:
+            candidate, candidate_norm = self.get_vector(texts[quote_id])
+            dot = sum(weight * candidate.get(token, 0.0) for token, weight in vector.items())
+            results.append((quote_id, dot / (norm * candidate_norm)))
+        return heapq.nsmallest(count, results, key=lambda item: (-item[1], item[0]))
+
+class QuoteHistogram:
+    """
+    Quote distribution along the pages, every quote adds its text length to
+    the column of its page, column i covers the pages in (res * i, res * (i + 1)].
+    Page / length arrays are made once per book, rendered diagrams are cached
+    per (book, width). NumPy is used for bucketing when it is available.
+    """
+    SPACE = "    "
+
+    def __init__(self):
+        self.arrays = {}
+        self.rendered = {}
+
+    def get_arrays(self, book):
+        key = id(book)
+        if key not in self.arrays:
+            start, end = book.get_quote_range()
+            self.arrays[key] = (book.store.pages[start:end], book.store.lengths[start:end])
+        return self.arrays[key]
+
+    def get_buckets(self, pages, lengths, max_page, columns):
+        res = max_page / columns
+        bounds = [res * (i + 1) for i in range(columns)]
+        if np is not None and len(pages) > 0:
+            page_array = np.asarray(pages, dtype=float)
+            indices = np.searchsorted(np.asarray(bounds), page_array, side='left')
+            mask = (page_array > 0) & (indices < columns)
+            buckets = np.bincount(indices[mask], weights=np.asarray(lengths, dtype=float)[mask], minlength=columns)
+            return [int(value) for value in buckets]
+
+        buckets = [0] * columns
+        for page, length in zip(pages, lengths):
+            # first column whose end is not before the page
+            i = bisect_left(bounds, page)
+            if page > 0 and i < columns:
+                buckets[i] += length
+        return buckets
+
+    def render_book(self, book, columns):
+        key = (id(book), columns)
+        if key not in self.rendered:
+            pages, lengths = self.get_arrays(book)
+            buckets = self.get_buckets(pages, lengths, book.pages_count, columns)
+            self.rendered[key] = self.render(buckets, "1", str(book.pages_count))
+        return self.rendered[key]
+
+    def render_group(self, books, columns):
+        """
+        Distribution of many books on a common axis, every page is
+        converted to the percent of its own book (0-100%).
+        """
+        key = (tuple(id(book) for book in books), columns)
+        if key not in self.rendered:
+            percents, lengths = [], []
+            for book in books:
+                if book.pages_count > 0:
+                    book_pages, book_lengths = self.get_arrays(book)
+                    percents.extend(page * 100 / book.pages_count for page in book_pages)
+                    lengths.extend(book_lengths)
+            buckets = self.get_buckets(percents, lengths, 100, columns)
+            self.rendered[key] = self.render(buckets, "0%", "100%")
+        return self.rendered[key]
+
+    def render(self, buckets, left_label, right_label):
+        # map the distribution from (0) to (rows)
+        columns = len(buckets)
+        rows = round(columns * 0.2)
+        old_min, old_max = min(buckets), max(buckets)
+        span = (old_max - old_min) or 1
+        mapped = [rows * (x - old_min) / span for x in buckets]
+
+        lines = [f"{self.SPACE}↑"]
+        # range is exclusive of the end value, so the compare value (rows - i) never
+        # reaches zero and a row full of '*' character is not printed
+        for i in range(rows):
+            lines.append(f"{self.SPACE}|{''.join('*' if value >= (rows - i) else ' ' for value in mapped)}")
+        lines.append(f"{self.SPACE}{'-' * columns}→")
+        lines.append(f"{self.SPACE}{left_label}{' ' * (columns - len(left_label) - len(right_label) + 2)}{right_label}")
+        return lines
+
+class WordStatistics:
+    """
+    Word counts of every quote collected in a single pass over The Collection:
+    total counts, counts per book and the book using each word the most.
+    Words shorter than 4 letters and the omitted words are not counted.
+    """
+    def __init__(self, books):
+        self.books = books
+        self.counts = Counter()
+        self.book_counts = []
+        self.top_books = {}
+
+        counts, top_books = self.counts, self.top_books
+        for position, book in enumerate(books):
+            text = ' '.join(book.get_quote_texts()).lower()
+            book_counts = Counter(WORD_PATTERN.findall(text))
+            for word in WORDS_TO_OMIT.intersection(book_counts):
+                del book_counts[word]
+            self.book_counts.append(book_counts)
+
+            # the first book with the highest count wins
+            for word, count in book_counts.items():
+                counts[word] += count
+                best = top_books.get(word)
+                if best is None or count > best[0]:
+                    top_books[word] = (count, position)
+
+    def get_top_book(self, word):
+        count, position = self.top_books.get(word, (0, None))
+        return count, (self.books[position] if position is not None else None)
+
+class HeavyHitters:
+    """
+    Approximate counts of the most frequent items of a stream in bounded
+    memory (a Misra-Gries summary). At most 2 * capacity counters are
+    kept, when there are more, the (capacity + 1)th largest count is
+    subtracted from every counter and the ones left at zero are dropped.
+    A count is never over the true count and at most error_bound (at most
+    items / (capacity + 1)) under it, so every item occurring more often
+    than error_bound times is kept.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.error_bound = 0
+
+    def update(self, items):
+        self.counts.update(items)
+        if len(self.counts) > 2 * self.capacity:
+            self.prune()
+
+    def prune(self):
+        threshold = heapq.nlargest(self.capacity + 1, self.counts.values())[-1]
+        self.counts = Counter({item: count - threshold for item, count in self.counts.items() if count > threshold})
+        self.error_bound += threshold
+
+    def most_common(self, count):
+        # the guaranteed (lower bound) counts, ties in item order
+        return heapq.nsmallest(count, self.counts.items(), key=lambda item: (-item[1], item[0]))
+
+class PhraseStatistics:
+    """
+    Most frequent phrases (word bigrams and trigrams) of the quotes of a
+    group of books, counted in a single pass into HeavyHitters summaries.
+    A phrase starts and ends with a word of the word statistics (at least
+    4 letters, not omitted) and does not cross punctuation.
+    """
+    def __init__(self, books, capacity):
+        self.summaries = {size: HeavyHitters(capacity) for size in PHRASE_SIZES}
+        counted_words = {}
+
+        for book in books:
+            # the quotes are joined with a break, phrases stay within a quote
+            text = ' . '.join(book.get_quote_texts()).lower()
+            for clause in PHRASE_BREAK_PATTERN.split(text):
+                words = PHRASE_WORD_PATTERN.findall(clause)
+                if len(words) < 2:
+                    continue
+                counted = [counted_words[word] if word in counted_words else
+                           counted_words.setdefault(word, len(word) >= 4 and word not in WORDS_TO_OMIT)
+                           for word in words]
+                for size, summary in self.summaries.items():
+                    # the phrases of size words whose first and last word are counted
+                    phrases = map(' '.join, zip(*(words[i:] for i in range(size))))
+                    summary.update(compress(phrases, map(and_, counted, counted[size - 1:])))
+
+    def get_top_phrases(self, size, count):
+        """
+        Return (phrase, count) tuples, the counts may be up to
+        get_error_bound(size) lower than the true counts.
+        """
+        return self.summaries[size].most_common(count)
+
+    def get_error_bound(self, size):
+        return self.summaries[size].error_bound
+
+class PhaseTimer:
+    """
+    Wall time and net allocations of named phases (--timings). The timed
+    functions are wrapped only when it is enabled, so the timing costs
+    nothing otherwise. Time spent waiting for input is left out.
+    Allocations are counted in memory blocks, and in bytes as well while
+    tracemalloc is tracing (--memory-dump).
+    """
+    def __init__(self, names=()):
+        # phases are reported in the order of names, then as they come
+        self.phases = {name: [0, 0.0, 0, 0] for name in names}
+        self.input_seconds = 0.0
+        self.action = None
+
+    def add(self, name, seconds, blocks, allocated):
+        entry = self.phases.setdefault(name, [0, 0.0, 0, 0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += blocks
+        entry[3] += allocated
+
+    def get_memory(self):
+        return sys.getallocatedblocks(), tracemalloc.get_traced_memory()[0]
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start, (blocks, memory) = time.perf_counter(), self.get_memory()
+        try:
+            yield
+        finally:
+            end_blocks, end_memory = self.get_memory()
+            self.add(name, time.perf_counter() - start, end_blocks - blocks, end_memory - memory)
+
+    def wrap(self, owner, attribute, name):
+        function = getattr(owner, attribute)
+
+        def timed_function(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        setattr(owner, attribute, timed_function)
+
+    def wrap_input(self, namespace):
+        # the module global shadows the builtin input() of every prompt
+        def timed_input(*args):
+            start = time.perf_counter()
+            try:
+                return builtins.input(*args)
+            finally:
+                self.input_seconds += time.perf_counter() - start
+        namespace["input"] = timed_input
+
+    def start_action(self, name):
+        self.stop_action()
+        self.action = (name, time.perf_counter(), self.input_seconds, self.get_memory())
+
+    def stop_action(self):
+        if self.action:
+            name, start, input_seconds, (blocks, memory) = self.action
+            end_blocks, end_memory = self.get_memory()
+            seconds = time.perf_counter() - start - (self.input_seconds - input_seconds)
+            self.add(name, seconds, end_blocks - blocks, end_memory - memory)
+            self.action = None
+
+    def report(self, file=None):
+        file = file or sys.stderr
+        self.stop_action()
+        tracing = tracemalloc.is_tracing()
+        file.write(f"\n{'phase':40s} {'calls':>8s} {'total ms':>11s} {'net blocks':>12s}"
+                   f"{' net MiB' if tracing else ''}\n")
+        for name, (calls, seconds, blocks, allocated) in self.phases.items():
+            if calls:
+                file.write(f"{name:40s} {calls:8d} {seconds * 1000:11.1f} {blocks:12d}"
+                           f"{f' {allocated / (1 << 20):8.2f}' if tracing else ''}\n")
+
+class TerminalOutput:
+    """
+    Buffered writer of the menu views. The terminal size is read once and
+    again only when the window is resized (SIGWINCH), quotes are wrapped
+    without building a TextWrapper per quote and the text is written in
+    large chunks. Inside paged() a long output stops after every screen,
+    'x' ends it early.
+    """
+    def __init__(self):
+        self.columns, self.lines = 90, 24
+        self.wrapper = textwrap.TextWrapper()
+        self.chunks = []
+        self.size = 0
+        # rows of a screen while paging, None otherwise
+        self.page_rows = None
+        self.rows_left = 0
+        self.stopped = False
+        self.refresh_size()
+
+    def refresh_size(self, *_):
+        try:
+            self.columns, self.lines = os.get_terminal_size()
+        except OSError:
+            self.columns = self.lines = 0
+        # Fallback to a default terminal size, some terminals report zero
+        self.columns, self.lines = self.columns or 90, self.lines or 24
+        self.wrapper.width = max(self.columns - 1, 1)
+
+    def watch_resize(self):
+        # not available on Windows, the size is then read only at the start
+        if hasattr(signal, "SIGWINCH"):
+            signal.signal(signal.SIGWINCH, self.refresh_size)
+
+    def wrap(self, text):
+        """
+        Same lines as TextWrapper.wrap(), texts without hyphens, tabs and
+        other special spaces are split at the spaces directly, which is
+        several times faster.
+        """
+        if WRAP_FALLBACK_PATTERN.search(text):
+            return self.wrapper.wrap(text)
+        text = text.translate(WRAP_WHITESPACE_TABLE)
+        if text[:1] == ' ':
+            # the TextWrapper keeps the spaces at the start of the first line
+            return self.wrapper.wrap(text)
+        width = self.wrapper.width
+        lines, start, size = [], 0, len(text)
+        while size - start > width:
+            # break at the last space that keeps the line within the width
+            end = start + width
+            if text[end] != ' ':
+                end = text.rfind(' ', start, end)
+                if end < 0:
+                    # long words are broken by the TextWrapper
+                    return self.wrapper.wrap(text)
+            line = text[start:end].rstrip(' ')
+            if line:
+                lines.append(line)
+            # spaces at the start of the next line are dropped
+            start = end
+            while start < size and text[start] == ' ':
+                start += 1
+        line = text[start:].rstrip(' ')
+        if line:
+            lines.append(line)
+        return lines
+
+    def write(self, text):
+        """
+        Buffer text, return False if the reader stopped the paged output.
+        """
+        if self.stopped:
+            return False
+        if self.page_rows:
+            rows = text.count('\n') + sum(len(line) // self.columns for line in text.split('\n'))
+            if rows > self.rows_left and self.rows_left < self.page_rows:
+                self.next_page()
+                if self.stopped:
+                    return False
+            self.rows_left -= rows
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size >= OUTPUT_CHUNK_SIZE:
+            self.flush()
+        return True
+
+    def print(self, *lines):
+        return self.write('\n'.join(lines) + '\n')
+
+    def print_wrapped(self, text, end='\n'):
+        return self.write('\n'.join(self.wrap(text)) + '\n' + end)
+
+    def flush(self):
+        if self.chunks:
+            sys.stdout.write(''.join(self.chunks))
+            self.chunks.clear()
+            self.size = 0
+
+    def next_page(self, prompt=" -- Enter: next page, x: stop -- "):
+        self.flush()
+        response = input(prompt)
+        self.stopped = bool(response) and response[0] == 'x'
+        self.rows_left = self.page_rows
+
+    @contextlib.contextmanager
+    def paged(self):
+        # only an interactive terminal is paged, piped output is written as is
+        if Paging_Enabled and sys.stdin.isatty() and sys.stdout.isatty():
+            self.page_rows = self.rows_left = max(self.lines - 1, 1)
+        self.stopped = False
+        try:
+            yield self
+        finally:
+            self.flush()
+            self.page_rows = None
+            self.stopped = False
+
+class TrigramIndex:
+    """
+    Character trigram index over a set of words. Every word is padded
+    as "$word$", so trigrams also mark the beginning and end of words.
+    """
+    def __init__(self, words):
+        self.words = sorted(words)
+        self.trigrams = {}
+        for word_id, word in enumerate(self.words):
+            for trigram in get_trigrams(f"${word}$"):
+                word_ids = self.trigrams.get(trigram)
+                if word_ids is None:
+                    word_ids = self.trigrams[trigram] = array('I')
+                word_ids.append(word_id)
+
+    def find_containing(self, piece, starts_word=False, ends_word=False):
+        """
+        Return the words containing the piece (starting / ending with it if
+        requested), or None if the piece is too short to use the index.
+        """
+        padded = f"{'$' if starts_word else ''}{piece}{'$' if ends_word else ''}"
+        trigrams = get_trigrams(padded)
+        if not trigrams:
+            return None
+        postings = sorted((self.trigrams.get(trigram, ()) for trigram in trigrams), key=len)
+        candidates = set(postings[0])
+        for word_ids in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(word_ids)
+        return [self.words[word_id] for word_id in sorted(candidates) if padded in f"${self.words[word_id]}$"]
+
+    def find_similar(self, word, max_distance):
+        """
+        Return the words within max_distance edits of the word, closest first.
+        Every edit destroys at most 3 trigrams, so a similar word shares at
+        least (trigrams of the word - 3 * max_distance) of them.
+        """
+        trigrams = get_trigrams(f"${word}$")
+        threshold = len(trigrams) - 3 * max_distance
+        if threshold > 0:
+            shared = Counter()
+            for trigram in trigrams:
+                shared.update(self.trigrams.get(trigram, ()))
+            candidates = [self.words[word_id] for word_id, count in shared.items() if count >= threshold]
+        else:
+            candidates = self.words
+
+        similar = []
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) <= max_distance:
+                distance = get_edit_distance(word, candidate, max_distance)
+                if distance <= max_distance:
+                    similar.append((distance, candidate))
+        return [candidate for _, candidate in sorted(similar)]
+
+class SqliteColumn:
+    """
+    Read-only sequence over a column of the quotes table, an index or a
+    slice is a single query on the quote id (the primary key).
+    """
+    def __init__(self, connection, column, length):
+        self.connection = connection
+        self.column = column
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            rows = self.connection.execute(f"SELECT {self.column} FROM quotes WHERE id >= ? AND id < ? ORDER BY id",
+                                           (start, stop))
+            values = [row[0] for row in rows]
+            return values[::step] if step != 1 else values
+        if key < 0:
+            key += self.length
+        row = self.connection.execute(f"SELECT {self.column} FROM quotes WHERE id = ?", (key,)).fetchone()
+        if row is None:
+            raise IndexError("quote id out of range")
+        return row[0]
+
+    def __iter__(self):
+        return (row[0] for row in self.connection.execute(f"SELECT {self.column} FROM quotes ORDER BY id"))
+
+class SqliteQuoteStore:
+    """
+    The QuoteStore interface over the quotes table of the database,
+    no quote is kept in memory.
+    """
+    __slots__ = ("texts", "pages", "insert_times", "lengths", "book_ids")
+
+    def __init__(self, connection):
+        length = connection.execute("SELECT count(*) FROM quotes").fetchone()[0]
+        self.texts = SqliteColumn(connection, "text", length)
+        self.pages = SqliteColumn(connection, "page", length)
+        self.insert_times = SqliteColumn(connection, "insert_time", length)
+        self.lengths = SqliteColumn(connection, "length", length)
+        self.book_ids = SqliteColumn(connection, "book_id", length)
+
+    def __len__(self):
+        return len(self.texts)
+
+class SqlitePostings:
+    """
+    Postings of the FTS5 index in the shape of SearchIndex.postings:
+    token -> (ascending quote ids, token counts in them).
+    """
+    def __init__(self, connection, vocabulary):
+        self.connection = connection
+        self.vocabulary = vocabulary
+
+    def get(self, token, default=None):
+        rows = self.connection.execute("SELECT doc, count(*) FROM quotes_instances WHERE term = ? "
+                                       "GROUP BY doc ORDER BY doc", (token,)).fetchall()
+        if not rows:
+            return default
+        return array('I', [row[0] for row in rows]), array('I', [row[1] for row in rows])
+
+    def __contains__(self, token):
+        i = bisect_left(self.vocabulary, token)
+        return i < len(self.vocabulary) and self.vocabulary[i] == token
+
+    def __iter__(self):
+        return iter(self.vocabulary)
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+class SqliteSearchIndex(SearchIndex):
+    """
+    SearchIndex answered by the FTS5 table of the database. The table holds
+    the tokens of every quote (as tokenize() makes them), so matching and
+    the BM25 scores are the same as the ones of the in-memory index.
+    """
+    def __init__(self, books, store, connection):
+        self.connection = connection
+        vocabulary = [row[0] for row in connection.execute("SELECT term FROM quotes_terms ORDER BY term")]
+        quote_lengths = array('I', [row[0] for row in connection.execute("SELECT tokens FROM quotes ORDER BY id")])
+        super().__init__(books, store, (quote_lengths, SqlitePostings(connection, vocabulary), vocabulary))
+
+    def _match_term(self, kind, tokens):
+        if kind != "phrase":
+            return super()._match_term(kind, tokens)
+        # the tokens are word characters only, FTS5 matches them as consecutive tokens
+        rows = self.connection.execute("SELECT rowid FROM quotes_fts WHERE quotes_fts MATCH ?",
+                                       ('"' + ' '.join(tokens) + '"',))
+        return {row[0] for row in rows}
+
+    def iter_postings(self):
+        rows = self.connection.execute("SELECT term, doc, count(*) FROM quotes_instances GROUP BY term, doc ORDER BY term, doc")
+        for token, token_rows in groupby(rows, key=lambda row: row[0]):
+            token_rows = list(token_rows)
+            yield token, array('I', [row[1] for row in token_rows]), array('I', [row[2] for row in token_rows])
+
+class JsonStreamReader:
+    """
+    Minimal incremental JSON reader for the top-level object of library.json,
+    values are decoded one at a time from a buffer that is refilled in chunks.
+    """
+    WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, file, chunk_size=None, keep_raw=False):
+        self.file = file
+        self.chunk_size = chunk_size or STREAM_CHUNK_SIZE
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        # with keep_raw the source text of the last value is kept in raw_value
+        self.keep_raw = keep_raw
+        self.raw_value = ""
+
+    def iter_object(self, streamed_keys=(), skip=None):
+        """
+        Yield (key, value) pairs of the top-level object, arrays under
+        streamed_keys are yielded element by element with the same key.
+        If skip(reader) consumed an element (see skip_value), its value
+        is yielded as None.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._decode_value()
+            self._expect(':')
+            if key in streamed_keys and self._peek() == '[':
+                self.pos += 1
+                if self._peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, None if skip and skip(self) else self._decode_value()
+                        if self._next_separator(']'):
+                            break
+            else:
+                yield key, self._decode_value()
+            if self._next_separator('}'):
+                return
+
+    def has_ahead(self, count):
+        # True if count more characters can be read after the whitespace
+        self._peek()
+        while len(self.buffer) - self.pos < count and self._fill(count):
+            pass
+        return len(self.buffer) - self.pos >= count
+
+    def take_elements(self, min_chars, find_start):
+        """
+        Consume whole elements of the array being read without decoding
+        them, at least min_chars characters: they end at the separator
+        before the element start that find_start(text, pos) finds after
+        them. Return their source text, None (nothing consumed) if there
+        is no such start before the end of the file.
+        """
+        self._peek()
+        while True:
+            if len(self.buffer) - self.pos > min_chars:
+                start = find_start(self.buffer, self.pos + min_chars)
+                if start is not None:
+                    break
+            # the start may be cut by the end of the buffer, at least double it
+            if not self._fill(max(min_chars, len(self.buffer) - self.pos)):
+                return None
+        end = self.buffer.rfind(',', self.pos, start)
+        if end <= self.pos:
+            raise json.JSONDecodeError("Expecting ','", self.buffer, start)
+        text = self.buffer[self.pos:end]
+        self.pos = end
+        return text
+
+    def skip_value(self, length, is_expected):
+        """
+        Consume the next value without decoding it if it is a known one:
+        the next length characters, accepted by is_expected(text) and
+        followed by a separator. Return False if nothing was consumed.
+        """
+        self._peek()
+        while len(self.buffer) - self.pos <= length and self._fill(length + 1):
+            pass
+        end = self.pos + length
+        if end >= len(self.buffer) or self.buffer[end] not in ",]} \t\n\r":
+            return False
+        if not is_expected(self.buffer[self.pos:end]):
+            return False
+        self.pos = end
+        return True
+
+    def _fill(self, min_size=0):
+        # drop the consumed part of the buffer before growing it
+        if self.eof:
+            return False
+        if self.pos > self.chunk_size:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.file.read(max(self.chunk_size, min_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def _peek(self):
+        # skip whitespace, return the next character ('' at the end of file)
+        while True:
+            self.pos = self.WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def _next_separator(self, closing_char):
+        # consume a ',' or the closing character, return True at the closing one
+        char = self._peek()
+        if char == closing_char:
+            self.pos += 1
+            return True
+        self._expect(',')
+        return False
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a value touching the end of the buffer (e.g. a number) may be incomplete
+                if end < len(self.buffer) or self.eof:
+                    if self.keep_raw:
+                        self.raw_value = self.buffer[self.pos:end]
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # the value continues in the file, at least double the pending part
+            self._fill(len(self.buffer) - self.pos)
 
 
 ##################################################
@@ -107,6 +1620,48 @@ All_Quotes_Count = 0
 Short_Quotes_Count = 0
 Centuries = set()
 Ratings_Available = False
+Collection_Index = None
+Search_Index = None
+# held while the search index is built or read
+Search_Index_Lock = threading.Lock()
+Trigram_Index = None
+Similar_Quotes = None
+Seen_Quotes = None
+Word_Statistics = None
+# PhraseStatistics of the collection (None) and of a folder or author,
+# built on first use
+Phrase_Statistics = {}
+# counters per phrase size, the summaries use at most twice as many
+Phrase_Counters = 10000
+Quote_Histogram = None
+Quote_Store = QuoteStore()
+# maximum edit distance of the similar words of a search
+Fuzzy_Distance = 2
+# (size, mtime, content hash) of the library file behind the cache files,
+# None if cache files are not used
+Library_Source = None
+# {uri: (hash, length) of the doc source} in watch mode, None otherwise
+Doc_Fingerprints = None
+# (size, modification time) of the watched library file
+Watched_Library_Stat = None
+# set by the loading thread when the books, then the quotes can be used
+Metadata_Ready = threading.Event()
+Quotes_Ready = threading.Event()
+Loader_Thread = None
+Loading_Error = None
+# random quotes are drawn uniformly over "quotes" or over "books" first
+Sampling_Mode = "quotes"
+# random quotes prefer "any", "unseen" or "least-recent" quotes, the shown
+# quotes are recorded in the seen file unless it is disabled
+Prefer_Quotes = "any"
+Seen_History_Enabled = True
+# processes of the parallel parser, 0 for every CPU
+Parse_Workers = 0
+Database = None
+Phase_Timer = None
+Last_Progress_Time = 0.0
+Terminal = TerminalOutput()
+Paging_Enabled = True
 
 # options order can be varied here, a dictionary will be built based
 # on this list, with each option's list index as the key and the
@@ -120,6 +1675,8 @@ Options = [
     "Book / list by property",
     "Statistics",
     "Search",
+    "Group / quote distribution",
+    "Group / frequent phrases",
     "Exit"
     ]
 
@@ -130,16 +1687,158 @@ LENGTH_TO_ATTR = {
     "Short only": "total_short_q"
     }
 
-LENGTH_TO_METHOD = {
-    "Any length": "get_random_q",
-    "Short only": "get_random_short_q"
-    }
-
 BOOK_RENAME_DICTIONARY = {
     "Dummy Author - Dummy Title":
         "Author - Title"
     }
 
+LIBRARY_FILE = 'library.json'
+# search index tokens and query terms ("quoted phrase" or a single word)
+TOKEN_PATTERN = re.compile(r"\w+")
+SEARCH_TERM_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+# a posting more than this many times longer than the matches is not walked,
+# the matches are looked up in it
+SEARCH_LOOKUP_RATIO = 16
+# search results ranked before the rest is sorted, more than a screen
+SEARCH_FIRST_RESULTS = 100
+# the first results are looked up in the postings while it takes less
+# than this fraction of the posting entries, every match is scored otherwise
+SEARCH_THRESHOLD_RATIO = 8
+# the loading thread prepares the tokens found in this many quotes
+SEARCH_COMMON_QUOTES = 1000
+
+# "more like this": quotes shown, postings read for the candidates and
+# candidates scored exactly per lookup
+SIMILAR_QUOTES_COUNT = 5
+SIMILAR_POSTINGS_BUDGET = 20000
+SIMILAR_CANDIDATES = 200
+
+# words of the statistics (at least 4 letters) and the ones left out
+WORD_PATTERN = re.compile(r"\w{4,}")
+WORDS_TO_OMIT = frozenset({
+    "that", "your", "this", "their", "they", "with", "have",
+    "from", "what", "there", "will", "when", "which", "more",
+    "only", "into", "because", "them", "cannot", "become", "other",
+    "make", "every", "then", "than", "these", "through", "even",
+    "always", "about", "must", "need", "very", "without", "such",
+    "know", "things", "some", "something", "those", "want", "others",
+    "find", "just", "becomes"
+    })
+# word counts of the phrase statistics, phrases do not cross punctuation
+PHRASE_SIZES = (2, 3)
+PHRASE_BREAK_PATTERN = re.compile(r"[^\w\s'’-]+")
+PHRASE_WORD_PATTERN = re.compile(r"\w+(?:['’]\w+)*")
+
+# characters read from library.json at once by the streaming parser
+STREAM_CHUNK_SIZE = 1 << 20
+
+# the parallel parser reads smaller files with the streaming parser, it
+# cuts the docs into chunks while it reads them, a few chunks per worker
+# are sent ahead, so the file is never in memory as a whole
+PARALLEL_PARSE_MIN_CHARS = 16 << 20
+PARALLEL_CHUNK_CHARS = 2 << 20
+PARALLEL_CHUNKS_PER_WORKER = 2
+# a '{"' after a separator, the start of an object outside of any string
+OBJECT_START_PATTERN = re.compile(r'\}\s*,\s*(\{\s*")')
+
+# the built collection and its search index are cached next to the library
+# file, the format version must be increased whenever the stored data changes
+SNAPSHOT_CACHE_NAME = 'snapshot'
+HISTORY_CACHE_NAME = 'history'
+DATABASE_CACHE_NAME = 'sqlite'
+DATABASE_FORMAT_VERSION = 1
+DATABASE_DATE_FIELDS = ("file_modified_time", "have_read_time")
+HISTORY_FORMAT_VERSION = 1
+SEEN_CACHE_NAME = 'seen'
+SEEN_FORMAT_VERSION = 1
+SEARCH_INDEX_CACHE_NAME = 'search-index'
+CACHE_MAGIC = b"RCCSNAP"
+CACHE_FORMAT_VERSION = 5
+SNAPSHOT_BOOK_FIELDS = (
+    "title", "author", "folder", "file_id", "annotation", "pages_count",
+    "published_date", "file_modified_time", "have_read_time", "activity_time",
+    "q_per_page", "first_q_date", "last_q_date", "rating", "ratings_count"
+    )
+
+# sort key of every book list (descending, except the folder list by title),
+# the "continued" lists are the second round of the rating and finished lists
+LIST_SORT_KEYS = {
+    "added on": lambda book: book.file_modified_time,
+    "reading now": lambda book: book.published_date,
+    "finished list": lambda book: book.have_read_time,
+    "read duration": lambda book: book.first_q_date,
+    "publish date": lambda book: book.published_date,
+    "number of quotes": lambda book: book.total_q,
+    "quote/page ratio": lambda book: book.q_per_page,
+    "rating": lambda book: book.rating,
+    "folder": lambda book: book.title,
+    "continued_as_ratings_count": lambda book: book.ratings_count,
+    "continued_as_publish_date_of_finished": lambda book: book.published_date
+    }
+
+# export formats and their file extensions
+EXPORT_EXTENSIONS = {"txt": "txt", "md": "md", "jsonl": "jsonl"}
+UNSAFE_FILENAME_PATTERN = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+RESERVED_FILENAMES = frozenset(["CON", "PRN", "AUX", "NUL"] + [f"COM{i}" for i in range(1, 10)] + [f"LPT{i}" for i in range(1, 10)])
+MAX_FILENAME_BYTES = 180
+EXPORT_PROGRESS_INTERVAL = 0.2
+OUTPUT_CHUNK_SIZE = 1 << 16
+# hyphens and the whitespace that TextWrapper does not turn into spaces
+WRAP_FALLBACK_PATTERN = re.compile(r"[-\t\x1c-\x1f\x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]")
+WRAP_WHITESPACE_TABLE = str.maketrans("\n\r\x0b\x0c", "    ")
+
+# property names of the headless list command
+LIST_PROPERTY_NAMES = {
+    "added-on": "added on",
+    "reading-now": "reading now",
+    "finished": "finished list",
+    "finished-by-publish-date": "continued_as_publish_date_of_finished",
+    "read-duration": "read duration",
+    "publish-date": "publish date",
+    "quotes": "number of quotes",
+    "quote-page-ratio": "quote/page ratio",
+    "rating": "rating",
+    "ratings-count": "continued_as_ratings_count",
+    "folder": "folder"
+    }
+
+# menu options that start with the books, folders and counts, they wait
+# for the quotes only where they first read them, the others wait at once
+METADATA_OPTIONS = frozenset(["Random / All Quotes", "Random / Selected Author", "Random / Selected Folder",
+                              "Book / every quote", "Book / quote distribution", "Book / list by property",
+                              "Statistics", "Search", "Group / quote distribution", "Group / frequent phrases",
+                              "Exit"])
+
+LIST_SECOND_PASS = {
+    "rating": "continued_as_ratings_count",
+    "finished list": "continued_as_publish_date_of_finished"
+    }
+
+# phases of --timings: (name, class or None for a module function, attribute),
+# the ones without attribute are timed inline with timed_phase()
+TIMED_FUNCTIONS = [
+    ("json decode", JsonStreamReader, "_decode_value"),
+    ("parallel docs", None, "read_docs_in_pool"),
+    ("doc loop", None, "create_book"),
+    ("  citation ingestion", Book, "set_quotes"),
+    ("aggregation", None, None),
+    ("final sort", None, None),
+    ("quote store", None, None),
+    ("folder lookup and index", CollectionIndex, "__init__"),
+    ("snapshot load", None, "load_collection_snapshot"),
+    ("snapshot save", None, "save_collection_snapshot"),
+    ("database load", None, "load_collection_database"),
+    ("database save", None, "save_collection_database"),
+    ("search index", None, "get_search_index"),
+    ("trigram index", TrigramIndex, "__init__"),
+    ("word statistics", WordStatistics, "__init__"),
+    ("phrase statistics", PhraseStatistics, "__init__"),
+    ("search", None, "find_search_results"),
+    ("similar quotes", SimilarQuotes, "find"),
+    ("quote distribution", QuoteHistogram, "get_buckets"),
+    ("list by property", None, "list_books_by_property")
+    ]
+
 MAX_CHAR_IN_SHORT_QUOTE = 300
 ONE_DAY_IN_SECONDS = 86400
 # 2024-02-23 0:00:00
@@ -178,147 +1877,1642 @@ def create_options_menu(opt_lst):
 
 
 ##################################################
-# FUNCTION: build The Collection
+# FUNCTION: build The Collection
+##################################################
+def build_the_collection(parser="stream", metadata_ready=None):
+    """
+    Build The Collection from the library file. The metadata_ready
+    event is set once the books, folders and counts can be used, the
+    quotes are added to the quote store after it.
+    """
+    # these are in the global scope, indicate global to be able to modify
+    global The_Collection
+    global Quote_Store
+    global Database
+    
+    # reset globals
+    The_Collection = []
+    Quote_Store = QuoteStore()
+    Database = None
+    Folders.clear()
+    if Doc_Fingerprints is not None:
+        Doc_Fingerprints.clear()
+
+    # open and read the JSON file, the streaming parser builds every book
+    # as soon as its doc is decoded, the full parser loads the whole file first
+    try:
+        with open_library_file(LIBRARY_FILE) as file:
+            if parser == "full":
+                read_library_full(file)
+            elif parser == "parallel":
+                read_library_parallel(file)
+            else:
+                read_library_streaming(file)
+    except (FileNotFoundError, json.JSONDecodeError, zipfile.BadZipFile) as e:
+        print(f"Error reading JSON file: {e}")
+        sys.exit(1)
+
+    with timed_phase("aggregation"):
+        aggregate_the_collection()
+
+    with timed_phase("final sort"):
+        # alphabetical order by title
+        The_Collection.sort(key=lambda book: book.title)
+
+    # folders may be listed after the docs in the file, the index assigns them
+    prepare_derived_structures()
+    if metadata_ready is not None:
+        metadata_ready.set()
+
+    with timed_phase("quote store"):
+        # the quote store follows the order of the books
+        Quote_Store.reorder(The_Collection)
+
+##################################################
+# FUNCTION: gather the global lists and counts
+##################################################
+def aggregate_the_collection():
+    # these are in the global scope, indicate global to be able to modify
+    global All_Quotes_Count
+    global Short_Quotes_Count
+    global Authors
+    global Titles
+    global Centuries
+    global Ratings_Available
+
+    # reset globals
+    All_Quotes_Count = 0
+    Short_Quotes_Count = 0
+    Authors = set()
+    Titles = []
+    Centuries = set()
+    Ratings_Available = False
+
+    # gather titles, authors and quote counts
+    for book in The_Collection:
+        if book.total_q > 0:
+            if book.author:
+                Authors.add(book.author)
+            Titles.append(book.title)
+
+        All_Quotes_Count += book.total_q
+        Short_Quotes_Count += book.total_short_q
+
+        # check and process goodreads data
+        if book.published_date != 0:
+            century = int(book.published_date / 100) + 1
+            if century not in Centuries:
+                Centuries.add(century)
+        if book.rating > 0.0:
+            Ratings_Available = True
+
+    # "arrays" are ready, convert to list
+    Authors = sorted(list(Authors))
+    Titles = sorted(Titles)
+    Centuries = list(Centuries)
+
+##################################################
+# FUNCTION: prepare structures derived from The Collection
+##################################################
+def prepare_derived_structures():
+    """
+    Build the index of the freshly loaded Collection and drop every
+    structure that was derived from the previous one.
+    """
+    global Collection_Index
+    global Search_Index
+    global Trigram_Index
+    global Similar_Quotes
+    global Seen_Quotes
+    global Word_Statistics
+    global Quote_Histogram
+    Collection_Index = CollectionIndex(The_Collection, Folders)
+    Quote_Histogram = QuoteHistogram()
+    Search_Index = None
+    Trigram_Index = None
+    Similar_Quotes = None
+    Word_Statistics = None
+    Phrase_Statistics.clear()
+    # the quote ids change, the shown quotes are saved before
+    save_seen_quotes()
+    Seen_Quotes = None
+
+##################################################
+# FUNCTION: get the search index (built on first use)
+##################################################
+def get_search_index():
+    global Search_Index
+    # a search started while the loading thread builds the index waits for it
+    with Search_Index_Lock:
+        if Search_Index is None and Database is not None:
+            Search_Index = SqliteSearchIndex(The_Collection, Quote_Store, Database)
+        if Search_Index is None:
+            # reuse the index of the same library file if it was saved before
+            payload = read_cache_file(SEARCH_INDEX_CACHE_NAME) if Library_Source else None
+            if payload and is_current_source(payload.get("source")):
+                Search_Index = SearchIndex(The_Collection, Quote_Store, payload["state"])
+            else:
+                Search_Index = SearchIndex(The_Collection, Quote_Store)
+                if Library_Source:
+                    write_cache_file(SEARCH_INDEX_CACHE_NAME, {"source": Library_Source, "state": Search_Index.get_state()})
+        return Search_Index
+
+##################################################
+# FUNCTION: get the similar quote lookup (built on first use)
+##################################################
+def get_similar_quotes():
+    global Similar_Quotes
+    if Similar_Quotes is None:
+        Similar_Quotes = SimilarQuotes(get_search_index())
+    return Similar_Quotes
+
+##################################################
+# FUNCTION: find the quotes most like a quote
+##################################################
+def find_similar_quotes(book, quote, count, same_book=False):
+    """
+    Return (book, quote, similarity) tuples of the count quotes most
+    similar to a quote of the book, from other books unless same_book.
+    """
+    excluded = range(quote.index, quote.index + 1) if same_book else range(book.q_start, book.q_start + book.total_q)
+    search_index = get_search_index()
+    return [(*search_index.get_quote(quote_id), similarity)
+            for quote_id, similarity in get_similar_quotes().find(quote.text, count, excluded)]
+
+##################################################
+# FUNCTION: split text into lowercase word tokens
+##################################################
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+##################################################
+# FUNCTION: get the searchable text of a book
+##################################################
+def get_book_text(book):
+    return f"{book.title}\n{book.author or ''}\n{book.annotation or ''}"
+
+##################################################
+# FUNCTION: get the set of character trigrams
+##################################################
+def get_trigrams(text):
+    return set(map(''.join, zip(text, text[1:], text[2:])))
+
+##################################################
+# FUNCTION: edit distance with an upper bound
+##################################################
+def get_edit_distance(a, b, max_distance):
+    """
+    Return the Levenshtein distance of a and b, or max_distance + 1
+    as soon as it is sure to be larger than max_distance.
+    """
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+##################################################
+# FUNCTION: parse a search query
+##################################################
+def parse_search_query(query):
+    """
+    Return the alternatives of the query (separated by OR), each one
+    is a list of (kind, tokens) terms that must all match. Kinds are
+    "word", "prefix" (word*), "fuzzy" (~word) and "phrase" ("quoted words").
+    """
+    alternatives = [[]]
+    for phrase, word in SEARCH_TERM_PATTERN.findall(query):
+        if word in ("OR", "|"):
+            if alternatives[-1]:
+                alternatives.append([])
+            continue
+        tokens = tokenize(phrase or word)
+        if not tokens:
+            continue
+        if word.endswith('*') and len(tokens) == 1:
+            alternatives[-1].append(("prefix", tokens))
+        elif word.startswith('~') and len(tokens) == 1:
+            alternatives[-1].append(("fuzzy", tokens))
+        elif len(tokens) == 1:
+            alternatives[-1].append(("word", tokens))
+        else:
+            # quoted words or a word like "don't" that splits into more tokens
+            alternatives[-1].append(("phrase", tokens))
+    return [terms for terms in alternatives if terms]
+
+##################################################
+# FUNCTION: get the highlight pattern of a query
+##################################################
+def get_highlight_pattern(query):
+    parts = []
+    for terms in parse_search_query(query):
+        for kind, tokens in terms:
+            if kind == "prefix":
+                parts.append(rf"\b{re.escape(tokens[0])}\w*")
+            elif kind == "fuzzy":
+                parts.extend(rf"\b{re.escape(word)}\b" for word in get_similar_words(tokens[0]))
+            else:
+                parts.append(r"\b" + r"\W+".join(re.escape(token) for token in tokens) + r"\b")
+    # longer alternatives first, so a phrase wins over its own words
+    parts.sort(key=len, reverse=True)
+    return re.compile('|'.join(parts), re.IGNORECASE) if parts else None
+
+##################################################
+# FUNCTION: search The Collection
+##################################################
+def search_the_collection(query):
+    """
+    Return the matching quotes grouped per book as SearchGroups, books
+    ordered by their best scoring quote, quotes by their score.
+    """
+    search_index = get_search_index()
+    return SearchGroups(search_index, search_index.search(query))
+
+##################################################
+# FUNCTION: get the word statistics (collected on first use)
+##################################################
+def get_word_statistics():
+    global Word_Statistics
+    if Word_Statistics is None:
+        Word_Statistics = WordStatistics(The_Collection)
+    return Word_Statistics
+
+##################################################
+# FUNCTION: get the phrase statistics (built on first use)
+##################################################
+def get_phrase_statistics(group=None, group_type="Folder"):
+    # group None is the whole collection
+    key = (group_type, group) if group is not None else None
+    if key not in Phrase_Statistics:
+        if group is None:
+            books = The_Collection
+        elif group_type == "Folder":
+            books = Collection_Index.get_books(Collection_Index.select(folder=group, with_quotes=True))
+        else:
+            books = Collection_Index.get_books(Collection_Index.select(author=group, with_quotes=True))
+        Phrase_Statistics[key] = PhraseStatistics(books, Phrase_Counters)
+    return Phrase_Statistics[key]
+
+##################################################
+# FUNCTION: get the trigram index (built on first use)
+##################################################
+def get_trigram_index():
+    global Trigram_Index
+    if Trigram_Index is None:
+        search_index = get_search_index()
+        Trigram_Index = TrigramIndex(set(search_index.postings) | set(search_index.book_postings))
+    return Trigram_Index
+
+##################################################
+# FUNCTION: get words similar to a (misspelled) word
+##################################################
+def get_similar_words(word):
+    # short words get a smaller distance, otherwise everything would be similar
+    max_distance = min(Fuzzy_Distance, max(1, len(word) // 3))
+    return get_trigram_index().find_similar(word, max_distance)
+
+##################################################
+# FUNCTION: search for a substring
+##################################################
+def search_substring(text):
+    """
+    Return the books whose title, author or annotation contains the text
+    and the quotes containing it grouped per book, both in collection order.
+    Candidates come from the words matching the pieces of the text, only
+    those are checked for the whole text.
+    """
+    search_index = get_search_index()
+    trigram_index = get_trigram_index()
+    needle = text.lower()
+
+    quote_candidates, book_candidates = None, None
+    for piece in TOKEN_PATTERN.finditer(needle):
+        # a piece touching the start of the text may be the end of a word in the quote,
+        # a piece touching the end of the text may be the beginning of one
+        words = trigram_index.find_containing(piece.group(), starts_word=piece.start() > 0,
+                                              ends_word=piece.end() < len(needle))
+        if words is None:
+            continue
+        quote_ids, book_positions = set(), set()
+        for word in words:
+            quote_ids.update(search_index.postings.get(word, ((), ()))[0])
+            book_positions.update(search_index.book_postings.get(word, ()))
+        quote_candidates = quote_ids if quote_candidates is None else quote_candidates & quote_ids
+        book_candidates = book_positions if book_candidates is None else book_candidates & book_positions
+
+    # no piece was long enough to use the index, check everything
+    if quote_candidates is None:
+        quote_candidates = range(len(search_index.store))
+        book_candidates = range(len(search_index.books))
+
+    books = [search_index.books[position] for position in sorted(book_candidates)
+             if needle in get_book_text(search_index.books[position]).lower()]
+    groups = {}
+    for quote_id in sorted(quote_candidates):
+        book, quote = search_index.get_quote(quote_id)
+        if needle in quote.text.lower():
+            groups.setdefault(id(book), (book, []))[1].append(quote)
+    return books, list(groups.values())
+
+##################################################
+# FUNCTION: find search results for the Search option
+##################################################
+def find_search_results(query):
+    """
+    Return (books, groups, highlight pattern, note) for a query. A query
+    starting with '=' is a substring search, otherwise a word search that
+    falls back to substring and then to similar words if nothing matched.
+    """
+    if query.startswith('='):
+        books, groups = search_substring(query[1:])
+        return books, groups, re.compile(re.escape(query[1:]), re.IGNORECASE), ""
+
+    groups = search_the_collection(query)
+    if groups:
+        return [], groups, get_highlight_pattern(query), ""
+
+    # nothing matched as words, try the text as a part of words
+    books, groups = search_substring(query)
+    if books or groups:
+        return books, groups, re.compile(re.escape(query), re.IGNORECASE), "Searched as part of words."
+
+    # try similar words for every word of the query
+    words = [word for terms in parse_search_query(query) for kind, tokens in terms for word in tokens]
+    similar = {word: get_similar_words(word) for word in words}
+    if not any(similar.values()):
+        return [], [], None, ""
+    fuzzy_query = ' '.join(f"~{word}" for word in words)
+    search_index = get_search_index()
+    positions = sorted({position for matches in similar.values() for match in matches
+                        for position in search_index.book_postings.get(match, ())})
+    books = [search_index.books[position] for position in positions]
+    note = f"Did you mean: {', '.join(match for matches in similar.values() for match in matches)}"
+    return books, search_the_collection(fuzzy_query), get_highlight_pattern(fuzzy_query), note
+
+##################################################
+# FUNCTION: open library.json or a ReadEra backup
+##################################################
+@contextlib.contextmanager
+def open_library_file(path):
+    """
+    Open a library.json file, or the library.json inside a ReadEra .bak
+    (zip) archive, which is decompressed while it is read, never to disk.
+    """
+    if not zipfile.is_zipfile(path):
+        with open(path, 'r', encoding="utf8") as file:
+            yield file
+        return
+
+    with zipfile.ZipFile(path) as archive:
+        names = [name for name in archive.namelist() if os.path.basename(name) == "library.json"]
+        if not names:
+            raise FileNotFoundError(f"library.json not found in {path}")
+        # the shortest path is the top-level one
+        with archive.open(min(names, key=len)) as member:
+            yield io.TextIOWrapper(member, encoding="utf8")
+
+##################################################
+# FUNCTION: read library.json in one piece
+##################################################
+def read_library_full(file):
+    # no doc source is kept, a watched library is fully rebuilt on its first change
+    with timed_phase("json decode"):
+        data = json.load(file)
+
+    # get the folders dictionary, each value will be a set of book IDs
+    for coll in data['colls']:
+        Folders[coll['data']['coll_title']] = set(coll['docs'])
+
+    for doc in data['docs']:
+        this_book = create_book(doc)
+        if this_book:
+            The_Collection.append(this_book)
+
+##################################################
+# FUNCTION: read library.json doc by doc
+##################################################
+def read_library_streaming(file):
+    # the doc sources are only hashed in watch mode
+    reader = JsonStreamReader(file, keep_raw=Doc_Fingerprints is not None)
+    for key, value in reader.iter_object(streamed_keys=("docs",)):
+        if key == "docs":
+            if Doc_Fingerprints is not None:
+                Doc_Fingerprints[value['uri']] = (get_doc_fingerprint(reader.raw_value), len(reader.raw_value))
+            # value is a single doc, it is dropped as soon as the book is built
+            this_book = create_book(value)
+            if this_book:
+                The_Collection.append(this_book)
+        elif key == "colls":
+            for coll in value:
+                Folders[coll['data']['coll_title']] = set(coll['docs'])
+
+##################################################
+# FUNCTION: read library.json in a process pool
+##################################################
+def read_library_parallel(file):
+    """
+    Decode the docs and build their books in worker processes, the top
+    level, the folders and the docs after the last chunk are read here.
+    Small files, a single worker and docs that cannot be cut into chunks
+    use the streaming parser.
+    """
+    # one worker would only add the cost of the pool, the file is streamed
+    # like with --parser stream (also on a single CPU)
+    workers = Parse_Workers or os.cpu_count() or 1
+    if workers < 2:
+        read_library_streaming(file)
+        return
+    parts = read_docs_in_pool(file, workers)
+    if parts is None:
+        # a chunk did not start at a doc, the file is read again
+        file.seek(0)
+        read_library_streaming(file)
+        return
+
+    for books, store, fingerprints in parts:
+        # move the quotes behind the ones of the previous parts
+        offset = len(Quote_Store)
+        Quote_Store.texts += store.texts
+        for column, part_column in zip((Quote_Store.pages, Quote_Store.insert_times, Quote_Store.lengths,
+                                        Quote_Store.book_ids),
+                                       (store.pages, store.insert_times, store.lengths, store.book_ids)):
+            column += part_column
+        for book in books:
+            book.store = Quote_Store
+            book.q_start += offset
+        The_Collection.extend(books)
+        if fingerprints:
+            Doc_Fingerprints.update(fingerprints)
+
+##################################################
+# FUNCTION: build the docs array in a process pool
+##################################################
+def read_docs_in_pool(file, workers):
+    """
+    Stream the file, send the docs array in chunks cut at doc boundaries
+    to the workers and build the docs after the last boundary here.
+    Return the (books, store, fingerprints) parts in file order, None if a
+    chunk could not be decoded (nothing is added then). Folders are read.
+    """
+    with_fingerprints = Doc_Fingerprints is not None
+    reader = JsonStreamReader(file, keep_raw=with_fingerprints)
+    executor = None
+    parts = []
+    sent = []
+    # the docs decoded here, once no more chunks are cut
+    last_part = None
+
+    def send_chunk(reader):
+        nonlocal executor, last_part
+        if last_part is None and executor is None and not reader.has_ahead(PARALLEL_PARSE_MIN_CHARS):
+            last_part = [], QuoteStore(), {}
+        if last_part is not None:
+            return False
+        text = reader.take_elements(PARALLEL_CHUNK_CHARS, find_doc_start)
+        if text is None:
+            last_part = [], QuoteStore(), {}
+            return False
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        # the chunks sent ahead are bounded, the oldest one is waited for
+        if len(sent) >= workers * PARALLEL_CHUNKS_PER_WORKER:
+            sent.pop(0).result()
+        future = executor.submit(build_docs_chunk, text, with_fingerprints)
+        sent.append(future)
+        parts.append(future)
+        return True
+
+    # a chunk starting at a wrong boundary (an object start inside a
+    # string or a nested object) cuts the last doc of the previous chunk,
+    # which then fails to decode, so all chunks decoded means all
+    # boundaries were doc starts
+    try:
+        for key, value in reader.iter_object(streamed_keys=("docs",), skip=send_chunk):
+            if key == "docs":
+                if value is None:
+                    continue
+                if not parts or parts[-1] is not last_part:
+                    parts.append(last_part)
+                books, store, fingerprints = last_part
+                if with_fingerprints:
+                    fingerprints[value['uri']] = (get_doc_fingerprint(reader.raw_value), len(reader.raw_value))
+                book = create_book(value, store)
+                if book:
+                    books.append(book)
+            elif key == "colls":
+                for coll in value:
+                    Folders[coll['data']['coll_title']] = set(coll['docs'])
+        return [part.result() if isinstance(part, Future) else part for part in parts]
+    except json.JSONDecodeError:
+        return None
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+##################################################
+# FUNCTION: find the start of a doc
+##################################################
+def find_doc_start(text, pos):
+    """
+    Return the position of the first doc of the docs array at or after
+    pos, None if there is none. An object start is a doc if it decodes
+    to an object with an uri and data, like no object inside a doc.
+    """
+    decoder = json.JSONDecoder()
+    for match in OBJECT_START_PATTERN.finditer(text, pos):
+        try:
+            value, _ = decoder.raw_decode(text, match.start(1))
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict) and 'uri' in value and 'data' in value:
+            return match.start(1)
+    return None
+
+##################################################
+# FUNCTION: build the books of a chunk of docs
+##################################################
+def build_docs_chunk(text, with_fingerprints=False):
+    """
+    Worker of the parallel parser: decode the docs in text, whole docs
+    separated by commas. Return the books, their quote store and the doc
+    fingerprints (in watch mode).
+    """
+    decoder = json.JSONDecoder()
+    whitespace = JsonStreamReader.WHITESPACE
+    store = QuoteStore()
+    books, fingerprints = [], {}
+    pos = whitespace.match(text).end()
+    while True:
+        doc, doc_end = decoder.raw_decode(text, pos)
+        if with_fingerprints:
+            fingerprints[doc['uri']] = get_doc_fingerprint(text[pos:doc_end]), doc_end - pos
+        book = create_book(doc, store)
+        if book:
+            books.append(book)
+        pos = whitespace.match(text, doc_end).end()
+        if pos == len(text):
+            return books, store, fingerprints
+        if text[pos] != ',':
+            raise json.JSONDecodeError("Expecting ','", text, pos)
+        pos = whitespace.match(text, pos + 1).end()
+
+##################################################
+# FUNCTION: create a Book from a single doc
+##################################################
+def create_book(doc, store=None):
+    # the quotes wait for the global store unless another one is given
+    if doc['data']['doc_active'] != 1:
+        return None
+
+    this_book = Book(get_book_title(doc))
+
+    # store additional data
+    this_book.file_id = doc['uri']
+    this_book.author = doc['data'].get('user_authors') or doc['data'].get('doc_authors')
+    this_book.annotation = doc['data'].get('doc_annotation', "")
+
+    # store file date as a date object, activity time as a simple timestamp
+    aux_date = datetime.datetime.fromtimestamp(doc['data'].get('file_modified_time') / 1000)
+    this_book.file_modified_time = aux_date
+    this_book.activity_time = doc['data'].get('doc_activity_time')
+
+    # get pages count if available
+    try:
+        doc_data = json.loads(doc['data']['doc_position'])
+        this_book.pages_count = doc_data['pagesCount']
+    except (KeyError, ValueError, IndexError, TypeError, AttributeError):
+        this_book.pages_count = 0
+
+    # get goodreads data if available
+    try:
+        review_note = doc['reviews'][0]['note_body']
+        this_book.published_date = int(review_note.split(';')[0].strip())
+        this_book.rating = float(review_note.split(';')[1].strip())
+        this_book.ratings_count = float(review_note.split(';')[2].strip().replace('k', '.'))
+    except (KeyError, ValueError, IndexError, TypeError, AttributeError):
+        this_book.published_date = 0
+        this_book.rating = 0.0
+        this_book.ratings_count = 0.0
+
+    # get the citations, they are stored in the columns of the quote store
+    quotes = [(citation['note_body'], citation['note_page'], citation['note_insert_time'])
+              for citation in doc['citations']]
+    this_book.set_quotes(store, quotes)
+    if len(quotes) > 0:
+        # first and last dates, convert to seconds
+        quote_dates = [quote[2] for quote in quotes]
+        this_book.first_q_date = min(quote_dates) / 1000
+        this_book.last_q_date = max(quote_dates) / 1000
+
+        # calculate the q/p ratio, avoid division by zero
+        if this_book.pages_count > 0:
+            this_book.q_per_page = this_book.total_q / this_book.pages_count
+
+    # check if current doc was finished or not
+    if doc['data'].get('doc_have_read_time') != 0:
+        if this_book.title in EXCEPTION_TITLES_FOR_READ_DATE:
+            # Dec 23, 2025 07:00:00 AM GMT+01:00
+            aux_date = datetime.datetime.fromtimestamp(1766473200)
+        elif ((this_book.last_q_date - this_book.first_q_date) > ONE_DAY_IN_SECONDS and
+               this_book.title not in EXCLUDED_TITLES_FROM_READ_DATE ):
+            # use last quote date if available
+            aux_date = datetime.datetime.fromtimestamp(this_book.last_q_date)
+        else:
+            # use default date
+            # # Dec 23, 2025 07:00:00 AM GMT+01:00
+            aux_date = datetime.datetime.fromtimestamp(1766473200)
+    else:
+        aux_date = datetime.datetime.fromtimestamp(0)
+
+    # add the constructed date
+    this_book.have_read_time = aux_date
+    return this_book
+
+##################################################
+# FUNCTION: get the title of a doc
+##################################################
+def get_book_title(doc):
+    # Use regex to remove non-alphabet characters from the beginning of the title
+    book_title = re.sub(r"^[^a-zA-Z]+", "", doc['data']['doc_file_name_title'])
+
+    # handle renamed books, book_title is the default return
+    return BOOK_RENAME_DICTIONARY.get(book_title, book_title)
+
+##################################################
+# FUNCTION: load The Collection (snapshot or build)
+##################################################
+def load_the_collection(parser="stream", use_snapshot=True, backend="memory"):
+    """
+    Load The Collection from its snapshot if it is still valid,
+    otherwise build it from the library file and save a new snapshot.
+    The sqlite backend keeps the quotes in a database instead.
+    """
+    global Library_Source
+    global Database
+    Library_Source = None
+    Database = None
+    if backend == "sqlite":
+        if not load_collection_database():
+            build_the_collection(parser)
+            save_collection_database()
+            # continue from the database like every later start
+            load_collection_database()
+        Metadata_Ready.set()
+        Quotes_Ready.set()
+        return
+    if use_snapshot and load_collection_snapshot():
+        Quotes_Ready.set()
+        return
+    # the books can be used while the quotes are stored, all of it while the snapshot is written
+    build_the_collection(parser, Metadata_Ready)
+    Quotes_Ready.set()
+    if use_snapshot:
+        save_collection_snapshot()
+
+##################################################
+# FUNCTION: load The Collection on a worker thread
+##################################################
+def start_loading_the_collection(parser="stream", use_snapshot=True, backend="memory"):
+    """
+    Load The Collection in the background, so the menu is shown at once.
+    The options wait with wait_for_the_collection() for what they need.
+    """
+    global Loader_Thread
+
+    def load():
+        global Loading_Error
+        try:
+            load_the_collection(parser, use_snapshot, backend)
+        except BaseException as e:
+            # also the SystemExit of an unreadable library file, the menu exits with it
+            Loading_Error = e
+            return
+        finally:
+            Metadata_Ready.set()
+            Quotes_Ready.set()
+        # the in-memory search index is built while the menu waits for input,
+        # the watch checks wait for it as the thread is still alive
+        if Database is None:
+            get_search_index().prepare_common_tokens(SEARCH_COMMON_QUOTES)
+
+    # a daemon thread, exiting from the menu does not wait for the loading
+    Loader_Thread = threading.Thread(target=load, name="collection loader", daemon=True)
+    Loader_Thread.start()
+
+##################################################
+# FUNCTION: wait for the loading thread
+##################################################
+def wait_for_the_collection(ready):
+    """
+    Wait until the ready event is set: Metadata_Ready for the books,
+    folders and counts, Quotes_Ready for the quotes too. A collection
+    loaded without the loading thread (headless commands) is ready.
+    """
+    if Loader_Thread is None:
+        return
+    if not ready.is_set():
+        print("Loading the collection...")
+        ready.wait()
+    if Loading_Error is not None:
+        if isinstance(Loading_Error, SystemExit):
+            raise Loading_Error
+        sys.exit(f"Error loading the collection: {Loading_Error}")
+
+##################################################
+# FUNCTION: check if the loading thread is still running
+##################################################
+def is_loading():
+    return Loader_Thread is not None and Loader_Thread.is_alive()
+
+##################################################
+# FUNCTION: get the path of a cache file
+##################################################
+def get_cache_path(name):
+    return f"{LIBRARY_FILE}.{name}"
+
+##################################################
+# FUNCTION: write a cache file
+##################################################
+def write_cache_file(name, payload, version=CACHE_FORMAT_VERSION):
+    try:
+        # write next to the final file and rename, a reader never sees a partial file
+        cache_path = get_cache_path(name)
+        temp_path = f"{cache_path}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(CACHE_MAGIC + struct.pack("<I", version))
+            pickle.dump(payload, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+        return True
+    except OSError:
+        # cache files are optional, the tool works without them
+        return False
+
+##################################################
+# FUNCTION: read a cache file
+##################################################
+def read_cache_file(name, version=CACHE_FORMAT_VERSION):
+    """
+    Return the payload of a cache file, or None if it is missing,
+    damaged or has another format version.
+    """
+    header = CACHE_MAGIC + struct.pack("<I", version)
+    try:
+        with open(get_cache_path(name), 'rb') as file:
+            if file.read(len(header)) != header:
+                return None
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError, TypeError):
+        return None
+
+##################################################
+# FUNCTION: check if a cache file belongs to the library file
+##################################################
+def is_current_source(source):
+    # size and content hash decide, the modification time may have changed
+    return bool(source and Library_Source) and (source[0], source[2]) == (Library_Source[0], Library_Source[2])
+
+##################################################
+# FUNCTION: hash the content of a file
+##################################################
+def compute_file_hash(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        while chunk := file.read(STREAM_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+##################################################
+# FUNCTION: check the library file of a cache
+##################################################
+def check_library_source(source):
+    """
+    Return None if the library file is not the one of the source,
+    otherwise whether it was touched (same content, other modification time).
+    """
+    # size and modification time must match, the content hash is only
+    # computed when the file was touched without changing its size
+    try:
+        stat = os.stat(LIBRARY_FILE)
+        size, mtime_ns, content_hash = source
+        if size != stat.st_size:
+            return None
+        touched = mtime_ns != stat.st_mtime_ns
+        if touched and content_hash != compute_file_hash(LIBRARY_FILE):
+            return None
+    except (OSError, KeyError, ValueError, TypeError):
+        return None
+    return touched
+
+##################################################
+# FUNCTION: save snapshot of The Collection
+##################################################
+def save_collection_snapshot():
+    global Library_Source
+    try:
+        stat = os.stat(LIBRARY_FILE)
+        Library_Source = (stat.st_size, stat.st_mtime_ns, compute_file_hash(LIBRARY_FILE))
+    except OSError:
+        return
+
+    write_cache_file(SNAPSHOT_CACHE_NAME, {
+        "source": Library_Source,
+        "books": [
+            (tuple(getattr(book, field) for field in SNAPSHOT_BOOK_FIELDS), book.long_q_count, book.total_short_q)
+            for book in The_Collection
+            ],
+        # the store is in collection order, the books only need their counts,
+        # the texts are pickled per book and loaded when a book is used
+        "quote_store": ([pickle.dumps(book.get_quote_texts(), protocol=pickle.HIGHEST_PROTOCOL) if book.total_q else None
+                         for book in The_Collection],
+                        Quote_Store.pages.tobytes(), Quote_Store.insert_times.tobytes(),
+                        Quote_Store.lengths.tobytes(), Quote_Store.book_ids.tobytes()),
+        "folders": Folders,
+        "authors": Authors,
+        "titles": Titles,
+        "centuries": Centuries,
+        "counts": (All_Quotes_Count, Short_Quotes_Count),
+        "ratings_available": Ratings_Available,
+        "fingerprints": Doc_Fingerprints
+        })
+
+##################################################
+# FUNCTION: load snapshot of The Collection
+##################################################
+def load_collection_snapshot():
+    """
+    Restore The Collection from its snapshot, return False if the
+    snapshot is missing, has another format version or is stale.
+    """
+    global The_Collection
+    global All_Quotes_Count
+    global Short_Quotes_Count
+    global Authors
+    global Titles
+    global Centuries
+    global Ratings_Available
+    global Library_Source
+    global Quote_Store
+
+    payload = read_cache_file(SNAPSHOT_CACHE_NAME)
+    if not payload:
+        return False
+    touched = check_library_source(payload.get("source"))
+    if touched is None:
+        return False
+
+    # counts, dates and ratios are fields of the books, no quote text is needed for them
+    Quote_Store = QuoteStore()
+    The_Collection = []
+    starts = array('I', [0])
+    for fields, long_q_count, short_q_count in payload["books"]:
+        book = Book(fields[0])
+        for field, value in zip(SNAPSHOT_BOOK_FIELDS, fields):
+            setattr(book, field, value)
+        book.store, book.q_start = Quote_Store, starts[-1]
+        book.long_q_count, book.total_short_q = long_q_count, short_q_count
+        starts.append(starts[-1] + book.total_q)
+        The_Collection.append(book)
+
+    Folders.clear()
+    Folders.update(payload["folders"])
+    Authors = payload["authors"]
+    Titles = payload["titles"]
+    Centuries = payload["centuries"]
+    All_Quotes_Count, Short_Quotes_Count = payload["counts"]
+    Ratings_Available = payload["ratings_available"]
+    Library_Source = payload["source"]
+    if Doc_Fingerprints is not None:
+        Doc_Fingerprints.clear()
+        if payload["fingerprints"] is not None:
+            Doc_Fingerprints.update(payload["fingerprints"])
+        else:
+            # saved without --watch: the docs of the same file are fingerprinted
+            # now, so the first reload only rebuilds the changed books
+            Doc_Fingerprints.update(read_doc_fingerprints())
+            touched = check_library_source(payload["source"])
+            if touched is None:
+                return False
+            touched = True
+    prepare_derived_structures()
+    Metadata_Ready.set()
+
+    # the quotes follow the books, only the menu options using them wait
+    for column, data in zip((Quote_Store.pages, Quote_Store.insert_times, Quote_Store.lengths, Quote_Store.book_ids),
+                            payload["quote_store"][1:]):
+        column.frombytes(data)
+    Quote_Store.texts = LazyQuoteTexts(payload["quote_store"][0], starts)
+
+    # store the new modification time, so the hash is not computed again
+    if touched:
+        save_collection_snapshot()
+    return True
+
+####################################################################################################
+# SQLITE BACKEND
+####################################################################################################
+
+##################################################
+# FUNCTION: save The Collection into the database
+##################################################
+def save_collection_database():
+    """
+    Write books, folders and quotes of the freshly built Collection into a
+    new database file, with an FTS5 table over the tokens of the quotes.
+    """
+    global Library_Source
+    try:
+        stat = os.stat(LIBRARY_FILE)
+        Library_Source = (stat.st_size, stat.st_mtime_ns, compute_file_hash(LIBRARY_FILE))
+    except OSError:
+        return False
+
+    database_path = get_cache_path(DATABASE_CACHE_NAME)
+    temp_path = f"{database_path}.tmp"
+    try:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        connection = sqlite3.connect(temp_path)
+        with connection:
+            create_database_tables(connection)
+            connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("format_version", DATABASE_FORMAT_VERSION),
+                ("source", json.dumps(Library_Source)),
+                ("collection", json.dumps({"authors": Authors, "titles": Titles, "centuries": Centuries,
+                                           "counts": [All_Quotes_Count, Short_Quotes_Count],
+                                           "ratings_available": Ratings_Available}))
+                ])
+            connection.executemany("INSERT INTO folders VALUES (?, ?)",
+                                   [(folder, file_id) for folder, file_ids in Folders.items() for file_id in file_ids])
+            connection.executemany(f"INSERT INTO books VALUES ({', '.join('?' * (len(SNAPSHOT_BOOK_FIELDS) + 4))})",
+                                   ([position] + [to_database_value(field, getattr(book, field)) for field in SNAPSHOT_BOOK_FIELDS] +
+                                    [book.q_start, book.long_q_count, book.total_short_q]
+                                    for position, book in enumerate(The_Collection)))
+            store = Quote_Store
+            connection.executemany("INSERT INTO quotes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   ((quote_id, store.book_ids[quote_id], store.pages[quote_id], store.insert_times[quote_id],
+                                     store.lengths[quote_id], len(tokenize(text)), text)
+                                    for quote_id, text in enumerate(store.texts)))
+            # the FTS5 table gets the tokens, so it splits words like tokenize()
+            connection.executemany("INSERT INTO quotes_fts (rowid, text) VALUES (?, ?)",
+                                   ((quote_id, ' '.join(tokenize(text))) for quote_id, text in enumerate(store.texts)))
+        connection.close()
+        os.replace(temp_path, database_path)
+        return True
+    except (OSError, sqlite3.Error):
+        # the database is optional, the collection stays in memory
+        return False
+
+##################################################
+# FUNCTION: create the tables of the database
+##################################################
+def create_database_tables(connection):
+    book_columns = ', '.join(SNAPSHOT_BOOK_FIELDS)
+    connection.executescript(f"""
+        CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+        CREATE TABLE folders (name TEXT, file_id TEXT);
+        CREATE TABLE books (id INTEGER PRIMARY KEY, {book_columns}, q_start, long_q_count, short_q_count);
+        CREATE TABLE quotes (id INTEGER PRIMARY KEY, book_id INTEGER, page INTEGER, insert_time INTEGER,
+                             length INTEGER, tokens INTEGER, text TEXT);
+        CREATE INDEX quotes_book ON quotes (book_id);
+        CREATE INDEX books_author ON books (author);
+        CREATE INDEX books_folder ON books (folder);
+        CREATE VIRTUAL TABLE quotes_fts USING fts5 (text, content='', tokenize="unicode61 remove_diacritics 0 tokenchars '_'");
+        CREATE VIRTUAL TABLE quotes_terms USING fts5vocab (quotes_fts, 'row');
+        CREATE VIRTUAL TABLE quotes_instances USING fts5vocab (quotes_fts, 'instance');
+        """)
+
+def to_database_value(field, value):
+    # dates are stored as ISO text
+    return value.isoformat() if field in DATABASE_DATE_FIELDS else value
+
+def from_database_value(field, value):
+    return datetime.datetime.fromisoformat(value) if field in DATABASE_DATE_FIELDS else value
+
+##################################################
+# FUNCTION: load The Collection from the database
+##################################################
+def load_collection_database():
+    """
+    Load the books from the database and keep the quotes in it, return
+    False if the database is missing, has another format version or is stale.
+    """
+    global The_Collection
+    global All_Quotes_Count
+    global Short_Quotes_Count
+    global Authors
+    global Titles
+    global Centuries
+    global Ratings_Available
+    global Library_Source
+    global Quote_Store
+    global Database
+
+    database_path = get_cache_path(DATABASE_CACHE_NAME)
+    if not os.path.exists(database_path):
+        return False
+    try:
+        connection = sqlite3.connect(database_path, check_same_thread=False)
+        meta = dict(connection.execute("SELECT key, value FROM meta"))
+        source = tuple(json.loads(meta["source"]))
+        if meta["format_version"] != DATABASE_FORMAT_VERSION or check_library_source(source) is None:
+            connection.close()
+            return False
+
+        books = []
+        for row in connection.execute("SELECT * FROM books ORDER BY id"):
+            book = Book(row[1])
+            for field, value in zip(SNAPSHOT_BOOK_FIELDS, row[1:]):
+                setattr(book, field, from_database_value(field, value))
+            book.q_start, book.long_q_count, book.total_short_q = row[-3:]
+            books.append(book)
+        folders = {}
+        for folder, file_id in connection.execute("SELECT name, file_id FROM folders"):
+            folders.setdefault(folder, set()).add(file_id)
+        collection = json.loads(meta["collection"])
+        store = SqliteQuoteStore(connection)
+    except (sqlite3.Error, KeyError, ValueError, TypeError):
+        return False
+
+    for book in books:
+        book.store = store
+    The_Collection = books
+    Quote_Store = store
+    Database = connection
+    Folders.clear()
+    Folders.update(folders)
+    Authors = collection["authors"]
+    Titles = collection["titles"]
+    Centuries = collection["centuries"]
+    All_Quotes_Count, Short_Quotes_Count = collection["counts"]
+    Ratings_Available = collection["ratings_available"]
+    Library_Source = source
+    prepare_derived_structures()
+    return True
+
+####################################################################################################
+# WATCH MODE
+####################################################################################################
+
+##################################################
+# FUNCTION: hash the source text of a doc
+##################################################
+def get_doc_fingerprint(raw_doc):
+    return hashlib.blake2b(raw_doc.encode("utf8"), digest_size=16).digest()
+
+##################################################
+# FUNCTION: get size and modification time of the library
+##################################################
+def get_library_stat():
+    try:
+        stat = os.stat(LIBRARY_FILE)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+##################################################
+# FUNCTION: start watching the library file
+##################################################
+def watch_the_library():
+    """
+    Turn on watch mode, must be called before the collection is loaded,
+    so the docs are fingerprinted while they are read.
+    """
+    global Doc_Fingerprints
+    global Watched_Library_Stat
+    Doc_Fingerprints = {}
+    Watched_Library_Stat = get_library_stat()
+
+##################################################
+# FUNCTION: fingerprint the docs of the library file
+##################################################
+def read_doc_fingerprints():
+    """
+    Return the fingerprint and source length of every doc of the library
+    file by uri, in file order, without building the books.
+    """
+    fingerprints = {}
+    with open_library_file(LIBRARY_FILE) as file:
+        reader = JsonStreamReader(file, keep_raw=True)
+        for key, value in reader.iter_object(streamed_keys=("docs",)):
+            if key == "docs":
+                fingerprints[value['uri']] = get_doc_fingerprint(reader.raw_value), len(reader.raw_value)
+    return fingerprints
+
+##################################################
+# FUNCTION: reload the library file if it changed
+##################################################
+def check_library_changes(backend="memory"):
+    """
+    Poll the library file (one stat call), reload it if it changed and
+    return a note about the reload, None if nothing happened.
+    """
+    global Watched_Library_Stat
+    library_stat = get_library_stat()
+    if library_stat is None or library_stat == Watched_Library_Stat:
+        return None
+
+    start = time.perf_counter()
+    try:
+        if backend == "sqlite":
+            # the database is written from a full build, which exits on a
+            # broken file, so the file is decoded once before
+            with open_library_file(LIBRARY_FILE) as file:
+                for _ in JsonStreamReader(file).iter_object():
+                    pass
+            load_the_collection(backend=backend)
+            note = f"{len(The_Collection)} books reloaded"
+        else:
+            added, changed, removed = reload_changed_docs()
+            note = f"{added} books added, {changed} changed, {removed} removed"
+    except (OSError, json.JSONDecodeError, zipfile.BadZipFile, KeyError, TypeError) as e:
+        # the file may still be being written, it is read again at the next check
+        return f"{LIBRARY_FILE} changed, but it could not be read: {e}"
+    Watched_Library_Stat = library_stat
+    return f"{LIBRARY_FILE} changed: {note} ({(time.perf_counter() - start) * 1000:.0f} ms)"
+
+##################################################
+# FUNCTION: rebuild the books of changed docs
+##################################################
+def reload_changed_docs():
+    """
+    Read the library file again and build only the books whose doc has
+    another fingerprint, the other books are kept. The global lists,
+    counts and derived structures are updated in place.
+    Return the number of added, changed and removed books.
+    """
+    global The_Collection
+    global Quote_Store
+    global Library_Source
+
+    # the docs are expected in the order of the last read, a doc with the
+    # same source text is only hashed, the others are decoded
+    known_docs = list(Doc_Fingerprints.items())
+    known_positions = {uri: position for position, (uri, _) in enumerate(known_docs)}
+    next_known = 0
+    fingerprints, folders, changed_docs = {}, {}, []
+
+    def skip_unchanged_doc(reader):
+        nonlocal next_known
+        if next_known >= len(known_docs):
+            return False
+        uri, (fingerprint, length) = known_docs[next_known]
+        if not reader.skip_value(length, lambda raw_doc: get_doc_fingerprint(raw_doc) == fingerprint):
+            return False
+        fingerprints[uri] = fingerprint, length
+        next_known += 1
+        return True
+
+    with open_library_file(LIBRARY_FILE) as file:
+        reader = JsonStreamReader(file, keep_raw=True)
+        for key, value in reader.iter_object(streamed_keys=("docs",), skip=skip_unchanged_doc):
+            if key == "docs" and value is not None:
+                uri = value['uri']
+                fingerprints[uri] = get_doc_fingerprint(reader.raw_value), len(reader.raw_value)
+                if Doc_Fingerprints.get(uri) != fingerprints[uri]:
+                    changed_docs.append(value)
+                # continue after a known doc, a new one changes nothing
+                next_known = known_positions.get(uri, next_known - 1) + 1
+            elif key == "colls":
+                folders = {coll['data']['coll_title']: set(coll['docs']) for coll in value}
+
+    removed_uris = Doc_Fingerprints.keys() - fingerprints.keys()
+    if not changed_docs and not removed_uris and folders == Folders:
+        return 0, 0, 0
+
+    # the new books keep their quotes in a store of their own until the merge
+    new_store = QuoteStore()
+    new_books = [book for book in (create_book(doc, new_store) for doc in changed_docs) if book]
+    stale_uris = removed_uris | {doc['uri'] for doc in changed_docs}
+    books = [book for book in The_Collection if book.file_id not in stale_uris] + new_books
+
+    # same order as a full build: by title, equal titles in file order
+    doc_positions = {uri: position for position, uri in enumerate(fingerprints)}
+    books.sort(key=lambda book: (book.title, doc_positions[book.file_id]))
+    old_uris = {book.file_id for book in The_Collection} & stale_uris
+    new_uris = {book.file_id for book in new_books}
+    The_Collection = books
+    Quote_Store = QuoteStore()
+    Quote_Store.reorder(The_Collection)
+
+    Folders.clear()
+    Folders.update(folders)
+    Doc_Fingerprints.clear()
+    Doc_Fingerprints.update(fingerprints)
+    aggregate_the_collection()
+    prepare_derived_structures()
+
+    # the cache files belong to the old file, the snapshot of the new one
+    # is written at exit
+    if Library_Source:
+        Library_Source = None
+        atexit.unregister(save_collection_snapshot)
+        atexit.register(save_collection_snapshot)
+    return len(new_uris - old_uris), len(new_uris & old_uris), len(old_uris - new_uris)
+
+####################################################################################################
+# SEEN QUOTES
+####################################################################################################
+
+##################################################
+# FUNCTION: get the stable id of a quote
+##################################################
+def get_stable_quote_id(uri, insert_time):
+    # the same quote keeps its id across sessions and library files
+    digest = hashlib.blake2b(f"{uri}\n{insert_time}".encode("utf8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+##################################################
+# FUNCTION: get the seen quotes (read on first use)
+##################################################
+def get_seen_quotes():
+    global Seen_Quotes
+    if Seen_Quotes is None and Seen_History_Enabled:
+        Seen_Quotes = SeenQuotes(The_Collection, Quote_Store, read_cache_file(SEEN_CACHE_NAME, SEEN_FORMAT_VERSION))
+    return Seen_Quotes
+
+##################################################
+# FUNCTION: record a shown quote
+##################################################
+def record_shown_quote(book, quote):
+    seen_quotes = get_seen_quotes()
+    if seen_quotes:
+        seen_quotes.record(book, quote)
+
+##################################################
+# FUNCTION: save the shown quotes
+##################################################
+def save_seen_quotes():
+    # the file is read again, another session may have saved it meanwhile
+    if Seen_Quotes and Seen_Quotes.shown:
+        state = Seen_Quotes.merge_into(read_cache_file(SEEN_CACHE_NAME, SEEN_FORMAT_VERSION))
+        write_cache_file(SEEN_CACHE_NAME, state, SEEN_FORMAT_VERSION)
+
+##################################################
+# FUNCTION: create a random quote sampler
+##################################################
+def create_quote_sampler(books, length):
+    seen_quotes = get_seen_quotes() if Prefer_Quotes != "any" else None
+    return QuoteSampler(books, length, Sampling_Mode, Prefer_Quotes, seen_quotes.last_shown if seen_quotes else None)
+
+####################################################################################################
+# LIBRARY HISTORY
+####################################################################################################
+
+##################################################
+# FUNCTION: read the summary of a library file
+##################################################
+def read_library_summary(path, known_summaries, previous=None):
+    """
+    Return {uri: doc fingerprint}, {uri: doc source length} of a library
+    file and the summaries of the docs not in known_summaries. The
+    fingerprint is the hash of the doc source text. The docs of previous
+    (fingerprints and lengths of another file) are expected in the same
+    order, such a doc with the same source text is only hashed, not decoded.
+    """
+    known_docs, known_lengths = previous or ({}, {})
+    known = [(uri, fingerprint, known_lengths[uri]) for uri, fingerprint in known_docs.items()
+             if uri in known_lengths and fingerprint in known_summaries]
+    known_positions = {uri: position for position, (uri, _, _) in enumerate(known)}
+    next_known = 0
+    docs, lengths, new_summaries = {}, {}, {}
+
+    def skip_known_doc(reader):
+        nonlocal next_known
+        if next_known >= len(known):
+            return False
+        uri, fingerprint, length = known[next_known]
+        if not reader.skip_value(length, lambda raw_doc: get_doc_fingerprint(raw_doc) == fingerprint):
+            return False
+        docs[uri], lengths[uri] = fingerprint, length
+        next_known += 1
+        return True
+
+    with open_library_file(path) as file:
+        reader = JsonStreamReader(file, keep_raw=True)
+        for key, value in reader.iter_object(streamed_keys=("docs",), skip=skip_known_doc):
+            if key != "docs" or value is None:
+                continue
+            uri = value['uri']
+            fingerprint = docs[uri] = get_doc_fingerprint(reader.raw_value)
+            lengths[uri] = len(reader.raw_value)
+            if fingerprint not in known_summaries and fingerprint not in new_summaries:
+                new_summaries[fingerprint] = get_doc_summary(value)
+            # continue after a known doc, a new one changes nothing
+            next_known = known_positions.get(uri, next_known - 1) + 1
+    return docs, lengths, new_summaries
+
+##################################################
+# FUNCTION: get the summary of a doc
+##################################################
+def get_doc_summary(doc):
+    """
+    Return (title, active, have read, reading now, quotes) of a doc, the
+    quotes map the insert time of a citation to its (page, text).
+    """
+    data = doc['data']
+    have_read = data.get('doc_have_read_time') != 0
+    reading_now = bool(data.get('doc_activity_time')) and not have_read
+    quotes = {citation['note_insert_time']: (citation['note_page'], citation['note_body'])
+              for citation in doc.get('citations', [])}
+    return get_book_title(doc), data.get('doc_active') == 1, have_read, reading_now, quotes
+
+##################################################
+# FUNCTION: load the history store
+##################################################
+def load_history():
+    """
+    The history keeps every added library file as {uri: fingerprint} and
+    every doc summary once per fingerprint, unchanged docs are shared.
+    """
+    return read_cache_file(HISTORY_CACHE_NAME, HISTORY_FORMAT_VERSION) or {"snapshots": [], "summaries": {}}
+
+##################################################
+# FUNCTION: get the docs of a library file
+##################################################
+def get_library_docs(path, history, previous=None):
+    """
+    Return {uri: fingerprint}, {uri: doc source length} and the content
+    hash of a library file, a file already in the history (same content
+    hash) is not read again. The unchanged docs of previous (the docs and
+    lengths of a file read before, by default the last stored one) are
+    not decoded. New summaries are added to the history.
+    """
+    content_hash = compute_file_hash(path)
+    for snapshot in history["snapshots"]:
+        if snapshot["hash"] == content_hash:
+            return snapshot["docs"], snapshot.get("lengths", {}), content_hash
+    # files stored before the lengths were kept are decoded completely
+    if previous is None and history["snapshots"]:
+        previous = history["snapshots"][-1]["docs"], history["snapshots"][-1].get("lengths", {})
+    docs, lengths, new_summaries = read_library_summary(path, history["summaries"], previous)
+    history["summaries"].update(new_summaries)
+    return docs, lengths, content_hash
+
+##################################################
+# FUNCTION: compare two library files
+##################################################
+def diff_library_docs(old_docs, new_docs, summaries):
+    """
+    Return the changes from old to new as (change, uri, title, detail)
+    tuples, only the docs with another fingerprint are compared.
+    """
+    changes = []
+    changed_uris = {uri for uri, _ in set(old_docs.items()) ^ set(new_docs.items())}
+    for uri in sorted(changed_uris):
+        old = summaries[old_docs[uri]] if uri in old_docs else None
+        new = summaries[new_docs[uri]] if uri in new_docs else None
+        if old is None or new is None:
+            change = "book added" if old is None else "book removed"
+            title, _, _, _, quotes = new or old
+            changes.append((change, uri, title, f"{len(quotes)} quotes"))
+            continue
+
+        old_title, old_active, old_have_read, old_reading_now, old_quotes = old
+        title, active, have_read, reading_now, quotes = new
+        if old_title != title:
+            changes.append(("book changed", uri, title, f"renamed from {old_title}"))
+        for name, old_value, value in (("active", old_active, active), ("have read", old_have_read, have_read),
+                                       ("reading now", old_reading_now, reading_now)):
+            if old_value != value:
+                changes.append(("status", uri, title, f"{name}: {old_value} -> {value}"))
+
+        # citations are matched by their insert time
+        for insert_time in sorted(old_quotes.keys() | quotes.keys()):
+            old_quote, quote = old_quotes.get(insert_time), quotes.get(insert_time)
+            if old_quote == quote:
+                continue
+            if old_quote is None:
+                changes.append(("quote added", uri, title, f"p.{quote[0]}: {quote[1]}"))
+            elif quote is None:
+                changes.append(("quote removed", uri, title, f"p.{old_quote[0]}: {old_quote[1]}"))
+            else:
+                changes.append(("quote changed", uri, title, f"p.{quote[0]}: {quote[1]}"))
+    return changes
+
+##################################################
+# FUNCTION: count the quotes of the history by week
+##################################################
+def get_weekly_quote_counts(history):
+    """
+    Return [(ISO week, quotes)] of every quote seen in any snapshot of
+    the history, by the week of its insert time.
+    """
+    # a quote is counted once, whichever snapshots it appears in
+    seen = set()
+    for snapshot in history["snapshots"]:
+        for uri, fingerprint in snapshot["docs"].items():
+            seen.update((uri, insert_time) for insert_time in history["summaries"][fingerprint][4])
+
+    weeks = Counter()
+    for _, insert_time in seen:
+        year, week, _ = datetime.datetime.fromtimestamp(insert_time / 1000).isocalendar()
+        weeks[f"{year}-W{week:02d}"] += 1
+    return sorted(weeks.items())
+
+##################################################
+# FUNCTION: time a phase if --timings is on
+##################################################
+def timed_phase(name):
+    return Phase_Timer.phase(name) if Phase_Timer else contextlib.nullcontext()
+
+##################################################
+# FUNCTION: turn on timings and profiling
+##################################################
+def enable_instrumentation(timings=False, profile_path=None, memory_dump_path=None):
+    """
+    Set up the --timings, --profile and --memory-dump outputs, they are
+    written when the program exits (also from the menu).
+    """
+    global Phase_Timer
+    module = sys.modules[__name__]
+    if timings:
+        Phase_Timer = PhaseTimer(name for name, _, _ in TIMED_FUNCTIONS)
+        for name, owner, attribute in TIMED_FUNCTIONS:
+            if attribute:
+                Phase_Timer.wrap(owner if owner is not None else module, attribute, name)
+        Phase_Timer.wrap_input(vars(module))
+        atexit.register(Phase_Timer.report)
+
+    if profile_path:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def write_profile():
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            sys.stderr.write(f"cProfile stats written to {profile_path} (python -m pstats {profile_path})\n")
+        atexit.register(write_profile)
+
+    if memory_dump_path:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        def write_memory_dump():
+            tracemalloc.take_snapshot().dump(memory_dump_path)
+            sys.stderr.write(f"tracemalloc snapshot written to {memory_dump_path} (tracemalloc.Snapshot.load)\n")
+        atexit.register(write_memory_dump)
+
+##################################################
+# FUNCTION: measure time and memory of the build
 ##################################################
-def build_the_collection():
-    # these are in the global scope, indicate global to be able to modify
-    global The_Collection
-    global All_Quotes_Count
-    global Short_Quotes_Count
-    global Authors
-    global Titles
-    global Centuries
-    global Ratings_Available
-    
-    # reset globals
-    The_Collection = []
-    All_Quotes_Count = 0
-    Short_Quotes_Count = 0
-    Authors = set()
-    Titles = []
-    Centuries = set()
-    Ratings_Available = False  
+def measure_collection_build(parser):
+    """
+    Build The Collection with the given parser, return the elapsed
+    seconds, the peak and the retained traced memory in bytes.
+    """
+    # an active trace (--memory-dump) is kept, the build is measured from its current size
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    build_the_collection(parser)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    if started_tracing:
+        tracemalloc.stop()
+    return elapsed, peak - before, retained - before
 
-    # open and read the JSON file
-    try:
-        with open('library.json', 'r', encoding="utf8") as file:
-            data = json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Error reading JSON file: {e}")
-        sys.exit(1)
+##################################################
+# FUNCTION: get the size of the quote columns
+##################################################
+def get_quote_store_overhead():
+    """
+    Return the bytes per quote used by the store besides the texts
+    (the text list slots and the typed columns).
+    """
+    if not Quote_Store:
+        return 0.0
+    size = sys.getsizeof(Quote_Store.texts)
+    for column in (Quote_Store.pages, Quote_Store.insert_times, Quote_Store.lengths, Quote_Store.book_ids):
+        size += sys.getsizeof(column)
+    return size / len(Quote_Store)
 
-    # get the folders dictionary, each value will be a set of book IDs
-    for coll in data['colls']:
-        Folders[coll['data']['coll_title']] = set(coll['docs'])
+##################################################
+# FUNCTION: parse command line arguments
+##################################################
+def parse_arguments():
+    arg_parser = argparse.ArgumentParser(description="Explore books and quotes of a ReadEra backup. "
+                                         "Without a command the interactive menu starts.")
+    arg_parser.add_argument("--library", default=LIBRARY_FILE, metavar="PATH",
+                            help="library.json or a ReadEra .bak backup file (default: %(default)s)")
+    arg_parser.add_argument("--parser", choices=["stream", "full", "parallel"], default="stream",
+                            help="read library.json doc by doc (default), in one piece or in worker processes")
+    arg_parser.add_argument("--parse-workers", type=int, default=0, metavar="N",
+                            help="processes of --parser parallel (default: one per CPU)")
+    arg_parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory",
+                            help="keep the quotes in memory (default) or in a SQLite database with full-text search")
+    arg_parser.add_argument("--timings", action="store_true",
+                            help="print wall time and allocated memory of every phase and menu action at exit")
+    arg_parser.add_argument("--profile", metavar="FILE", help="write cProfile stats of the whole run to FILE")
+    arg_parser.add_argument("--memory-dump", metavar="FILE", help="write a tracemalloc snapshot to FILE at exit")
+    arg_parser.add_argument("--memory-report", action="store_true",
+                            help="build The Collection, print time and peak memory, then exit")
+    arg_parser.add_argument("--sampling", choices=["quotes", "books"], default="quotes",
+                            help="random quotes are equally likely (default) or books are equally likely")
+    arg_parser.add_argument("--prefer", choices=["any", "unseen", "least-recent"], default="any",
+                            help="random quotes: any quote (default), quotes never shown before first, "
+                            "or the quotes shown the longest ago first")
+    arg_parser.add_argument("--no-seen-history", action="store_true",
+                            help=f"do not read or record the shown quotes ({LIBRARY_FILE}.{SEEN_CACHE_NAME})")
+    arg_parser.add_argument("--fuzzy-distance", type=int, default=Fuzzy_Distance,
+                            help="maximum number of typos in similar word search (default: %(default)s)")
+    arg_parser.add_argument("--no-snapshot", action="store_true",
+                            help="always build from library.json, do not read or write the snapshot and index files")
+    arg_parser.add_argument("--watch", action="store_true",
+                            help="reload the changed books when the library file changes while the menu is open")
+    arg_parser.add_argument("--no-pager", action="store_true",
+                            help="do not stop long Search, List and every-quote outputs after each screen")
+    phrase_group = arg_parser.add_mutually_exclusive_group()
+    phrase_group.add_argument("--phrase-counters", type=int, default=Phrase_Counters, metavar="N",
+                              help="counters of the phrase statistics per phrase size, more counters use more "
+                              "memory and give exact counts more often (default: %(default)s)")
+    phrase_group.add_argument("--phrase-error", type=float, metavar="E",
+                              help="counters for phrase counts at most E times the number of phrases too low "
+                              "(e.g. 0.0001), instead of --phrase-counters")
 
-    for doc in data['docs']:
-        if doc['data']['doc_active'] == 1:
-            # Use regex to remove non-alphabet characters from the beginning of the title
-            book_title = re.sub(r"^[^a-zA-Z]+", "", doc['data']['doc_file_name_title'])
+    subparsers = arg_parser.add_subparsers(dest="command", metavar="command")
+    add_command_parsers(subparsers)
+    batch_parser = subparsers.add_parser("batch", help="run commands read from stdin (one per line), "
+                                         "print one JSON line per command")
+    batch_parser.set_defaults(format="json")
+    args = arg_parser.parse_args()
 
-            # handle renamed books, book_title is the default return
-            book_title = BOOK_RENAME_DICTIONARY.get(book_title, book_title)
+    # the phrase statistics need at least one counter and an error below 1
+    if args.phrase_counters < 1:
+        arg_parser.error(f"--phrase-counters must be at least 1, not {args.phrase_counters}")
+    if args.phrase_error is not None and not 0 < args.phrase_error < 1:
+        arg_parser.error(f"--phrase-error must be between 0 and 1, not {args.phrase_error}")
+    return args
 
-            # add the book to The Collection (which is a list of instances)
-            this_book = Book(book_title)
-            The_Collection.append(this_book)
+##################################################
+# FUNCTION: add the parsers of the headless commands
+##################################################
+def add_command_parsers(subparsers):
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument("--format", choices=["json", "tsv"], default="json",
+                               help="output format (default: json)")
 
-            # store additional data
-            this_book.file_id = doc['uri']
-            this_book.author = doc['data'].get('user_authors') or doc['data'].get('doc_authors')
-            this_book.annotation = doc['data'].get('doc_annotation', "")
-
-            # store file date as a date object, activity time as a simple timestamp
-            aux_date = datetime.datetime.fromtimestamp(doc['data'].get('file_modified_time') / 1000)
-            this_book.file_modified_time = aux_date
-            this_book.activity_time = doc['data'].get('doc_activity_time')
-
-            # get the folder, if available
-            if Folders:
-                for folder, ids in Folders.items():
-                    if this_book.file_id in ids:
-                        this_book.folder = folder
-                        break
+    subparsers.add_parser("stats", parents=[output_parser], help="statistics of The Collection")
 
-            # get pages count if available
-            try:
-                doc_data = json.loads(doc['data']['doc_position'])
-                this_book.pages_count = doc_data['pagesCount']
-            except (KeyError, ValueError, IndexError, TypeError, AttributeError):
-                this_book.pages_count = 0
+    phrases_parser = subparsers.add_parser("phrases", parents=[output_parser],
+                                           help="most frequent phrases of 2 and 3 words")
+    phrases_group = phrases_parser.add_mutually_exclusive_group()
+    phrases_group.add_argument("--author")
+    phrases_group.add_argument("--folder")
+    phrases_parser.add_argument("--top", type=int, default=30, metavar="N")
 
-            # get goodreads data if available
-            try:
-                review_note = doc['reviews'][0]['note_body']
-                this_book.published_date = int(review_note.split(';')[0].strip())
-                this_book.rating = float(review_note.split(';')[1].strip())
-                this_book.ratings_count = float(review_note.split(';')[2].strip().replace('k', '.'))
-            except (KeyError, ValueError, IndexError, TypeError, AttributeError):
-                this_book.published_date = 0
-                this_book.rating = 0.0
-                this_book.ratings_count = 0.0
-
-            # get the citations
-            if len(doc['citations']) > 0:
-                quote_dates = []
-                for citation in doc['citations']:
-                    q_is_long = len(citation['note_body']) > MAX_CHAR_IN_SHORT_QUOTE
-                    this_book.add_quote(citation['note_body'], citation['note_page'], q_is_long)
-                    quote_dates.append(citation['note_insert_time'])
-
-                # sort the dates list to easily access first and last, convert to seconds
-                quote_dates.sort()
-                this_book.first_q_date = quote_dates[0] / 1000
-                this_book.last_q_date = quote_dates[-1] / 1000
-
-                # calculate the q/p ratio, avoid division by zero
-                if this_book.pages_count > 0:
-                    this_book.q_per_page = this_book.total_q / this_book.pages_count
-
-            # check if current doc was finished or not
-            if doc['data'].get('doc_have_read_time') != 0:
-                if this_book.title in EXCEPTION_TITLES_FOR_READ_DATE:
-                    # Dec 23, 2025 07:00:00 AM GMT+01:00
-                    aux_date = datetime.datetime.fromtimestamp(1766473200)
-                elif ((this_book.last_q_date - this_book.first_q_date) > ONE_DAY_IN_SECONDS and
-                       this_book.title not in EXCLUDED_TITLES_FROM_READ_DATE ):
-                    # use last quote date if available
-                    aux_date = datetime.datetime.fromtimestamp(this_book.last_q_date)
-                else:
-                    # use default date
-                    # # Dec 23, 2025 07:00:00 AM GMT+01:00
-                    aux_date = datetime.datetime.fromtimestamp(1766473200)
-            else:
-                aux_date = datetime.datetime.fromtimestamp(0)
+    search_parser = subparsers.add_parser("search", parents=[output_parser], help="search quotes (same syntax as the menu)")
+    search_parser.add_argument("query")
 
-            # add the constructed date
-            this_book.have_read_time = aux_date
+    list_parser = subparsers.add_parser("list", parents=[output_parser], help="list books by a property")
+    list_parser.add_argument("--by", required=True, choices=list(LIST_PROPERTY_NAMES))
+    list_parser.add_argument("--folder")
+    list_parser.add_argument("--century", type=int)
+    list_parser.add_argument("--top", type=int, metavar="N", help="only the first N books")
 
-    # gather titles, authors and quote counts
-    for book in The_Collection:
-        if book.total_q > 0:
-            if book.author:
-                Authors.add(book.author)
-            Titles.append(book.title)
+    random_parser = subparsers.add_parser("random", parents=[output_parser], help="random quotes without repetition")
+    random_parser.add_argument("--author")
+    random_parser.add_argument("--folder")
+    random_parser.add_argument("--length", choices=["any", "short"], default="any")
+    random_parser.add_argument("--count", type=int, default=1)
+    random_parser.add_argument("--seed", type=int)
 
-        All_Quotes_Count += book.total_q
-        Short_Quotes_Count += book.total_short_q
+    similar_parser = subparsers.add_parser("similar", parents=[output_parser],
+                                           help="quotes most like a quote of a book (TF-IDF cosine similarity)")
+    similar_parser.add_argument("--book", required=True, help="exact title of the book")
+    similar_parser.add_argument("--number", type=int, required=True, help="number of the quote, as listed by export")
+    similar_parser.add_argument("--top", type=int, default=10, metavar="N")
+    similar_parser.add_argument("--same-book", action="store_true", help="also quotes of the same book")
 
-        # check and process goodreads data
-        if book.published_date != 0:
-            century = int(book.published_date / 100) + 1
-            if century not in Centuries:
-                Centuries.add(century)
-        if book.rating > 0.0:
-            Ratings_Available = True
-            
-    # "arrays" are ready, convert to list
-    Authors = sorted(list(Authors))
-    Titles = sorted(Titles)
-    Centuries = list(Centuries)
+    export_parser = subparsers.add_parser("export", parents=[output_parser], help="every quote of a book in page order")
+    export_parser.add_argument("--book", required=True, help="exact title of the book")
+    export_parser.add_argument("--txt", metavar="PATH", help="also write the quotes to a txt file like the menu")
 
-    # alphabetical order by title
-    The_Collection.sort(key=lambda book: book.title)
+    diff_parser = subparsers.add_parser("diff", parents=[output_parser],
+                                        help="added / removed / changed books, quotes and statuses between library files")
+    diff_parser.add_argument("files", nargs="+", metavar="FILE", help="two or more library files, oldest first")
+
+    history_parser = subparsers.add_parser("history", parents=[output_parser],
+                                           help=f"history store of library files ({LIBRARY_FILE}.{HISTORY_CACHE_NAME})")
+    history_parser.add_argument("action", choices=["add", "list", "weekly", "diff"],
+                                help="add files / list the stored files / quotes per week / changes between the stored files")
+    history_parser.add_argument("files", nargs="*", metavar="FILE", help="library files to add")
+
+    export_all_parser = subparsers.add_parser("export-all", parents=[output_parser],
+                                              help="write the quotes of every book (with quotes) into a directory, one file per book")
+    export_all_parser.add_argument("--to", required=True, metavar="DIR")
+    export_all_parser.add_argument("--as", dest="export_format", choices=list(EXPORT_EXTENSIONS), default="txt")
+    export_all_parser.add_argument("--author")
+    export_all_parser.add_argument("--folder")
+    export_all_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    export_all_parser.add_argument("--pool", choices=["thread", "process"], default="thread")
 
 ##################################################
 # FUNCTION: get terminal width function def.
@@ -327,11 +3521,8 @@ def get_terminal_columns():
     """
     Return the current column size of the terminal window.
     """
-    try:
-        return os.get_terminal_size().columns
-    except OSError:
-        # Fallback to a default column size
-        return 90
+    # read at the start and on every resize, no system call per line
+    return Terminal.columns
 
 ##################################################
 # FUNCTION: print separator using hyphens
@@ -343,11 +3534,10 @@ def print_separator_line():
 # FUNCTION: print options menu
 ##################################################
 def print_options():
+    # keys are right aligned once there are ten or more options
+    width = max(len(key) for key in Options_Menu)
     for key, value in Options_Menu.items():
-        if key.isdigit():
-            print(f" {int(key)}  -->  {value}")
-        else:
-            print(f" {key}  -->  {value}")
+        print(f" {key:>{width}}  -->  {value}")
 
 ##################################################
 # FUNCTION: get option
@@ -384,55 +3574,71 @@ def get_option():
 def print_quote_count(count):
     string = f"Random selection from {count} quotes"
     print(f"{string}\n{'-' * len(string)}\n")
+    print("Enter: next quote, m: more like this, x: exit\n")
 
 
 ##################################################
 # FUNCTION: print random quotes
 ##################################################
-def print_random_quotes(books, method, print_title=True):
+def print_random_quotes(books, length, print_title=True):
+    sampler = create_quote_sampler(books, length)
     while True:
-        # random book for every iteration (or same book for a single-element list)
-        book = random.choice(books)
-        random_quote, quotes_left = getattr(book, method)()
+        drawn = sampler.draw()
 
-        # get random returns None if there is no more quote left in that book
-        if random_quote:
-            print_wrapped_text(random_quote.text)
+        # draw returns None if there is no more quote left in the books
+        if not drawn:
+            input("All quotes were printed.")
+            return
 
-            # "delay" title print, but exit immediately if requested
-            if is_exit_requested():
-                return
+        book, random_quote, quotes_left = drawn
+        record_shown_quote(book, random_quote)
+        print_wrapped_text(random_quote.text)
 
-            # print the "delayed" title if needed
-            if print_title:
-                print(f"{book.title}   / {quotes_left} left /")
-                print(f"{'-' * len(book.title)}")
-                if is_exit_requested():
-                    return
+        # "delay" title print, but exit immediately if requested
+        if is_exit_requested(None if print_title else (book, random_quote)):
+            return
 
-            # separate printed title from the next quote
-            print('\n')
-        else:
-            # refresh the list if no more quote is in the book
-            books.remove(book)
+        # print the "delayed" title if needed
+        if print_title:
+            print(f"{book.title}   / {quotes_left} left /")
+            print(f"{'-' * len(book.title)}")
+            if is_exit_requested((book, random_quote)):
+                return
 
-        if not books:
-            input("All quotes were printed.")
-            return
+        # separate printed title from the next quote
+        print('\n')
 
 ##################################################
 # FUNCTION: check exit request ('x')
 ##################################################
-def is_exit_requested():
+def is_exit_requested(shown_quote=None):
     response = input()
+    # 'm' prints the quotes most like the shown (book, quote), then waits again
+    while shown_quote and response[:1] == 'm':
+        print_similar_quotes(*shown_quote)
+        response = input()
     return response and response[0] == 'x'
 
+##################################################
+# FUNCTION: print the quotes most like a quote
+##################################################
+def print_similar_quotes(book, quote):
+    string = "More like this"
+    print(f"\n{string}\n{'-' * len(string)}")
+    similar_quotes = find_similar_quotes(book, quote, SIMILAR_QUOTES_COUNT)
+    for similar_book, similar_quote, similarity in similar_quotes:
+        print_wrapped_text(similar_quote.text)
+        print(f"  -->  {similarity:.2f}  /  {similar_book.title}  (p.{similar_quote.page})\n")
+    if not similar_quotes:
+        print("No similar quote found.\n")
+
 
 ##################################################
 # FUNCTION: print wrapped text
 ##################################################
 def print_wrapped_text(text):
-    print(*textwrap.wrap(f"{text}\n", get_terminal_columns() - 1), sep='\n')
+    Terminal.print_wrapped(text, end='')
+    Terminal.flush()
 
 
 ##################################################
@@ -485,9 +3691,9 @@ def choose_a_book(attr):
     print(" 0.  -->  random book")
 
     if attr == "with_quotes":
-        books = [book for book in The_Collection if book.total_q > 0]
+        books = Collection_Index.get_books(Collection_Index.with_quotes)
     elif attr == "with_annotation":
-        books = [book for book in The_Collection if book.annotation]
+        books = Collection_Index.get_books(Collection_Index.with_annotation)
 
     titles = [book.title for book in books]
     print_selection_list(titles)
@@ -540,6 +3746,18 @@ def choose_a_century():
     choice = get_user_choice("century", len(Centuries), extra_prompt=" (or press Enter to list all)")
     return Centuries[choice - 1] if choice else None
 
+############################################################
+# FUNCTION: user can choose a folder or an author group
+############################################################
+def choose_a_group_type():
+    # only offer the group types that exist in the collection
+    group_types = ["Folder", "Author"] if Folders else ["Author"]
+    if len(group_types) == 1:
+        return group_types[0]
+    print_selection_list(group_types)
+    choice = get_user_choice("group", len(group_types))
+    return group_types[choice - 1]
+
 ############################################################
 # FUNCTION: user can choose between quote lengths
 ############################################################
@@ -549,33 +3767,55 @@ def choose_quote_length():
     return Lengths[choice - 1] if choice else None
 
 ##################################################
-# FUNCTION: print statistics of The Collection
+# FUNCTION: list books by a property
 ##################################################
-def print_statistics():
-    # create auxiliary dictionaries
-    author_quotes = {}
-    folder_q_count = {}
-    folder_book_count = {}
+def list_books_by_property(book_property, folder=None, century=None, limit=None):
+    """
+    Return the listed books of a property in printed order (the first
+    limit ones only if given). The order of every property is computed
+    once per session, the books passing the status / folder / century
+    filters are arranged by it. A limit without a computed order selects
+    the top books with a heap instead of sorting.
+    """
+    if book_property == "reading now":
+        status_positions = Collection_Index.reading_now
+    elif book_property in ["finished list", "read duration", "continued_as_publish_date_of_finished"]:
+        status_positions = Collection_Index.have_read
+    else:
+        status_positions = None
+    positions = Collection_Index.select(folder=folder, century=century, positions=status_positions)
 
-    # gather book counts
-    books_with_quotes, books_20th, books_21th = 0, 0, 0
-    for book in The_Collection:
-        if book.total_q > 0:
-            books_with_quotes += 1
-        if 1900 <= book.published_date < 2000:
-            books_20th += 1
-        if book.published_date >= 2000:
-            books_21th += 1
-
-        # gather folders statistics
-        for folder in Folders:
-            if book.folder == folder:
-                folder_q_count[folder] = folder_q_count.get(folder, 0) + book.total_q
-                folder_book_count[folder] = folder_book_count.get(folder, 0) + 1
-                break
+    key, reverse = LIST_SORT_KEYS[book_property], book_property != "folder"
+    if limit is not None and not Collection_Index.has_sort_order(book_property):
+        listed = [book for book in Collection_Index.get_books(positions) if is_listed_by_property(book, book_property)]
+        # same result as sorted(...)[:limit]
+        return (heapq.nlargest if reverse else heapq.nsmallest)(limit, listed, key=key)
 
-        if book.total_q > 0:
-            author_quotes[book.author] = author_quotes.get(book.author, 0) + book.total_q
+    sorted_books = Collection_Index.get_books(Collection_Index.sort_positions(positions, book_property, key, reverse))
+    listed = [book for book in sorted_books if is_listed_by_property(book, book_property)]
+    return listed if limit is None else listed[:limit]
+
+##################################################
+# FUNCTION: check if a sorted book is listed
+##################################################
+def is_listed_by_property(book, book_property):
+    if book_property == "read duration":
+        return (book.first_q_date > READ_DATE_LIST_START and
+                (book.last_q_date - book.first_q_date) > ONE_DAY_IN_SECONDS and
+                book.title not in EXCLUDED_TITLES_FROM_READ_DURATION)
+    if book_property == "number of quotes":
+        return book.total_q > 0
+    if book_property == "quote/page ratio":
+        return book.q_per_page > 0.0
+    return True
+
+##################################################
+# FUNCTION: print statistics of The Collection
+##################################################
+def print_statistics():
+    data = get_statistics_data()
+    books_21th, books_20th = data["books_21th"], data["books_20th"]
+    books_with_quotes = data["books_with_quotes"]
 
     ##################################################
     # books
@@ -590,9 +3830,7 @@ def print_statistics():
         print_stat_line("Books from the 20th century", f"{books_20th:4d} / {get_percentage_string(books_20th, books_count)}")
     print_stat_line("Books with quotes", f"{books_with_quotes:4d} / {get_percentage_string(books_with_quotes, books_count)}", blank_line=True)
     
-    # Sort folders by book count (descending)
-    folder_book_count = dict(sorted(folder_book_count.items(), key=lambda item: item[1], reverse=True))
-    print_folder_dict(folder_book_count, books_count)
+    print_folder_dict(data["folder_book_count"], books_count)
     
     ##################################################
     # quotes
@@ -603,10 +3841,7 @@ def print_statistics():
     print_stat_line(f"Quotes that are less than {MAX_CHAR_IN_SHORT_QUOTE} characters", string)
     print_stat_line("Quotes per book on average", f"{round(All_Quotes_Count / books_with_quotes):4d}", blank_line=True)
 
-    
-    # Sort folders by total quotes (descending)
-    folder_q_count = dict(sorted(folder_q_count.items(), key=lambda item: item[1], reverse=True))
-    print_folder_dict(folder_q_count, All_Quotes_Count)
+    print_folder_dict(data["folder_q_count"], All_Quotes_Count)
 
     ##################################################
     # authors
@@ -615,10 +3850,8 @@ def print_statistics():
     string = "Top 15 Authors"
     print(f"{string}\n{'-' * len(string)}")
 
-    # Sort authors by total quotes (descending)
-    author_quotes = dict(sorted(author_quotes.items(), key=lambda item: item[1], reverse=True))    
     cumulative = 0
-    for i, (author, count) in enumerate(author_quotes.items(), start=1):
+    for i, (author, count) in enumerate(data["author_quotes"].items(), start=1):
         cumulative += count
 
         print_stat_line(
@@ -633,53 +3866,20 @@ def print_statistics():
     # words
     ##################################################
     input()
+    # the counts above only use the books, the words need the quotes
+    wait_for_the_collection(Quotes_Ready)
     string = "Top 30 most used words"
     print(f"\n{string}\n{'-' * len(string)}")
-    words_to_omit = [
-        "that", "your", "this", "their", "they", "with", "have",
-        "from", "what", "there", "will", "when", "which", "more",
-        "only", "into", "because", "them", "cannot", "become", "other",
-        "make", "every", "then", "than", "these", "through", "even",
-        "always", "about", "must", "need", "very", "without", "such",
-        "know", "things", "some", "something", "those", "want", "others",
-        "find", "just", "becomes"
-        ]
-
-    all_quotes_list = []
-    for book in The_Collection:
-        all_quotes_list += book.get_all_quotes_list()
-    all_text = ' '.join(quote.text for quote in all_quotes_list)
-
-    pattern = r"\b(?:" + '|'.join(words_to_omit) + r")\b"
-    updated_text = re.sub(pattern, "", all_text, flags=re.IGNORECASE)
-
-    # convert to lowercase and split by non-word characters (e.g., punctuation)
-    words = re.findall(r"\b\w{4,}\b", updated_text.lower())
-    top_30 = Counter(words).most_common(30)
-
-    # get word counts for each book, omitted words from top_30 will be
-    # also counted, but there will be no match during later check
-    book_word_counts = {}
-    for book in The_Collection:
-        quotes_text = ' '.join(quote.text for quote in book.get_all_quotes_list()).lower()
-        word_counts = Counter(re.findall(r'\b\w{4,}\b', quotes_text))
-        book_word_counts[book.title] = word_counts
-
-    # process the top 30 words
-    for word, count in top_30:
-        print(f" --> {count:3d} x {word}", end='')
 
-        # find the book with the most occurrence of the word
-        max_count = 0
-        book_string = ""
-        for book in The_Collection:
-            word_count = book_word_counts[book.title].get(word, 0)
-            if word_count > max_count:
-                max_count = word_count
-                book_string = book.title
+    # process the top 30 words, print related data in one line
+    for word, count, max_count, book_string in get_top_words(30):
+        print(f" --> {count:3d} x {word}{' ' * (12-len(word))}{max_count:3d} / {book_string}")
 
-        # Print related data in one line
-        print(f"{' ' * (12-len(word))}{max_count:3d} / {book_string}")
+    ##################################################
+    # phrases (counted once, kept until the collection changes)
+    ##################################################
+    input()
+    print_top_phrases(get_phrase_statistics(), 15)
 
     ##################################################
     # all books
@@ -689,6 +3889,70 @@ def print_statistics():
         # print(f"  -->  {book.published_date:4d}  /  {book.pages_count:4d} pages  /  {book.title}")
     # print_separator_line()
 
+##################################################
+# FUNCTION: gather the counts of the statistics
+##################################################
+def get_statistics_data():
+    """
+    Return the book counts and the folder / author counts of the
+    statistics, the dictionaries are sorted by count (descending).
+    """
+    # create auxiliary dictionaries
+    author_quotes = {}
+    folder_q_count = {}
+    folder_book_count = {}
+
+    # gather folders statistics, folders are keyed in order of their first book
+    for folder, positions in Collection_Index.by_folder.items():
+        folder_q_count[folder] = sum(The_Collection[position].total_q for position in positions)
+        folder_book_count[folder] = len(positions)
+
+    for book in Collection_Index.get_books(Collection_Index.with_quotes):
+        author_quotes[book.author] = author_quotes.get(book.author, 0) + book.total_q
+
+    def by_count(counts):
+        return dict(sorted(counts.items(), key=lambda item: item[1], reverse=True))
+
+    # gather book counts from the index
+    return {
+        "books_count": len(The_Collection),
+        "books_21th": sum(len(positions) for century, positions in Collection_Index.by_century.items() if century >= 21),
+        "books_20th": len(Collection_Index.by_century.get(20, [])),
+        "books_with_quotes": len(Collection_Index.with_quotes),
+        "folder_book_count": by_count(folder_book_count),
+        "folder_q_count": by_count(folder_q_count),
+        "author_quotes": by_count(author_quotes)
+        }
+
+##################################################
+# FUNCTION: get the most used words
+##################################################
+def get_top_words(count):
+    """
+    Return (word, count, count in top book, top book title) tuples, word
+    counts are collected once and kept until The Collection changes.
+    """
+    word_statistics = get_word_statistics()
+    top_words = []
+    for word, word_count in word_statistics.counts.most_common(count):
+        # find the book with the most occurrence of the word
+        max_count, book = word_statistics.get_top_book(word)
+        top_words.append((word, word_count, max_count, book.title if book else ""))
+    return top_words
+
+##################################################
+# FUNCTION: print the most frequent phrases
+##################################################
+def print_top_phrases(phrase_statistics, count):
+    for size in PHRASE_SIZES:
+        string = f"Top {count} phrases of {size} words"
+        print(f"\n{string}\n{'-' * len(string)}")
+        for phrase, phrase_count in phrase_statistics.get_top_phrases(size, count):
+            print(f" --> {phrase_count:3d} x {phrase}")
+        # the summary drops rare phrases, the counts can be a bit low then
+        if phrase_statistics.get_error_bound(size):
+            print(f"     (counts may be up to {phrase_statistics.get_error_bound(size)} too low)")
+
 def print_stat_line(string, value, blank_line=False):
     print(f"{string}  {'-' * (48-len(string))}>  {value}")
     if blank_line:
@@ -707,15 +3971,423 @@ def print_folder_dict(folder_dict, total):
         )
     print("\n")
 
+####################################################################################################
+# EXPORT
+####################################################################################################
+
+##################################################
+# FUNCTION: write every quote of a book to a txt file
+##################################################
+def write_book_txt(book, path):
+    """
+    Write the numbered quotes of the book in page order, return them.
+    """
+    # create a list sorted by page number of all quotes in the book
+    sorted_by_page = sorted(book.get_all_quotes_list(), key=lambda quote: quote.page)
+    write_export_file(path, "txt", book.title, book.author, [(quote.page, quote.text) for quote in sorted_by_page])
+    return sorted_by_page
+
+##################################################
+# FUNCTION: export the quotes of many books
+##################################################
+def export_books(books, directory, export_format="txt", workers=1, pool="thread", progress=True):
+    """
+    Write one file per book into the directory, return a record per file.
+    The workers only get plain tuples, so the same jobs run in threads or processes.
+    """
+    os.makedirs(directory, exist_ok=True)
+    used_names = set()
+    jobs = []
+    for book in books:
+        sorted_by_page = sorted(book.get_all_quotes_list(), key=lambda quote: quote.page)
+        filename = get_safe_filename(book.title, EXPORT_EXTENSIONS[export_format], used_names)
+        jobs.append((os.path.join(directory, filename), export_format, book.title, book.author,
+                     [(quote.page, quote.text) for quote in sorted_by_page]))
+
+    start_time = time.perf_counter()
+    written_bytes = [0] * len(jobs)
+    if workers > 1 and len(jobs) > 1:
+        executor_class = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+        with executor_class(max_workers=workers) as executor:
+            futures = {executor.submit(write_export_file, *job): i for i, job in enumerate(jobs)}
+            for done, future in enumerate(as_completed(futures), 1):
+                written_bytes[futures[future]] = future.result()
+                if progress:
+                    print_export_progress(done, len(jobs), sum(written_bytes), start_time)
+    else:
+        for i, job in enumerate(jobs):
+            written_bytes[i] = write_export_file(*job)
+            if progress:
+                print_export_progress(i + 1, len(jobs), sum(written_bytes), start_time)
+    if progress and jobs:
+        sys.stderr.write('\n')
+
+    return [{"book": job[2], "file": job[0], "quotes": len(job[4]), "bytes": size}
+            for job, size in zip(jobs, written_bytes)]
+
+##################################################
+# FUNCTION: write one export file
+##################################################
+def write_export_file(path, export_format, title, author, quotes):
+    """
+    Render the whole file in memory and write it at once, return its size in bytes.
+    quotes: (page, text) pairs in page order.
+    """
+    total = len(quotes)
+    if export_format == "jsonl":
+        lines = [json.dumps({"book": title, "author": author or "", "number": i + 1, "page": page, "text": text},
+                            ensure_ascii=False)
+                 for i, (page, text) in enumerate(quotes)]
+    elif export_format == "md":
+        lines = [f"# {title}", ""]
+        if author:
+            lines += [f"*{author}*", ""]
+        for i, (page, text) in enumerate(quotes):
+            lines.append(f"**{i + 1} / {total}**  (p.{page})")
+            lines.append('\n'.join(f"> {line}" for line in text.splitlines() or [""]))
+            lines.append("")
+    else:
+        lines = [title, '-' * len(title)]
+        for i, (page, text) in enumerate(quotes):
+            lines.append(f"{i + 1} / {total}  (p.{page})")
+            lines.append(f"{text}\n")
+
+    data = '\n'.join(lines) + '\n' if lines else ""
+    # open output file with context manager, one write for the whole file
+    with open(path, "w", encoding="utf8") as f_output:
+        f_output.write(data)
+    return len(data.encode("utf8"))
+
+##################################################
+# FUNCTION: get a file name from a book title
+##################################################
+def get_safe_filename(title, extension, used_names):
+    """
+    Replace the characters not allowed in file names (on any system),
+    keep the name short and unique (case-insensitive) within used_names.
+    """
+    name = UNSAFE_FILENAME_PATTERN.sub('_', title).strip(' .')
+    name = name.encode("utf8")[:MAX_FILENAME_BYTES].decode("utf8", "ignore").rstrip(' .') or "untitled"
+    if name.split('.')[0].upper() in RESERVED_FILENAMES:
+        name = f"_{name}"
+
+    filename, number = f"{name}.{extension}", 1
+    while filename.lower() in used_names:
+        number += 1
+        filename = f"{name} ({number}).{extension}"
+    used_names.add(filename.lower())
+    return filename
+
+##################################################
+# FUNCTION: print progress of the export
+##################################################
+def print_export_progress(done, total, written_bytes, start_time):
+    global Last_Progress_Time
+    # redraw a few times per second only
+    now = time.perf_counter()
+    if done < total and now - Last_Progress_Time < EXPORT_PROGRESS_INTERVAL:
+        return
+    Last_Progress_Time = now
+    elapsed = max(now - start_time, 1e-9)
+    sys.stderr.write(f"\r{done} / {total} books  {written_bytes / 1024 / 1024:.1f} MB  "
+                     f"{done / elapsed:.0f} books/s  {written_bytes / 1024 / 1024 / elapsed:.1f} MB/s")
+    sys.stderr.flush()
+
+####################################################################################################
+# HEADLESS COMMANDS
+####################################################################################################
+
+##################################################
+# FUNCTION: run headless command(s), print the output
+##################################################
+def run_headless(args):
+    """
+    Run the command of the arguments (or every command of stdin for batch),
+    return the exit code.
+    """
+    if args.command != "batch":
+        try:
+            with timed_phase(f"command / {args.command}"):
+                emit_records(run_command(args), args.format)
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    # every line is a command of its own, the collection is loaded only once
+    batch_parser = argparse.ArgumentParser(prog="batch", exit_on_error=False)
+    add_command_parsers(batch_parser.add_subparsers(dest="command", metavar="command"))
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records = run_command(batch_parser.parse_args(shlex.split(line)))
+            output = {"command": line, "records": records}
+        except (ValueError, OSError, argparse.ArgumentError) as e:
+            output = {"command": line, "error": str(e)}
+        except SystemExit:
+            # argparse exits on a missing argument, the usage is already on stderr
+            output = {"command": line, "error": "invalid command"}
+        sys.stdout.write(json.dumps(output, ensure_ascii=False) + '\n')
+    return 0
+
+##################################################
+# FUNCTION: run a headless command
+##################################################
+def run_command(args):
+    """
+    Run a headless command with the same logic as the menu,
+    return its output as a list of flat records (dictionaries).
+    """
+    if args.command == "stats":
+        return get_statistics_records()
+
+    if args.command == "phrases":
+        if args.author is not None and args.author not in Collection_Index.by_author:
+            raise ValueError(f"unknown author: {args.author}")
+        if args.folder is not None and args.folder not in Folders:
+            raise ValueError(f"unknown folder: {args.folder}")
+        if args.author is not None:
+            phrase_statistics = get_phrase_statistics(args.author, "Author")
+        else:
+            phrase_statistics = get_phrase_statistics(args.folder, "Folder")
+        return [{"words": size, "phrase": phrase, "count": count, "max_error": phrase_statistics.get_error_bound(size)}
+                for size in PHRASE_SIZES for phrase, count in phrase_statistics.get_top_phrases(size, args.top)]
+
+    if args.command == "search":
+        books, groups, _, _ = find_search_results(args.query)
+        records = [{"match": "book", "book": book.title, "author": book.author or "", "page": "", "text": ""}
+                   for book in books]
+        records += [{"match": "quote", "book": book.title, "author": book.author or "", "page": quote.page, "text": quote.text}
+                    for book, quotes in groups for quote in quotes]
+        return records
+
+    if args.command == "list":
+        if args.folder is not None and args.folder not in Folders:
+            raise ValueError(f"unknown folder: {args.folder}")
+        book_property = LIST_PROPERTY_NAMES[args.by]
+        return [get_book_record(book) for book in list_books_by_property(book_property, args.folder, args.century, args.top)]
+
+    if args.command == "random":
+        if args.author is not None and args.author not in Collection_Index.by_author:
+            raise ValueError(f"unknown author: {args.author}")
+        if args.folder is not None and args.folder not in Folders:
+            raise ValueError(f"unknown folder: {args.folder}")
+        # every command starts from its own random state and sampler, a batch
+        # line draws like a separate run (no seed: seeded from the system)
+        random.seed(args.seed)
+        books = Collection_Index.get_books(Collection_Index.select(author=args.author, folder=args.folder, with_quotes=True))
+        sampler = create_quote_sampler(books, "Short only" if args.length == "short" else "Any length")
+        records = []
+        while len(records) < args.count and (drawn := sampler.draw()):
+            book, quote, quotes_left = drawn
+            record_shown_quote(book, quote)
+            records.append({"book": book.title, "author": book.author or "", "page": quote.page,
+                            "text": quote.text, "left": quotes_left})
+        return records
+
+    if args.command == "similar":
+        book = find_book(args.book)
+        sorted_by_page = sorted(book.get_all_quotes_list(), key=lambda quote: quote.page)
+        if not 1 <= args.number <= len(sorted_by_page):
+            raise ValueError(f"the book has {len(sorted_by_page)} quotes")
+        return [{"book": similar_book.title, "author": similar_book.author or "", "page": quote.page,
+                 "similarity": round(similarity, 4), "text": quote.text}
+                for similar_book, quote, similarity in find_similar_quotes(book, sorted_by_page[args.number - 1],
+                                                                            args.top, args.same_book)]
+
+    if args.command == "export":
+        book = find_book(args.book)
+        if args.txt:
+            sorted_by_page = write_book_txt(book, args.txt)
+        else:
+            sorted_by_page = sorted(book.get_all_quotes_list(), key=lambda quote: quote.page)
+        return [{"book": book.title, "number": i + 1, "page": quote.page, "text": quote.text}
+                for i, quote in enumerate(sorted_by_page)]
+
+    if args.command == "diff":
+        if len(args.files) < 2:
+            raise ValueError("diff needs at least two library files")
+        history = load_history()
+        # every file is compared with the one before, its unchanged docs are skipped
+        docs, previous = [], None
+        for path in args.files:
+            file_docs, lengths, _ = get_library_docs(path, history, previous)
+            docs.append(file_docs)
+            previous = file_docs, lengths
+        return [{"from": old_path, "to": new_path, "change": change, "uri": uri, "book": title, "detail": detail}
+                for old_path, new_path, old_docs, new_docs in zip(args.files, args.files[1:], docs, docs[1:])
+                for change, uri, title, detail in diff_library_docs(old_docs, new_docs, history["summaries"])]
+
+    if args.command == "history":
+        return run_history_command(args.action, args.files)
+
+    if args.command == "export-all":
+        if args.author is not None and args.author not in Collection_Index.by_author:
+            raise ValueError(f"unknown author: {args.author}")
+        if args.folder is not None and args.folder not in Folders:
+            raise ValueError(f"unknown folder: {args.folder}")
+        books = Collection_Index.get_books(Collection_Index.select(author=args.author, folder=args.folder, with_quotes=True))
+        return export_books(books, args.to, args.export_format, args.workers, args.pool)
+
+    raise ValueError(f"unknown command: {args.command}")
+
+##################################################
+# FUNCTION: run a history command
+##################################################
+def run_history_command(action, files):
+    history = load_history()
+    snapshots = history["snapshots"]
+    if action == "add":
+        if not files:
+            raise ValueError("history add needs library files")
+        records = []
+        for path in files:
+            known = len(history["summaries"])
+            docs, lengths, content_hash = get_library_docs(path, history)
+            stored = all(snapshot["hash"] != content_hash for snapshot in snapshots)
+            if stored:
+                snapshots.append({"file": path, "hash": content_hash, "added": time.time(), "docs": docs,
+                                  "lengths": lengths})
+            records.append({"file": path, "docs": len(docs), "new_doc_versions": len(history["summaries"]) - known,
+                            "stored": stored})
+        if not write_cache_file(HISTORY_CACHE_NAME, history, HISTORY_FORMAT_VERSION):
+            raise ValueError(f"cannot write {get_cache_path(HISTORY_CACHE_NAME)}")
+        return records
+
+    if action == "list":
+        return [{"file": snapshot["file"], "added": format_timestamp(snapshot["added"]), "docs": len(snapshot["docs"])}
+                for snapshot in snapshots]
+
+    if action == "weekly":
+        return [{"week": week, "quotes": count} for week, count in get_weekly_quote_counts(history)]
+
+    return [{"from": old["file"], "to": new["file"], "change": change, "uri": uri, "book": title, "detail": detail}
+            for old, new in zip(snapshots, snapshots[1:])
+            for change, uri, title, detail in diff_library_docs(old["docs"], new["docs"], history["summaries"])]
+
+##################################################
+# FUNCTION: find a book by its title
+##################################################
+def find_book(title):
+    for book in The_Collection:
+        if book.title == title:
+            return book
+    raise ValueError(f"unknown book: {title}")
+
+##################################################
+# FUNCTION: get the record of a book
+##################################################
+def get_book_record(book):
+    return {
+        "title": book.title,
+        "author": book.author or "",
+        "folder": book.folder,
+        "pages": book.pages_count,
+        "published": book.published_date,
+        "rating": book.rating,
+        "ratings_count": book.ratings_count,
+        "quotes": book.total_q,
+        "short_quotes": book.total_short_q,
+        "quote_page_ratio": round(book.q_per_page, 4),
+        "added_on": book.file_modified_time.strftime('%Y-%m-%d'),
+        "have_read": book.have_read_time.strftime('%Y-%m-%d') if book.have_read_time.year > 1970 else "",
+        "first_quote": format_timestamp(book.first_q_date),
+        "last_quote": format_timestamp(book.last_q_date)
+        }
+
+def format_timestamp(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d') if timestamp else ""
+
+##################################################
+# FUNCTION: get the statistics as records
+##################################################
+def get_statistics_records():
+    data = get_statistics_data()
+    records = [
+        {"section": "books", "name": "total", "count": data["books_count"], "detail": ""},
+        {"section": "books", "name": "21th century", "count": data["books_21th"], "detail": ""},
+        {"section": "books", "name": "20th century", "count": data["books_20th"], "detail": ""},
+        {"section": "books", "name": "with quotes", "count": data["books_with_quotes"], "detail": ""},
+        {"section": "quotes", "name": "total", "count": All_Quotes_Count, "detail": ""},
+        {"section": "quotes", "name": f"less than {MAX_CHAR_IN_SHORT_QUOTE} characters", "count": Short_Quotes_Count, "detail": ""}
+        ]
+    records += [{"section": "folder books", "name": folder, "count": count, "detail": ""}
+                for folder, count in data["folder_book_count"].items()]
+    records += [{"section": "folder quotes", "name": folder, "count": count, "detail": ""}
+                for folder, count in data["folder_q_count"].items()]
+    records += [{"section": "author quotes", "name": author or "", "count": count, "detail": ""}
+                for author, count in data["author_quotes"].items()]
+    records += [{"section": "words", "name": word, "count": count, "detail": f"{max_count} / {title}"}
+                for word, count, max_count, title in get_top_words(30)]
+    return records
+
+##################################################
+# FUNCTION: print records as JSON or TSV
+##################################################
+def emit_records(records, output_format, file=None):
+    file = file or sys.stdout
+    if output_format == "tsv":
+        # header from every key, in order of first appearance
+        keys = list(dict.fromkeys(key for record in records for key in record))
+        lines = ['\t'.join(keys)]
+        lines += ['\t'.join(escape_tsv_value(record.get(key, "")) for key in keys) for record in records]
+        file.write('\n'.join(lines) + '\n')
+    else:
+        file.write(json.dumps(records, ensure_ascii=False) + '\n')
+
+def escape_tsv_value(value):
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
 ####################################################################################################
 # MAIN
 ####################################################################################################
 if __name__ == "__main__":
-    # create database and options menu
-    build_the_collection();
+    args = parse_arguments()
+    LIBRARY_FILE = args.library
+    Sampling_Mode = args.sampling
+    Prefer_Quotes = args.prefer
+    Seen_History_Enabled = not args.no_seen_history
+    atexit.register(save_seen_quotes)
+    Fuzzy_Distance = args.fuzzy_distance
+    Parse_Workers = args.parse_workers
+    # the error is at most phrases / (counters + 1)
+    Phrase_Counters = math.ceil(1 / args.phrase_error) - 1 if args.phrase_error is not None else args.phrase_counters
+    enable_instrumentation(args.timings, args.profile, args.memory_dump)
+
+    if args.memory_report:
+        elapsed, peak, retained = measure_collection_build(args.parser)
+        text_size = sum(sys.getsizeof(text) for text in Quote_Store.texts)
+        print(f"Parser: {args.parser}  /  {len(The_Collection)} books  /  {All_Quotes_Count} quotes")
+        print(f"Build time: {elapsed:.3f} s  /  peak traced memory: {peak / (1 << 20):.1f} MiB")
+        print(f"Retained memory: {retained / (1 << 20):.1f} MiB  /  quote texts: {text_size / (1 << 20):.1f} MiB  /  "
+              f"quote store: {get_quote_store_overhead():.1f} bytes per quote besides the text")
+        sys.exit()
+
+    # the history commands work on library files only
+    if args.command in ["diff", "history"]:
+        sys.exit(run_headless(args))
+
+    # headless commands print their output and exit without the menu
+    if args.command:
+        load_the_collection(args.parser, use_snapshot=not args.no_snapshot, backend=args.backend);
+        sys.exit(run_headless(args))
+
+    # the menu is shown while the collection is loaded
+    if args.watch:
+        watch_the_library()
+    start_loading_the_collection(args.parser, use_snapshot=not args.no_snapshot, backend=args.backend)
+    Paging_Enabled = not args.no_pager
     Options_Menu = create_options_menu(Options)
+    Terminal.watch_resize()
     
     while True:
+        # pick up a new library file between two actions, once it is loaded
+        reload_note = None
+        if Doc_Fingerprints is not None and not is_loading():
+            reload_note = check_library_changes(args.backend)
+
         # start with empty window
         os.system('cls')
     
@@ -723,30 +4395,41 @@ if __name__ == "__main__":
         string = f"== The Collection =="
         separator = '=' * len(string)
         print(f"{separator}\n{string}\n{separator}\n")
+        if reload_note:
+            print(f"{reload_note}\n")
     
         # get option also prints the options menu
         option = get_option();
         print_separator_line()
+        wait_for_the_collection(Metadata_Ready if option in METADATA_OPTIONS else Quotes_Ready)
+        if Phase_Timer:
+            Phase_Timer.start_action(f"menu / {option}")
     
         ##################################################
         # random quotes
         ##################################################
-        if (option == "Random / All Quotes" or
-            option == "Random / Selected Author" or
-            option == "Random / Selected Folder"):
+        if option == "Random / Selected Folder" and not Folders:
+            # without folders the selection would be the whole collection
+            print("There are no folders in the collection.")
+            input()
+
+        elif (option == "Random / All Quotes" or
+              option == "Random / Selected Author" or
+              option == "Random / Selected Folder"):
     
             if option == "Random / All Quotes":
-                books = [book for book in The_Collection if book.total_q > 0]
+                books = Collection_Index.get_books(Collection_Index.with_quotes)
             elif option == "Random / Selected Author":
                 selected_author = choose_an_author(Authors)
-                books = [book for book in The_Collection if (book.author == selected_author and book.total_q > 0)]
+                books = Collection_Index.get_books(Collection_Index.select(author=selected_author, with_quotes=True))
             elif option == "Random / Selected Folder":
-                selected_folder = choose_a_folder(allow_select_all=False) if Folders else None
-                books = [book for book in The_Collection if (book.folder == selected_folder and book.total_q > 0)]
+                selected_folder = choose_a_folder(allow_select_all=False)
+                books = Collection_Index.get_books(Collection_Index.select(folder=selected_folder, with_quotes=True))
     
             length = choose_quote_length()
             print_quote_count(sum(getattr(book, LENGTH_TO_ATTR[length]) for book in books))
-            print_random_quotes(books, LENGTH_TO_METHOD[length])
+            wait_for_the_collection(Quotes_Ready)
+            print_random_quotes(books, length)
     
         ##################################################
         # selected book section
@@ -756,28 +4439,21 @@ if __name__ == "__main__":
     
             # get a book from the printed list
             selected_book = choose_a_book("with_quotes")
+            wait_for_the_collection(Quotes_Ready)
     
             ##################################################
             # all quotes in page order
             ##################################################
             if option == "Book / every quote":
-                # open output file with context manager
-                with open(f"{selected_book.title}.txt", "w", encoding="utf8") as f_output:
-                    # create a list sorted by page number of all quotes in the book
-                    sorted_by_page = sorted(selected_book.get_all_quotes_list(), key=lambda quote: quote.page)
-    
-                    print(selected_book.title)
-                    print('-' * len(selected_book.title))
-                    f_output.write(f"{selected_book.title}\n")
-                    f_output.write(f"{'-' * len(selected_book.title)}\n")
+                # the same numbered list is written to the txt file
+                sorted_by_page = write_book_txt(selected_book, f"{selected_book.title}.txt")
     
+                with Terminal.paged():
+                    Terminal.print(selected_book.title, '-' * len(selected_book.title))
                     for i, quote in enumerate(sorted_by_page):
-                        string = f"{i + 1} / {len(sorted_by_page)}  (p.{str(quote.page)})"
-                        print(string)
-                        print_wrapped_text(quote.text)
-                        print()
-                        f_output.write(f"{string}\n")
-                        f_output.write(f"{quote.text}\n\n")
+                        Terminal.write(f"{i + 1} / {len(sorted_by_page)}  (p.{str(quote.page)})\n")
+                        if not Terminal.print_wrapped(quote.text):
+                            break
     
             ##################################################
             # quote distribution
@@ -786,156 +4462,112 @@ if __name__ == "__main__":
                 print(f"{selected_book.title}\n{'-' * len(selected_book.title)}\n")
     
                 # use terminal width as the base of the diagram size
-                space = "    "
-                columns = get_terminal_columns() - 10
-                rows = round(columns * 0.2)
-                res = selected_book.pages_count / columns
-    
-                # collect the distribution of quotes based on calculated resolution
-                # use length of each quote instead of simply just the numbers
-                q_distr = []
-                for i in range(columns):
-                    q_distr.append(0)
-                    start_page = res * i
-                    end_page = res * (i + 1)
-                    for quote in selected_book.get_all_quotes_list():
-                        if (quote.page > start_page) and (quote.page <= end_page):
-                            q_distr[i] += len(quote.text)
-    
-                # map the distribution from (0) to (rows)
-                old_min, old_max = min(q_distr), max(q_distr)
-                new_min, new_max = 0, rows
-                mapped_distr = [(new_max - new_min) * (x - old_min) / (old_max - old_min) + new_min for x in q_distr]
-    
-                print(f"{space}↑")
-                # range is exclusive of the end value, but it's not a problem that rows number
-                # will not be reached, because in this way, compare value (new max - i) will
-                # not reach zero, so a row full of '*' character will not be printed
-                for i in range(rows):
-                    row_str_list = []
-                    for j in range(columns):
-                        row_str_list.append('*' if mapped_distr[j] >= (new_max - i) else ' ')
-    
-                    # print the updated row immediately
-                    print(f"{space}|{''.join(row_str_list)}")
-    
-                print(f"{space}{'-' * columns}→")
-                print(f"{space}1{' ' * (columns - len(str(selected_book.pages_count)) + 1)}{selected_book.pages_count}")
+                for line in Quote_Histogram.render_book(selected_book, get_terminal_columns() - 10):
+                    print(line)
+    
+        ##################################################
+        # quote distribution of a folder or an author
+        ##################################################
+        elif option == "Group / quote distribution":
+            group_type = choose_a_group_type()
+            if group_type == "Folder":
+                group = choose_a_folder(allow_select_all=False)
+                positions = Collection_Index.select(folder=group, with_quotes=True)
+            else:
+                group = choose_an_author(Authors)
+                positions = Collection_Index.select(author=group, with_quotes=True)
+    
+            books = Collection_Index.get_books(positions)
+            wait_for_the_collection(Quotes_Ready)
+            string = f"{group}  ({len(books)} books, pages in percent)"
+            print(f"{string}\n{'-' * len(string)}\n")
+            for line in Quote_Histogram.render_group(books, get_terminal_columns() - 10):
+                print(line)
     
+        ##################################################
+        # most frequent phrases of a folder (or all of them) or an author
+        ##################################################
+        elif option == "Group / frequent phrases":
+            group_type = choose_a_group_type()
+            group = choose_a_folder() if group_type == "Folder" else choose_an_author(Authors)
+            # no folder chosen is the whole collection
+            string = group if group is not None else "All folders"
+            wait_for_the_collection(Quotes_Ready)
+            print(f"{string}\n{'-' * len(string)}")
+            print_top_phrases(get_phrase_statistics(group, group_type), 15)
+
         ##################################################
         # generate book list by chosen property
         ##################################################
         elif option == "Book / list by property":
     
             book_property = choose_a_property()
-    
-            if book_property == "added on":
-                sorted_books = sorted(The_Collection, key=lambda book: book.file_modified_time, reverse=True)
-            elif book_property == "reading now":
-                sorted_books = sorted(The_Collection, key=lambda book: book.published_date, reverse=True)
-            elif book_property == "finished list":
-                sorted_books = sorted(The_Collection, key=lambda book: book.have_read_time, reverse=True)
-            elif book_property == "read duration":
-                sorted_books = sorted(The_Collection, key=lambda book: book.first_q_date, reverse=True)
-            elif book_property == "publish date":
-                sorted_books = sorted(The_Collection, key=lambda book: book.published_date, reverse=True)
-                century = choose_a_century()
-            elif book_property == "number of quotes":
-                sorted_books = sorted(The_Collection, key=lambda book: book.total_q, reverse=True)
-            elif book_property == "quote/page ratio":
-                sorted_books = sorted(The_Collection, key=lambda book: book.q_per_page, reverse=True)
-            elif book_property == "rating":
-                sorted_books = sorted(The_Collection, key=lambda book: book.rating, reverse=True)
-            elif book_property == "folder":
-                sorted_books = sorted(The_Collection, key=lambda book: book.title, reverse=False)
+            century = choose_a_century() if book_property == "publish date" else None
     
             # choose function returns none if all is requested
             not_an_exception = book_property not in ["read duration", "reading now", "finished list"]
             folder = choose_a_folder() if (Folders and not_an_exception) else None
     
-            while True:
-                for book in sorted_books:
-                    if not folder or book.folder == folder:
+            with Terminal.paged():
+                while True:
+                    for book in list_books_by_property(book_property, folder, century):
                         # print book data according to chosen property
                         if book_property == "added on":
-                            print(f"  -->  {book.file_modified_time.strftime('%Y-%b-%d')}  /  {book.title}")
+                            Terminal.print(f"  -->  {book.file_modified_time.strftime('%Y-%b-%d')}  /  {book.title}")
     
                         elif book_property == "reading now":
-                            if (book.activity_time != 0) and (book.have_read_time.year == 1970):
-                                print(f"  -->  "
-                                    f"{book.published_date:4d}  /  "
-                                    f"{book.rating:.2f}  /  "
-                                    f"{book.ratings_count:>{6}}k  /  "
-                                    f"{book.pages_count:4d} pages  /  "
-                                    f"{book.title}")
-    
-                        elif book_property == "finished list" or book_property == "continued_as_publish_date_of_finished":
-                            if book.have_read_time.year > 1970:
-                                if book_property == "finished list":
-                                    print(f"  -->  {book.have_read_time.strftime('%Y-%b-%d')}  /  {book.title}")
-                                else:
-                                    print(f"  -->  {book.published_date}  /  {book.title}")
+                            Terminal.print(f"  -->  "
+                                f"{book.published_date:4d}  /  "
+                                f"{book.rating:.2f}  /  "
+                                f"{book.ratings_count:>{6}}k  /  "
+                                f"{book.pages_count:4d} pages  /  "
+                                f"{book.title}")
+    
+                        elif book_property == "finished list":
+                            Terminal.print(f"  -->  {book.have_read_time.strftime('%Y-%b-%d')}  /  {book.title}")
+    
+                        elif book_property == "continued_as_publish_date_of_finished":
+                            Terminal.print(f"  -->  {book.published_date}  /  {book.title}")
     
                         elif book_property == "read duration":
-                            if ( book.first_q_date > READ_DATE_LIST_START and
-                                (book.last_q_date - book.first_q_date) > ONE_DAY_IN_SECONDS and
-                                book.title not in EXCLUDED_TITLES_FROM_READ_DURATION and
-                                book.have_read_time.year > 1970):
-                                dt_first = datetime.datetime.fromtimestamp(book.first_q_date)
-                                elapsed_days = (book.have_read_time - dt_first).days + 1
-                                if dt_first.year == book.have_read_time.year:
-                                    dt_string = f"{dt_first.strftime('%Y %b.%d')} - {book.have_read_time.strftime('%b.%d')}"
-                                else:
-                                    dt_string = f"{dt_first.strftime('%Y %b.%d')} - {book.have_read_time.strftime('%Y %b.%d')}"
-    
-                                print(f"  -->  {dt_string}{' ' * (25-len(dt_string))}  /  "
-                                    f"{book.title}{' ' * (62-len(book.title))}"
-                                    f"/ {book.pages_count:4d} pages  /  {int((book.pages_count / elapsed_days)+0.5):2d} / day")
-    
-                        elif book_property == "publish date":
-                            if century:
-                                date_match = ((century - 1) * 100) <= book.published_date < (century * 100)
-                            if not century or date_match:
-                                date_data = f"{book.published_date:4d}" if book.published_date else " N/A"
-                                pages_count = f"{book.pages_count:4d}" if book.pages_count else " N/A"
-                                print(f"  -->  {date_data}  /  {pages_count} pages  /  {book.title}")
+                            dt_first = datetime.datetime.fromtimestamp(book.first_q_date)
+                            elapsed_days = (book.have_read_time - dt_first).days + 1
+                            if dt_first.year == book.have_read_time.year:
+                                dt_string = f"{dt_first.strftime('%Y %b.%d')} - {book.have_read_time.strftime('%b.%d')}"
+                            else:
+                                dt_string = f"{dt_first.strftime('%Y %b.%d')} - {book.have_read_time.strftime('%Y %b.%d')}"
+    
+                            Terminal.print(f"  -->  {dt_string}{' ' * (25-len(dt_string))}  /  "
+                                f"{book.title}{' ' * (62-len(book.title))}"
+                                f"/ {book.pages_count:4d} pages  /  {int((book.pages_count / elapsed_days)+0.5):2d} / day")
+    
+                        elif book_property == "publish date" or book_property == "folder":
+                            date_data = f"{book.published_date:4d}" if book.published_date else " N/A"
+                            pages_count = f"{book.pages_count:4d}" if book.pages_count else " N/A"
+                            Terminal.print(f"  -->  {date_data}  /  {pages_count} pages  /  {book.title}")
     
                         elif book_property == "number of quotes":
-                            if book.total_q > 0:
-                                print(f"  -->  {book.total_q:3d}  /  {book.title}")
+                            Terminal.print(f"  -->  {book.total_q:3d}  /  {book.title}")
     
                         elif book_property == "quote/page ratio":
-                            if book.q_per_page > 0.0:
-                                # remove funny character
-                                clean_title = book.title.replace('\u200b', '').strip()
-                                string = (f"  -->  {book.q_per_page:.3f}  /  {clean_title}")
-                                print(f"{string}{' ' * (85-len(string))} ( {book.total_q:3d} / {book.pages_count:4d} )")
+                            # remove funny character
+                            clean_title = book.title.replace('\u200b', '').strip()
+                            string = (f"  -->  {book.q_per_page:.3f}  /  {clean_title}")
+                            Terminal.print(f"{string}{' ' * (85-len(string))} ( {book.total_q:3d} / {book.pages_count:4d} )")
     
                         elif book_property == "rating" or book_property == "continued_as_ratings_count":
-                            print(f"  -->  {book.rating:.2f}  /  {book.ratings_count:>{6}}k  /  {book.title}")
-                        
-                        elif book_property == "folder":
-                            date_data = f"{book.published_date:4d}" if book.published_date else " N/A"
-                            pages_count = f"{book.pages_count:4d}" if book.pages_count else " N/A"
-                            print(f"  -->  {date_data}  /  {pages_count} pages  /  {book.title}")
-                            
+                            Terminal.print(f"  -->  {book.rating:.2f}  /  {book.ratings_count:>{6}}k  /  {book.title}")
+
+                        # 'x' at the end of a page stops the list
+                        if Terminal.stopped:
+                            break
     
-                if book_property != "rating" and book_property != "finished list":
-                    break
-                else:
-                    # rating and finished lists are special
-                    print_separator_line()
-                    input()
-                    if book_property == "rating":
-                        # print based on ratings count in the second round
-                        sorted_books = sorted(The_Collection, key=lambda book: book.ratings_count, reverse=True)
-                        book_property = "continued_as_ratings_count"
-                    elif book_property == "finished list":
-                        # print based on ratings count
-                        sorted_books = sorted(The_Collection, key=lambda book: book.published_date, reverse=True)
-                        book_property = "continued_as_publish_date_of_finished"
-                    else:
+                    # rating and finished lists are special, they continue with a second list
+                    if book_property not in LIST_SECOND_PASS or Terminal.stopped:
                         break
+                    Terminal.write('-' * get_terminal_columns())
+                    Terminal.next_page("")
+                    book_property = LIST_SECOND_PASS[book_property]
     
             print_separator_line()
     
@@ -950,39 +4582,41 @@ if __name__ == "__main__":
         ##################################################
         elif option == "Search":
             while True:
-                search_prompt = "Search for at least 3 characters: "
-                str_to_search = input(search_prompt).lower()
+                search_prompt = "Search for at least 3 characters (words, \"phrase\", prefix*, ~similar, OR, =part of word): "
+                str_to_search = input(search_prompt).strip()
                 print('-' * (len(search_prompt) + len(str_to_search)))
     
-                if len(str_to_search) >= 3:
+                if str_to_search.lower() == 'x':
+                    break
+                elif len(str_to_search.lstrip('=')) >= 3:
+                    wait_for_the_collection(Quotes_Ready)
                     counter = 0
-                    for book in The_Collection:
-                        match_in_book = False
+                    books, groups, pattern, note = find_search_results(str_to_search)
+                    with Terminal.paged():
+                        if note:
+                            Terminal.print(f"{note}\n")
+                        if books:
+                            Terminal.print("Books with matching title, author or annotation:",
+                                           *(f"  -->  {book.title}" for book in books), "")
+                        for book, quotes in groups:
+                            Terminal.write('-' * get_terminal_columns())
+                            Terminal.print(f"{book.title}\n{'-' * len(book.title)}\n")
     
-                        for quote in book.get_all_quotes_list():
-                            quote_text = quote.text.lower()
-    
-                            if str_to_search in quote_text:
-    
-                                # check if it's the first match in this book
-                                if not match_in_book:
-                                    print_separator_line()
-                                    print(f"{book.title}\n{'-' * len(book.title)}\n")
-                                    match_in_book = True
-    
-                                # print the quote with the search term highlighted
-                                print_wrapped_text(quote.text.replace(str_to_search, str_to_search.upper()))
-                                print('\n')
-    
-                                # use findall, because a quote may contain the searched word multiple times
-                                counter += len(re.findall(str_to_search, quote_text))
-    
-                    result = f"Matched {counter} time{'s' if counter > 1 else ''}."
-                    print(result if counter else "No match found.")
-                    print('-' * len(result) if counter else '')
-    
-                elif str_to_search == 'x':
-                    break
+                            for quote in quotes:
+                                # print the quote with the search terms highlighted, a quote
+                                # may contain the searched words multiple times
+                                highlighted, count = pattern.subn(lambda match: match.group(0).upper(), quote.text)
+                                if not Terminal.print_wrapped(highlighted, end='\n\n'):
+                                    break
+                                counter += count
+                            if Terminal.stopped:
+                                break
+
+                        # the count is only complete if every match was shown
+                        if not Terminal.stopped:
+                            result = f"Matched {counter} time{'s' if counter > 1 else ''}."
+                            Terminal.print(result if counter else ("No quote matched." if books else "No match found."))
+                            Terminal.print('-' * len(result) if counter else '')
                 else:
                     print("Incorrect input.")
                 print('\n')
@@ -1004,8 +4638,7 @@ if __name__ == "__main__":
             option != "Search"):
             input()
     
-        # start over with next iteration
-        for book in The_Collection:
-            book.clear_selected_set()
+        if Phase_Timer:
+            Phase_Timer.stop_action()
     
         os.system('cls')
@@ -0,0 +1,80 @@
+"""
+Shared fixtures: a fresh copy of readera-collection-cli.py as a module
+(its state is module globals) and a generated library.json.
+"""
+import importlib.util
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_PATH = os.path.join(ROOT, "readera-collection-cli.py")
+MODULE_NAME = "readera_collection_cli"
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from generate_library import generate_library  # noqa: E402
+
+LIBRARY_BOOKS = 80
+LIBRARY_QUOTES_PER_BOOK = 12
+LIBRARY_SEED = 7
+
+
+##################################################
+# FUNCTION: load the script as a new module
+##################################################
+def load_cli():
+    spec = importlib.util.spec_from_file_location(MODULE_NAME, SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[MODULE_NAME] = module
+    spec.loader.exec_module(module)
+    return module
+
+##################################################
+# FUNCTION: get the built state of The Collection
+##################################################
+def get_collection_state(cli):
+    """
+    Return everything a build produces in comparable form: the book
+    fields, the quote store columns and the global lists and counts.
+    """
+    store = cli.Quote_Store
+    return {
+        "books": [(tuple(getattr(book, field) for field in cli.SNAPSHOT_BOOK_FIELDS), book.long_q_count,
+                   book.total_short_q, book.q_start) for book in cli.The_Collection],
+        "texts": list(store.texts),
+        "columns": [list(column) for column in (store.pages, store.insert_times, store.lengths, store.book_ids)],
+        "counts": (cli.All_Quotes_Count, cli.Short_Quotes_Count),
+        "authors": cli.Authors,
+        "titles": cli.Titles,
+        "centuries": sorted(cli.Centuries),
+        "ratings_available": cli.Ratings_Available,
+        "folders": {folder: sorted(uris) for folder, uris in cli.Folders.items()},
+        }
+
+
+@pytest.fixture
+def cli():
+    module = load_cli()
+    yield module
+    sys.modules.pop(MODULE_NAME, None)
+
+
+@pytest.fixture(scope="session")
+def generated_library(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("generated") / "library.json")
+    generate_library(path, books=LIBRARY_BOOKS, quotes_per_book=LIBRARY_QUOTES_PER_BOOK, seed=LIBRARY_SEED)
+    return path
+
+
+@pytest.fixture
+def library(tmp_path, cli, generated_library):
+    """
+    Path of a copy of the generated library.json, the cli reads it and
+    writes its cache files next to it.
+    """
+    path = str(tmp_path / "library.json")
+    shutil.copyfile(generated_library, path)
+    cli.LIBRARY_FILE = path
+    return path
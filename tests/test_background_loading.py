@@ -0,0 +1,89 @@
+"""
+The collection is loaded on a background thread, the books can be used
+before the quotes.
+"""
+import threading
+
+import pytest
+
+from conftest import get_collection_state, load_cli
+
+
+def test_background_load_builds_the_same_collection(cli, library):
+    cli.build_the_collection()
+    built = get_collection_state(cli)
+
+    cli = load_cli()
+    cli.LIBRARY_FILE = library
+    cli.start_loading_the_collection()
+    cli.wait_for_the_collection(cli.Quotes_Ready)
+    assert cli.Metadata_Ready.is_set()
+    assert get_collection_state(cli) == built
+    cli.Loader_Thread.join()
+    assert not cli.is_loading()
+
+
+def test_search_index_is_built_in_the_background(cli, library):
+    cli.SEARCH_COMMON_QUOTES = 50
+    cli.start_loading_the_collection()
+    cli.Loader_Thread.join()
+    index = cli.Search_Index
+    assert index is not None
+    assert "love" in index.token_orders
+    assert all(len(index.postings[token][0]) >= 50 for token in index.token_orders)
+    assert cli.get_search_index() is index
+
+
+def test_snapshot_books_are_ready_before_the_quotes(cli, library, monkeypatch):
+    cli.load_the_collection()
+    cli = load_cli()
+    cli.LIBRARY_FILE = library
+
+    # hold the loader where the quote texts are restored
+    release = threading.Event()
+    lazy_texts = cli.LazyQuoteTexts
+
+    def held_texts(*args):
+        release.wait(10)
+        return lazy_texts(*args)
+    monkeypatch.setattr(cli, "LazyQuoteTexts", held_texts)
+
+    cli.start_loading_the_collection()
+    cli.wait_for_the_collection(cli.Metadata_Ready)
+    assert not cli.Quotes_Ready.is_set()
+    assert cli.Collection_Index.with_quotes
+    assert cli.list_books_by_property("added on")
+    release.set()
+    cli.wait_for_the_collection(cli.Quotes_Ready)
+    assert cli.Quote_Store.texts[0]
+
+
+def test_cold_build_books_are_ready_before_the_quotes(cli, library, monkeypatch):
+    # hold the loader where the quotes are added to the store
+    release = threading.Event()
+    reorder = cli.QuoteStore.reorder
+
+    def held_reorder(store, books):
+        release.wait(10)
+        return reorder(store, books)
+    monkeypatch.setattr(cli.QuoteStore, "reorder", held_reorder)
+
+    cli.start_loading_the_collection(use_snapshot=False)
+    cli.wait_for_the_collection(cli.Metadata_Ready)
+    assert not cli.Quotes_Ready.is_set()
+    assert not len(cli.Quote_Store)
+    assert cli.get_statistics_data()["books_with_quotes"] == len(cli.Collection_Index.with_quotes) > 0
+    assert cli.list_books_by_property("number of quotes")
+    release.set()
+    cli.wait_for_the_collection(cli.Quotes_Ready)
+    assert len(cli.Quote_Store) == cli.All_Quotes_Count
+    assert not any(book.pending_quotes for book in cli.The_Collection)
+
+
+def test_loading_error_ends_the_wait(cli, tmp_path):
+    broken = tmp_path / "library.json"
+    broken.write_text('{"docs": [{"uri": ', encoding="utf8")
+    cli.LIBRARY_FILE = str(broken)
+    cli.start_loading_the_collection()
+    with pytest.raises(SystemExit):
+        cli.wait_for_the_collection(cli.Metadata_Ready)
@@ -0,0 +1,42 @@
+"""
+The library generator is repeatable and the benchmark harness runs on a
+small library.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT, generate_library
+
+RUN_BENCHMARKS = os.path.join(ROOT, "benchmarks", "run_benchmarks.py")
+
+
+def test_generator_is_repeatable(tmp_path):
+    paths = [str(tmp_path / name) for name in ("a.json", "b.json", "c.json")]
+    generate_library(paths[0], books=30, quotes_per_book=5, seed=4)
+    generate_library(paths[1], books=30, quotes_per_book=5, seed=4)
+    generate_library(paths[2], books=30, quotes_per_book=5, seed=5)
+    contents = []
+    for path in paths:
+        with open(path, "rb") as file:
+            contents.append(file.read())
+    assert contents[0] == contents[1] != contents[2]
+    docs = json.loads(contents[0])["docs"]
+    assert len(docs) == 30
+
+
+def test_harness_saves_the_results(tmp_path):
+    output = str(tmp_path / "results.json")
+    process = subprocess.run([sys.executable, RUN_BENCHMARKS, "--scales", "300", "--memory-quotes", "400",
+                              "--output", output], capture_output=True, text=True, encoding="utf8")
+    assert process.returncode == 0, process.stderr
+    with open(output, encoding="utf8") as file:
+        results = json.load(file)
+    scale = results["scales"]["300"]
+    assert scale["quotes"] > 0
+    assert "build_the_collection" in scale["phases"]
+    assert all(phase["seconds"] >= 0 for phase in scale["phases"].values())
+    memory = results["quote_memory"]
+    assert memory["quotes"] > 0
+    assert 0 < memory["store_bytes"] < memory["object_bytes"]
@@ -0,0 +1,101 @@
+"""
+CollectionIndex lists and select() filters match a scan of The Collection,
+list by property keeps the order of a plain sorted() call.
+"""
+import itertools
+
+import pytest
+
+
+@pytest.fixture
+def index(cli, library):
+    cli.build_the_collection()
+    return cli.Collection_Index
+
+
+def scan(cli, matches):
+    return [position for position, book in enumerate(cli.The_Collection) if matches(book)]
+
+
+def test_lists_match_a_scan(cli, index):
+    assert index.with_quotes == scan(cli, lambda book: book.total_q > 0)
+    assert index.with_annotation == scan(cli, lambda book: bool(book.annotation))
+    assert index.have_read == scan(cli, lambda book: book.have_read_time.year > 1970)
+    assert index.reading_now == scan(cli, lambda book: book.activity_time != 0 and book.have_read_time.year == 1970)
+    for author, positions in index.by_author.items():
+        assert positions == scan(cli, lambda book: book.author == author)
+    assert set(index.by_folder) == {folder for folder in cli.Folders if scan(cli, lambda book: book.folder == folder)}
+    for folder, positions in index.by_folder.items():
+        assert positions == scan(cli, lambda book: book.folder == folder)
+    for century, positions in index.by_century.items():
+        assert positions == scan(cli, lambda book: (century - 1) * 100 <= book.published_date < century * 100)
+
+
+def test_books_get_the_first_folder_listing_them(cli, index):
+    for book in cli.The_Collection:
+        folders = [folder for folder, uris in cli.Folders.items() if book.file_id in uris]
+        assert book.folder == (folders[0] if folders else "")
+
+
+def test_select_combines_the_filters(cli, index):
+    authors = [None] + list(index.by_author)[:5]
+    folders = [None, "Missing folder"] + list(index.by_folder)
+    centuries = [None] + sorted(index.by_century)[:3]
+    for author, folder, century, with_quotes in itertools.product(authors, folders, centuries, [False, True]):
+        expected = scan(cli, lambda book: (author is None or book.author == author)
+                                          and (folder is None or book.folder == folder)
+                                          and (century is None or (century - 1) * 100 <= book.published_date < century * 100)
+                                          and (not with_quotes or book.total_q > 0))
+        assert index.select(author=author, folder=folder, century=century, with_quotes=with_quotes) == expected
+
+
+def test_select_within_given_positions(cli, index):
+    folder = next(iter(index.by_folder))
+    expected = [position for position in index.have_read if cli.The_Collection[position].folder == folder]
+    assert index.select(folder=folder, positions=index.have_read) == expected
+    assert index.get_books(expected) == [cli.The_Collection[position] for position in expected]
+
+
+def test_snapshot_builds_the_same_index(cli, library):
+    cli.load_the_collection()
+    built = vars(cli.Collection_Index).copy()
+    cli.Collection_Index = None
+    assert cli.load_collection_snapshot()
+    restored = vars(cli.Collection_Index)
+    for name in ["folder_of_file", "by_author", "by_folder", "by_century", "have_read", "reading_now",
+                 "with_quotes", "with_annotation"]:
+        assert restored[name] == built[name]
+
+
+def list_with_sorted(cli, book_property, folder=None, century=None):
+    # the list code before the cached orders, kept here as the reference
+    books = [book for book in cli.The_Collection
+             if (folder is None or book.folder == folder)
+             and (century is None or (century - 1) * 100 <= book.published_date < century * 100)]
+    if book_property == "reading now":
+        books = [book for book in books if book.activity_time != 0 and book.have_read_time.year == 1970]
+    elif book_property in ["finished list", "read duration", "continued_as_publish_date_of_finished"]:
+        books = [book for book in books if book.have_read_time.year > 1970]
+    books = sorted(books, key=cli.LIST_SORT_KEYS[book_property], reverse=book_property != "folder")
+    return [book for book in books if cli.is_listed_by_property(book, book_property)]
+
+
+def test_lists_keep_the_sorted_order(cli, index):
+    folder = next(iter(index.by_folder))
+    century = max(index.by_century, key=lambda century: len(index.by_century[century]))
+    for book_property in cli.LIST_SORT_KEYS:
+        for filters in [{}, {"folder": folder}, {"century": century}, {"folder": folder, "century": century}]:
+            expected = list_with_sorted(cli, book_property, **filters)
+            assert cli.list_books_by_property(book_property, **filters) == expected
+            assert index.has_sort_order(book_property)
+
+
+@pytest.mark.parametrize("limit", [0, 1, 5, 1000])
+def test_top_books_with_and_without_a_cached_order(cli, index, limit):
+    for book_property in cli.LIST_SORT_KEYS:
+        expected = list_with_sorted(cli, book_property)[:limit]
+        # the first call selects with a heap, the second one uses the order
+        assert cli.list_books_by_property(book_property, limit=limit) == expected
+        assert not index.has_sort_order(book_property)
+        cli.list_books_by_property(book_property)
+        assert cli.list_books_by_property(book_property, limit=limit) == expected
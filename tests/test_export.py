@@ -0,0 +1,78 @@
+"""
+export-all writes one file per book in the menu's txt layout, Markdown or
+JSON lines, the same files with any number of workers.
+"""
+import json
+import os
+
+import pytest
+
+from test_headless import run_json
+
+
+@pytest.fixture
+def books(cli, library):
+    cli.build_the_collection()
+    return cli.Collection_Index.get_books(cli.Collection_Index.with_quotes)
+
+
+def read_files(directory):
+    files = {}
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name), encoding="utf8") as file:
+            files[name] = file.read()
+    return files
+
+
+def test_txt_files_match_the_menu_export(cli, books, library, tmp_path):
+    records = run_json(library, "export-all", "--to", str(tmp_path / "export"))
+    assert [record["book"] for record in records] == [book.title for book in books]
+    for book, record in zip(books, records):
+        menu_path = str(tmp_path / "menu.txt")
+        cli.write_book_txt(book, menu_path)
+        with open(menu_path, encoding="utf8") as menu_file, open(record["file"], encoding="utf8") as file:
+            assert file.read() == menu_file.read()
+        assert record["quotes"] == book.total_q
+        assert record["bytes"] == os.path.getsize(record["file"])
+
+
+def test_markdown_and_json_lines(cli, books, tmp_path):
+    book = max(books, key=lambda book: book.total_q)
+    quotes = sorted(book.get_all_quotes_list(), key=lambda quote: quote.page)
+
+    record, = cli.export_books([book], str(tmp_path / "md"), "md", progress=False)
+    with open(record["file"], encoding="utf8") as file:
+        lines = file.read().split('\n')
+    assert lines[0] == f"# {book.title}"
+    assert f"**1 / {len(quotes)}**  (p.{quotes[0].page})" in lines
+    assert f"> {quotes[0].text}" in lines
+
+    record, = cli.export_books([book], str(tmp_path / "jsonl"), "jsonl", progress=False)
+    with open(record["file"], encoding="utf8") as file:
+        exported = [json.loads(line) for line in file]
+    assert exported == [{"book": book.title, "author": book.author or "", "number": i + 1, "page": quote.page,
+                         "text": quote.text} for i, quote in enumerate(quotes)]
+
+
+@pytest.mark.parametrize("pool", ["thread", "process"])
+def test_workers_write_the_same_files(cli, books, tmp_path, pool):
+    serial = cli.export_books(books, str(tmp_path / "serial"), "md", progress=False)
+    parallel = cli.export_books(books, str(tmp_path / pool), "md", workers=3, pool=pool, progress=False)
+    assert [(record["book"], record["bytes"]) for record in serial] == \
+        [(record["book"], record["bytes"]) for record in parallel]
+    assert read_files(str(tmp_path / "serial")) == read_files(str(tmp_path / pool))
+
+
+def test_filter_by_author(cli, books, library, tmp_path):
+    author = books[0].author
+    records = run_json(library, "export-all", "--to", str(tmp_path / "author"), "--as", "jsonl", "--author", author)
+    assert [record["book"] for record in records] == [book.title for book in books if book.author == author]
+
+
+def test_safe_unique_file_names(cli):
+    used = set()
+    names = [cli.get_safe_filename(title, "txt", used)
+             for title in ['A: "B" / C?', "a_ _b_ _ c_", "CON", "Title.", "Title", "title", "é" * 200, ""]]
+    assert names[:7] == ["A_ _B_ _ C_.txt", "a_ _b_ _ c_ (2).txt", "_CON.txt", "Title.txt", "Title (2).txt",
+                         "title (3).txt", "é" * 90 + ".txt"]
+    assert names[7] == "untitled.txt"
@@ -0,0 +1,151 @@
+"""
+Headless commands print the records of the menu code paths as JSON or
+TSV, batch answers every line of stdin with one JSON line.
+"""
+import io
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from conftest import SCRIPT_PATH
+
+
+def run_script(library, *args, stdin=None):
+    # the script reads library.json from the working folder
+    process = subprocess.run([sys.executable, SCRIPT_PATH, *args], cwd=os.path.dirname(library),
+                             input=stdin, capture_output=True, text=True, encoding="utf8")
+    return process
+
+
+def run_json(library, *args):
+    process = run_script(library, *args)
+    assert process.returncode == 0, process.stderr
+    return json.loads(process.stdout)
+
+
+@pytest.fixture
+def collection(cli, library):
+    cli.build_the_collection()
+    return cli
+
+
+def test_stats_counts_the_collection(collection, library):
+    records = run_json(library, "stats")
+    counts = {(record["section"], record["name"]): record["count"] for record in records}
+    assert counts[("books", "total")] == len(collection.The_Collection)
+    assert counts[("books", "with quotes")] == len(collection.Collection_Index.with_quotes)
+    assert counts[("quotes", "total")] == collection.All_Quotes_Count
+    words = [record for record in records if record["section"] == "words"]
+    assert [(record["name"], record["count"]) for record in words] == \
+        collection.get_word_statistics().counts.most_common(30)
+
+
+def test_search_returns_the_menu_results(collection, library):
+    records = run_json(library, "search", '"the river" OR mountain*')
+    _, groups, _, _ = collection.find_search_results('"the river" OR mountain*')
+    assert [(record["book"], record["page"], record["text"]) for record in records] == \
+        [(book.title, quote.page, quote.text) for book, quotes in groups for quote in quotes]
+    assert all(record["match"] == "quote" for record in records)
+
+
+@pytest.mark.parametrize("name", ["added-on", "reading-now", "finished", "finished-by-publish-date", "read-duration",
+                                  "publish-date", "quotes", "quote-page-ratio", "rating", "ratings-count", "folder"])
+def test_list_follows_the_menu_order(collection, library, name):
+    folder = next(iter(collection.Collection_Index.by_folder))
+    for args in ([], ["--folder", folder]):
+        records = run_json(library, "list", "--by", name, *args)
+        books = collection.list_books_by_property(collection.LIST_PROPERTY_NAMES[name], *([folder] if args else []))
+        assert [record["title"] for record in records] == [book.title for book in books]
+
+
+def test_list_top_books(collection, library):
+    records = run_json(library, "list", "--by", "rating")
+    assert run_json(library, "list", "--by", "rating", "--top", "3") == records[:3]
+
+
+def test_random_quotes_are_repeatable_with_a_seed_and_never_repeat(collection, library):
+    author = max(collection.Collection_Index.by_author,
+                 key=lambda name: sum(book.total_q for book in collection.Collection_Index.get_books(
+                     collection.Collection_Index.by_author[name])))
+    total = sum(book.total_q for book in collection.Collection_Index.get_books(collection.Collection_Index.by_author[author]))
+    records = run_json(library, "random", "--author", author, "--count", str(total + 5), "--seed", "4")
+    assert len(records) == total
+    assert len({(record["book"], record["page"], record["text"]) for record in records}) == total
+    assert all(record["author"] == author for record in records)
+    assert records == run_json(library, "random", "--author", author, "--count", str(total + 5), "--seed", "4")
+
+    short = run_json(library, "random", "--length", "short", "--count", "50", "--seed", "1")
+    assert len(short) == 50
+    assert all(len(record["text"]) <= collection.MAX_CHAR_IN_SHORT_QUOTE for record in short)
+
+
+def test_export_writes_the_quotes_in_page_order(collection, library, tmp_path):
+    book = max(collection.The_Collection, key=lambda book: book.total_q)
+    path = str(tmp_path / "export.txt")
+    records = run_json(library, "export", "--book", book.title, "--txt", path)
+    quotes = sorted(book.get_all_quotes_list(), key=lambda quote: quote.page)
+    assert [(record["number"], record["page"], record["text"]) for record in records] == \
+        [(i + 1, quote.page, quote.text) for i, quote in enumerate(quotes)]
+    with open(path, encoding="utf8") as file:
+        lines = file.read().split('\n')
+    assert lines[:4] == [book.title, '-' * len(book.title), f"1 / {len(quotes)}  (p.{quotes[0].page})", quotes[0].text]
+
+
+def test_tsv_output_escapes_the_values(cli):
+    records = [{"a": "tab\there", "b": 1}, {"a": "line\nbreak", "c": "back\\slash"}]
+    output = io.StringIO()
+    cli.emit_records(records, "tsv", file=output)
+    assert output.getvalue() == "a\tb\tc\ntab\\there\t1\t\nline\\nbreak\t\tback\\\\slash\n"
+
+
+def test_errors_exit_with_a_message(library):
+    process = run_script(library, "export", "--book", "No such book")
+    assert process.returncode == 1
+    assert "unknown book: No such book" in process.stderr
+
+
+def test_library_option_reads_a_backup_from_anywhere(collection, library, tmp_path):
+    backup = str(tmp_path / "ReadEra.bak")
+    with zipfile.ZipFile(backup, "w") as archive:
+        archive.write(library, "library.json")
+    process = subprocess.run([sys.executable, SCRIPT_PATH, "--library", backup, "stats"], cwd=os.path.dirname(SCRIPT_PATH),
+                             capture_output=True, text=True, encoding="utf8")
+    assert process.returncode == 0, process.stderr
+    assert json.loads(process.stdout) == run_json(library, "stats")
+    # the cache files are next to the backup
+    assert os.path.exists(f"{backup}.snapshot")
+
+
+def test_batch_answers_every_line(collection, library):
+    commands = ["stats", "", "list --by rating", "random --author 'Nobody here'", "search", "nonsense"]
+    process = run_script(library, "batch", stdin='\n'.join(commands) + '\n')
+    assert process.returncode == 0, process.stderr
+    results = [json.loads(line) for line in process.stdout.splitlines()]
+    assert [result["command"] for result in results] == [command for command in commands if command]
+    assert results[0]["records"] == run_json(library, "stats")
+    assert results[1]["records"] == run_json(library, "list", "--by", "rating")
+    assert results[2]["error"] == "unknown author: Nobody here"
+    assert "error" in results[3] and "error" in results[4]
+
+
+@pytest.mark.parametrize("sampling", ["quotes", "books"])
+def test_batch_lines_run_like_separate_commands(collection, library, sampling):
+    author = max(collection.Collection_Index.by_author,
+                 key=lambda author: len(collection.Collection_Index.by_author[author]))
+    total = sum(book.total_q for book in collection.Collection_Index.get_books(collection.Collection_Index.by_author[author]))
+    # every quote of the author, twice: the second command starts from full pools again
+    commands = [f"random --author {json.dumps(author)} --count {total}"] * 2 + ["random --count 30 --seed 4"] * 2
+    process = run_script(library, "--sampling", sampling, "batch", stdin='\n'.join(commands) + '\n')
+    assert process.returncode == 0, process.stderr
+    results = [json.loads(line) for line in process.stdout.splitlines()]
+    assert all("records" in result for result in results), results
+    for result in results[:2]:
+        assert sorted(record["text"] for record in result["records"]) == sorted(
+            quote.text for book in collection.Collection_Index.get_books(collection.Collection_Index.by_author[author])
+            for quote in book.get_all_quotes_list())
+    assert results[2]["records"] == results[3]["records"] == run_json(library, "--sampling", sampling, "random",
+                                                                      "--count", "30", "--seed", "4")
@@ -0,0 +1,121 @@
+"""
+HeavyHitters counts are never too high, at most error_bound too low, and
+every item more frequent than error_bound is kept.
+"""
+import random
+from collections import Counter
+
+import pytest
+
+from test_headless import run_json, run_script
+
+
+def zipf_stream(seed, items, length):
+    rnd = random.Random(seed)
+    weights = [1 / rank for rank in range(1, items + 1)]
+    return [f"item{index}" for index in rnd.choices(range(items), weights, k=length)]
+
+
+def check_bounds(summary, exact, total):
+    assert summary.error_bound <= total / (summary.capacity + 1)
+    assert len(summary.counts) <= 2 * summary.capacity
+    for item, count in summary.counts.items():
+        assert exact[item] - summary.error_bound <= count <= exact[item]
+    for item, count in exact.items():
+        if count > summary.error_bound:
+            assert item in summary.counts
+
+
+@pytest.mark.parametrize("capacity", [1, 10, 100])
+def test_error_bounds_of_a_stream(cli, capacity):
+    stream = zipf_stream(capacity, 2000, 30000)
+    summary = cli.HeavyHitters(capacity)
+    # batches of different sizes, like the phrases of the books
+    rnd = random.Random(1)
+    position = 0
+    while position < len(stream):
+        size = rnd.randint(1, 500)
+        summary.update(stream[position:position + size])
+        position += size
+    exact = Counter(stream)
+    check_bounds(summary, exact, len(stream))
+    assert summary.error_bound > 0
+
+    top = summary.most_common(5)
+    assert [count for _, count in top] == sorted((count for _, count in top), reverse=True)
+    if capacity >= 100:
+        assert [item for item, _ in top] == [item for item, _ in exact.most_common(5)]
+
+
+def test_no_pruning_gives_exact_counts(cli):
+    stream = zipf_stream(2, 50, 5000)
+    summary = cli.HeavyHitters(50)
+    summary.update(stream)
+    assert summary.error_bound == 0
+    assert summary.counts == Counter(stream)
+
+
+def test_phrase_statistics_bounds(cli, library):
+    cli.build_the_collection()
+    statistics = cli.PhraseStatistics(cli.The_Collection, 20)
+    for size in cli.PHRASE_SIZES:
+        exact = Counter()
+        for text in cli.Quote_Store.texts:
+            for clause in cli.PHRASE_BREAK_PATTERN.split(text.lower()):
+                words = cli.PHRASE_WORD_PATTERN.findall(clause)
+                counted = [len(word) >= 4 and word not in cli.WORDS_TO_OMIT for word in words]
+                exact.update(' '.join(words[i:i + size]) for i in range(len(words) - size + 1)
+                             if counted[i] and counted[i + size - 1])
+        check_bounds(statistics.summaries[size], exact, sum(exact.values()))
+        assert statistics.get_error_bound(size) == statistics.summaries[size].error_bound
+
+
+def test_phrase_statistics_are_kept_per_group(cli, library):
+    cli.build_the_collection()
+    whole = cli.get_phrase_statistics()
+    assert cli.get_phrase_statistics() is whole
+    folder = next(iter(cli.Collection_Index.by_folder))
+    in_folder = cli.get_phrase_statistics(folder, "Folder")
+    assert in_folder is not whole
+    assert cli.get_phrase_statistics(folder, "Folder") is in_folder
+    books = cli.Collection_Index.get_books(cli.Collection_Index.select(folder=folder, with_quotes=True))
+    expected = cli.PhraseStatistics(books, cli.Phrase_Counters)
+    for size in cli.PHRASE_SIZES:
+        assert in_folder.get_top_phrases(size, 10) == expected.get_top_phrases(size, 10)
+
+
+def test_phrases_command_prints_the_top_phrases(cli, library):
+    cli.build_the_collection()
+    author = cli.Collection_Index.get_books(cli.Collection_Index.with_quotes)[0].author
+    statistics = cli.get_phrase_statistics(author, "Author")
+    records = run_json(library, "phrases", "--author", author, "--top", "5")
+    assert records == [{"words": size, "phrase": phrase, "count": count, "max_error": statistics.get_error_bound(size)}
+                       for size in cli.PHRASE_SIZES for phrase, count in statistics.get_top_phrases(size, 5)]
+
+
+@pytest.mark.parametrize("option, value", [("--phrase-counters", "0"), ("--phrase-counters", "-3"),
+                                           ("--phrase-error", "0"), ("--phrase-error", "1"), ("--phrase-error", "-0.5")])
+def test_phrase_options_are_checked(library, option, value):
+    process = run_script(library, option, value, "phrases")
+    assert process.returncode == 2
+    assert f"{option} must be" in process.stderr
+
+
+def test_phrase_error_sets_the_counters(library):
+    # an error of 0.25 keeps 3 counters: the error is at most phrases / (counters + 1)
+    assert run_json(library, "--phrase-error", "0.25", "phrases") == run_json(library, "--phrase-counters", "3", "phrases")
+
+
+def test_statistics_count_the_phrases_once(cli, library, monkeypatch, capsys):
+    cli.build_the_collection()
+    monkeypatch.setattr("builtins.input", lambda *args: "")
+    phrase_statistics = cli.PhraseStatistics
+    built = []
+    monkeypatch.setattr(cli, "PhraseStatistics", lambda *args: built.append(args) or phrase_statistics(*args))
+    cli.print_statistics()
+    cli.print_statistics()
+    output = capsys.readouterr().out
+    assert output.count("Top 15 phrases of 2 words") == 2
+    assert len(built) == 1
+    phrase, count = cli.get_phrase_statistics().get_top_phrases(2, 1)[0]
+    assert f" --> {count:3d} x {phrase}\n" in output
@@ -0,0 +1,128 @@
+"""
+diff and history: changes between library files, unchanged docs are
+stored once and a file already in the history is not read again.
+"""
+import datetime
+import json
+import shutil
+
+import pytest
+
+from test_headless import run_json
+
+
+@pytest.fixture
+def versions(library, tmp_path):
+    """
+    Paths of the generated library and of a second version with one
+    change of every kind, and the expected changes between them.
+    """
+    with open(library, encoding="utf8") as file:
+        data = json.load(file)
+    docs = [doc for doc in data["docs"] if doc["data"]["doc_active"] == 1 and doc["citations"]]
+
+    edited, added_to, removed_from, renamed, finished, deactivated, removed = docs[:7]
+    edited["citations"][0]["note_body"] += " edited"
+    added_to["citations"].append({"note_body": "A new quote", "note_page": 3, "note_insert_time": 1700000000000})
+    removed_quote = removed_from["citations"].pop()
+    old_title = renamed["data"]["doc_file_name_title"]
+    renamed["data"]["doc_file_name_title"] = "Renamed book"
+    finished["data"]["doc_have_read_time"] = 0 if finished["data"]["doc_have_read_time"] else 1700000000000
+    deactivated["data"]["doc_active"] = 0
+    data["docs"].remove(removed)
+    new_doc = json.loads(json.dumps(docs[7]))
+    new_doc["uri"] = "content://new/1"
+    data["docs"].append(new_doc)
+
+    path = str(tmp_path / "library-2.json")
+    with open(path, "w", encoding="utf8") as file:
+        json.dump(data, file)
+
+    def title(doc):
+        return doc["data"]["doc_file_name_title"].lstrip("_[]0123456789 ")
+
+    first = edited["citations"][0]
+    was_finished = not finished["data"]["doc_have_read_time"]
+    expected = {
+        ("quote changed", edited["uri"], title(edited), f"p.{first['note_page']}: {first['note_body']}"),
+        ("quote added", added_to["uri"], title(added_to), "p.3: A new quote"),
+        ("quote removed", removed_from["uri"], title(removed_from),
+         f"p.{removed_quote['note_page']}: {removed_quote['note_body']}"),
+        ("book changed", renamed["uri"], "Renamed book", f"renamed from {old_title.lstrip('_[]0123456789 ')}"),
+        ("status", finished["uri"], title(finished), f"have read: {was_finished} -> {not was_finished}"),
+        ("status", deactivated["uri"], title(deactivated), "active: True -> False"),
+        ("book removed", removed["uri"], title(removed), f"{len(removed['citations'])} quotes"),
+        ("book added", new_doc["uri"], title(new_doc), f"{len(new_doc['citations'])} quotes"),
+        }
+    if finished["data"]["doc_activity_time"] and was_finished:
+        expected.add(("status", finished["uri"], title(finished), "reading now: False -> True"))
+    elif finished["data"]["doc_activity_time"]:
+        expected.add(("status", finished["uri"], title(finished), "reading now: True -> False"))
+    return library, path, expected
+
+
+def get_changes(records):
+    return {(record["change"], record["uri"], record["book"], record["detail"]) for record in records}
+
+
+def test_diff_reports_every_change(versions):
+    old, new, expected = versions
+    records = run_json(old, "diff", old, new)
+    assert get_changes(records) == expected
+    assert {(record["from"], record["to"]) for record in records} == {(old, new)}
+    assert run_json(old, "diff", old, old) == []
+
+
+def test_diff_of_more_files_compares_each_with_the_previous_one(versions):
+    old, new, expected = versions
+    records = run_json(old, "diff", old, new, old)
+    assert get_changes(record for record in records if record["to"] == new) == expected
+    assert len([record for record in records if record["to"] == old]) == len(expected)
+
+
+def test_history_stores_unchanged_docs_once(versions, tmp_path):
+    old, new, expected = versions
+    copy = str(tmp_path / "copy.json")
+    shutil.copyfile(old, copy)
+    records = run_json(old, "history", "add", old, new, copy)
+    assert [record["stored"] for record in records] == [True, True, False]
+    # only the 6 changed docs and the added one of the second file are new versions
+    assert records[1]["new_doc_versions"] == 7
+    assert records[2]["new_doc_versions"] == 0
+
+    assert [record["file"] for record in run_json(old, "history", "list")] == [old, new]
+    assert get_changes(run_json(old, "history", "diff")) == expected
+    assert run_json(old, "history", "add", new)[0]["stored"] is False
+
+
+def test_weekly_counts_every_quote_once(versions):
+    old, new, _ = versions
+    run_json(old, "history", "add", old, new)
+    seen = set()
+    for path in (old, new):
+        with open(path, encoding="utf8") as file:
+            for doc in json.load(file)["docs"]:
+                seen.update((doc["uri"], citation["note_insert_time"]) for citation in doc["citations"])
+    weeks = {}
+    for _, insert_time in seen:
+        year, week, _ = datetime.datetime.fromtimestamp(insert_time / 1000).isocalendar()
+        weeks[f"{year}-W{week:02d}"] = weeks.get(f"{year}-W{week:02d}", 0) + 1
+    assert run_json(old, "history", "weekly") == [{"week": week, "quotes": count} for week, count in sorted(weeks.items())]
+
+
+
+def test_unchanged_docs_of_the_previous_file_are_not_decoded(cli, versions, monkeypatch):
+    old, new, expected = versions
+    old_docs, old_lengths, old_summaries = cli.read_library_summary(old, {})
+    new_docs, new_lengths, new_summaries = cli.read_library_summary(new, {})
+
+    decoded = []
+    get_doc_summary = cli.get_doc_summary
+    monkeypatch.setattr(cli, "get_doc_summary", lambda doc: decoded.append(doc["uri"]) or get_doc_summary(doc))
+    docs, lengths, summaries = cli.read_library_summary(new, old_summaries, (old_docs, old_lengths))
+    assert (docs, lengths) == (new_docs, new_lengths)
+    assert summaries == {fingerprint: summary for fingerprint, summary in new_summaries.items()
+                         if fingerprint not in old_summaries}
+    # only the changed and the added docs are decoded
+    changed = {uri for _, uri, _, _ in expected} - {uri for uri in old_docs if uri not in new_docs}
+    assert set(decoded) == changed
@@ -0,0 +1,62 @@
+"""
+--timings, --profile and --memory-dump report a run without changing its
+output.
+"""
+import pstats
+import time
+import tracemalloc
+
+from test_headless import run_script
+
+
+def test_timings_report_the_phases(library):
+    # the first run builds The Collection, the second one loads the snapshot
+    timed = run_script(library, "--timings", "stats")
+    assert timed.returncode == 0, timed.stderr
+    assert timed.stdout == run_script(library, "stats").stdout
+    phases = [line[:40].strip() for line in timed.stderr.splitlines()[2:]]
+    assert {"json decode", "doc loop", "citation ingestion", "aggregation", "snapshot save",
+            "command / stats"} <= set(phases)
+    reloaded = run_script(library, "--timings", "stats")
+    assert "snapshot load" in reloaded.stderr and "doc loop" not in reloaded.stderr
+
+
+def test_profile_and_memory_dump_are_written(library, tmp_path):
+    profile, dump = str(tmp_path / "run.prof"), str(tmp_path / "run.dump")
+    process = run_script(library, "--profile", profile, "--memory-dump", dump, "stats")
+    assert process.returncode == 0, process.stderr
+    assert pstats.Stats(profile).total_calls > 0
+    assert tracemalloc.Snapshot.load(dump).traces
+
+
+def test_timer_leaves_out_the_input_wait(cli, monkeypatch):
+    timer = cli.PhaseTimer(["first"])
+    namespace = {}
+    monkeypatch.setattr("builtins.input", lambda *args: time.sleep(0.2) or "")
+    timer.wrap_input(namespace)
+    timer.start_action("action")
+    namespace["input"]("> ")
+    timer.stop_action()
+    calls, seconds, _, _ = timer.phases["action"]
+    assert calls == 1 and seconds < 0.1
+    assert timer.phases["first"][0] == 0
+
+
+def test_memory_report_keeps_an_active_trace(library, tmp_path):
+    dump = str(tmp_path / "run.dump")
+    process = run_script(library, "--memory-dump", dump, "--memory-report")
+    assert process.returncode == 0, process.stderr
+    assert tracemalloc.Snapshot.load(dump).traces
+
+
+def test_memory_report_measures_from_the_current_trace(cli, library):
+    tracemalloc.start()
+    try:
+        # 10 MB traced before the build are not part of its peak
+        ballast = [bytes(10000) for _ in range(1000)]
+        _, peak, retained = cli.measure_collection_build("stream")
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    assert 0 < retained <= peak < 10000 * 1000
+    del ballast
@@ -0,0 +1,154 @@
+"""
+The stream, full and parallel parsers build the same collection, also
+from a ReadEra .bak archive.
+"""
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+from conftest import get_collection_state
+
+
+@pytest.fixture
+def stream_state(cli, library):
+    cli.build_the_collection("stream")
+    return get_collection_state(cli)
+
+
+def test_full_parser_builds_the_same_collection(cli, library, stream_state):
+    cli.build_the_collection("full")
+    assert get_collection_state(cli) == stream_state
+
+
+def build_parallel(cli, workers):
+    # every file is cut into chunks, even a small one
+    cli.PARALLEL_PARSE_MIN_CHARS = 0
+    cli.PARALLEL_CHUNK_CHARS = 20000
+    cli.Parse_Workers = workers
+    cli.build_the_collection("parallel")
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_parser_builds_the_same_collection(cli, library, stream_state, workers):
+    build_parallel(cli, workers)
+    assert get_collection_state(cli) == stream_state
+
+
+def test_parallel_parser_fingerprints_the_docs_in_watch_mode(cli, library):
+    cli.Doc_Fingerprints = {}
+    cli.build_the_collection("stream")
+    fingerprints = dict(cli.Doc_Fingerprints)
+    cli.Doc_Fingerprints = {}
+    build_parallel(cli, 2)
+    assert cli.Doc_Fingerprints == fingerprints
+
+
+def test_parallel_parser_falls_back_on_a_boundary_inside_a_string(cli, library, stream_state):
+    # a chunk starting in the middle of a quote text cuts the doc before it
+    def find_start_in_a_string(text, pos):
+        return text.index('"note_body"', pos) + 3
+
+    read_docs_in_pool = cli.read_docs_in_pool
+    results = []
+    cli.find_doc_start = find_start_in_a_string
+    cli.read_docs_in_pool = lambda *args: results.append(read_docs_in_pool(*args)) or results[-1]
+    build_parallel(cli, 2)
+    assert results == [None]
+    assert get_collection_state(cli) == stream_state
+
+
+def test_single_worker_streams_the_file(cli, library, stream_state, monkeypatch):
+    monkeypatch.setattr(cli, "read_docs_in_pool", lambda *args: pytest.fail("no pool for one worker"))
+    build_parallel(cli, 1)
+    assert get_collection_state(cli) == stream_state
+
+
+def test_one_cpu_streams_the_file(cli, library, stream_state, monkeypatch):
+    monkeypatch.setattr(cli.os, "cpu_count", lambda: 1)
+    monkeypatch.setattr(cli, "read_docs_in_pool", lambda *args: pytest.fail("no pool on one CPU"))
+    build_parallel(cli, 0)
+    assert get_collection_state(cli) == stream_state
+
+
+def test_parallel_parser_does_not_read_the_whole_file(cli, library, stream_state, monkeypatch):
+    buffer_sizes = []
+    fill = cli.JsonStreamReader._fill
+
+    def recorded_fill(reader, min_size=0):
+        filled = fill(reader, min_size)
+        buffer_sizes.append(len(reader.buffer))
+        return filled
+    monkeypatch.setattr(cli.JsonStreamReader, "_fill", recorded_fill)
+    chunks = []
+    submit = cli.ProcessPoolExecutor.submit
+
+    def recorded_submit(executor, function, text, *args):
+        chunks.append(text)
+        return submit(executor, function, text, *args)
+    monkeypatch.setattr(cli.ProcessPoolExecutor, "submit", recorded_submit)
+    cli.STREAM_CHUNK_SIZE = 4096
+    build_parallel(cli, 2)
+    assert get_collection_state(cli) == stream_state
+    assert len(chunks) > 4
+    assert max(buffer_sizes) < os.path.getsize(library) / 4
+
+
+def test_small_chunks_build_the_same_collection(cli, library, stream_state):
+    # values and strings cut by the chunk boundaries again and again
+    cli.STREAM_CHUNK_SIZE = 7
+    cli.build_the_collection("stream")
+    assert get_collection_state(cli) == stream_state
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 64])
+def test_stream_reader_yields_the_streamed_arrays_element_by_element(cli, chunk_size):
+    data = {"version": 1,
+            "docs": [{"uri": "a", "text": "a \"quoted\" {brace} [and] \\ é"}, [], 12.5e3, None, "},]"],
+            "empty": [],
+            "colls": [{"docs": ["a"]}],
+            "last": -7}
+    text = json.dumps(data, indent=1) + "\n"
+    reader = cli.JsonStreamReader(io.StringIO(text), chunk_size)
+    pairs = list(reader.iter_object(streamed_keys=("docs", "empty")))
+    assert pairs == [("version", 1)] + [("docs", doc) for doc in data["docs"]] + [
+        ("colls", data["colls"]), ("last", -7)]
+
+
+@pytest.mark.parametrize("text", ['{"docs": [1, 2', '{"docs": [1 2]}', '[1]', '{"docs": [1], "x": tru}'])
+def test_stream_reader_rejects_broken_files(cli, text):
+    reader = cli.JsonStreamReader(io.StringIO(text), 2)
+    with pytest.raises(json.JSONDecodeError):
+        list(reader.iter_object(streamed_keys=("docs",)))
+
+
+def write_backup(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, source in members:
+            archive.write(source, name)
+    return path
+
+
+@pytest.mark.parametrize("parser", ["stream", "full", "parallel"])
+def test_parsers_accept_a_backup_file(cli, library, tmp_path, stream_state, parser):
+    cli.LIBRARY_FILE = write_backup(str(tmp_path / "ReadEra.bak"), [("library.json", library)])
+    cli.build_the_collection(parser)
+    assert get_collection_state(cli) == stream_state
+
+
+def test_backup_uses_the_top_level_library(cli, library, tmp_path, stream_state):
+    other = tmp_path / "other.json"
+    other.write_text('{"docs": [], "colls": []}', encoding="utf8")
+    cli.LIBRARY_FILE = write_backup(str(tmp_path / "ReadEra.bak"), [("backup/old/library.json", str(other)),
+                                                                    ("backup/library.json", library)])
+    cli.build_the_collection()
+    assert get_collection_state(cli) == stream_state
+
+
+def test_backup_without_a_library_is_an_error(cli, library, tmp_path):
+    cli.LIBRARY_FILE = write_backup(str(tmp_path / "ReadEra.bak"), [("other.json", library)])
+    with pytest.raises(FileNotFoundError):
+        with cli.open_library_file(cli.LIBRARY_FILE):
+            pass
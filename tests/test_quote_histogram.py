@@ -0,0 +1,84 @@
+"""
+QuoteHistogram draws the same book diagram as the former columns x quotes
+loop, and the group view puts every quote on the percent axis.
+"""
+import pytest
+
+
+@pytest.fixture
+def books(cli, library):
+    cli.build_the_collection()
+    return [book for book in cli.Collection_Index.get_books(cli.Collection_Index.with_quotes) if book.pages_count]
+
+
+def render_with_loops(book, columns):
+    # the diagram code before QuoteHistogram, kept here as the reference
+    space = "    "
+    rows = round(columns * 0.2)
+    res = book.pages_count / columns
+    q_distr = []
+    for i in range(columns):
+        q_distr.append(0)
+        for quote in book.get_all_quotes_list():
+            if res * i < quote.page <= res * (i + 1):
+                q_distr[i] += len(quote.text)
+    old_min, old_max = min(q_distr), max(q_distr)
+    mapped_distr = [rows * (x - old_min) / (old_max - old_min) for x in q_distr]
+    lines = [f"{space}↑"]
+    for i in range(rows):
+        lines.append(f"{space}|{''.join('*' if mapped_distr[j] >= (rows - i) else ' ' for j in range(columns))}")
+    lines.append(f"{space}{'-' * columns}→")
+    lines.append(f"{space}1{' ' * (columns - len(str(book.pages_count)) + 1)}{book.pages_count}")
+    return lines
+
+
+@pytest.mark.parametrize("columns", [7, 40, 110])
+def test_book_diagram_matches_the_loops(cli, books, columns):
+    histogram = cli.QuoteHistogram()
+    for book in books:
+        buckets = histogram.get_buckets(*histogram.get_arrays(book), book.pages_count, columns)
+        if min(buckets) == max(buckets):
+            continue
+        assert histogram.render_book(book, columns) == render_with_loops(book, columns)
+
+
+def test_numpy_buckets_match_the_bisect_ones(cli, books):
+    pytest.importorskip("numpy")
+    with_numpy = cli.QuoteHistogram()
+    cli.np = None
+    without_numpy = cli.QuoteHistogram()
+    for book in books:
+        arrays = with_numpy.get_arrays(book)
+        assert with_numpy.get_buckets(*arrays, book.pages_count, 50) == \
+            without_numpy.get_buckets(*arrays, book.pages_count, 50)
+
+
+def test_empty_distribution_does_not_divide_by_zero(cli, library):
+    cli.build_the_collection()
+    book = cli.Book("No pages")
+    book.set_quotes(cli.QuoteStore(), [("A quote without a page count", 12, 0)])
+    lines = cli.QuoteHistogram().render_book(book, 20)
+    assert lines[-1].endswith("0")
+    assert not any('*' in line for line in lines)
+
+
+def test_group_diagram_uses_the_percent_of_each_book(cli, books):
+    histogram = cli.QuoteHistogram()
+    columns = 20
+    expected = [0] * columns
+    for book in books:
+        for quote in book.get_all_quotes_list():
+            percent = quote.page * 100 / book.pages_count
+            for i in range(columns):
+                if 100 / columns * i < percent <= 100 / columns * (i + 1):
+                    expected[i] += len(quote.text)
+    percents, lengths = [], []
+    for book in books:
+        pages, book_lengths = histogram.get_arrays(book)
+        percents.extend(page * 100 / book.pages_count for page in pages)
+        lengths.extend(book_lengths)
+    assert histogram.get_buckets(percents, lengths, 100, columns) == expected
+
+    lines = histogram.render_group(books, columns)
+    assert lines[-1] == f"{histogram.SPACE}0%{' ' * (columns - 4)}100%"
+    assert histogram.render_group(books, columns) is lines
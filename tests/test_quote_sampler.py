@@ -0,0 +1,129 @@
+"""
+QuoteSampler draws every quote exactly once, then runs out. The shown
+quotes are recorded across sessions and can be preferred by age.
+"""
+import copy
+import json
+import os
+import random
+
+import pytest
+
+from test_headless import run_json
+
+
+@pytest.fixture
+def books(cli, library):
+    cli.build_the_collection()
+    random.seed(3)
+    return cli.Collection_Index.get_books(cli.Collection_Index.with_quotes)
+
+
+def draw_all(sampler):
+    drawn = []
+    while True:
+        result = sampler.draw()
+        if result is None:
+            return drawn
+        drawn.append(result)
+
+
+def test_pool_draws_every_item_once(cli):
+    pool = cli.QuotePool(range(100))
+    drawn = [pool.draw() for _ in range(100)]
+    assert sorted(drawn) == list(range(100))
+    assert len(pool) == 0
+
+
+@pytest.mark.parametrize("mode", ["quotes", "books"])
+@pytest.mark.parametrize("length", ["Any length", "Short only"])
+def test_every_quote_is_drawn_once(cli, books, mode, length):
+    short_only = length == "Short only"
+    expected = [book.get_quote(i, short_only).index
+                for book in books for i in range(book.total_short_q if short_only else book.total_q)]
+
+    sampler = cli.QuoteSampler(books, length, mode)
+    assert sampler.total_left == len(expected)
+    drawn = draw_all(sampler)
+    assert sorted(quote.index for _, quote, _ in drawn) == sorted(expected)
+    assert sampler.total_left == 0
+    assert sampler.draw() is None
+    if short_only:
+        assert all(len(quote.text) <= cli.MAX_CHAR_IN_SHORT_QUOTE for _, quote, _ in drawn)
+
+
+@pytest.mark.parametrize("mode", ["quotes", "books"])
+def test_quotes_left_counts_down_per_book(cli, books, mode):
+    left = {id(book): book.total_q for book in books}
+    for book, _, quotes_left in draw_all(cli.QuoteSampler(books, "Any length", mode)):
+        left[id(book)] -= 1
+        assert quotes_left == left[id(book)]
+
+
+def test_unseen_quotes_come_first(cli, books):
+    last_shown = [0] * len(cli.Quote_Store)
+    seen = set(random.sample(range(len(last_shown)), len(last_shown) // 2))
+    for index in seen:
+        last_shown[index] = 1000 + index
+
+    drawn = [quote.index for _, quote, _ in draw_all(cli.QuoteSampler(books, "Any length", prefer="unseen",
+                                                                      last_shown=last_shown))]
+    unseen_count = len(drawn) - len(seen & set(drawn))
+    assert not seen & set(drawn[:unseen_count])
+
+    drawn = [quote.index for _, quote, _ in draw_all(cli.QuoteSampler(books, "Any length", prefer="least-recent",
+                                                                      last_shown=last_shown))]
+    assert [last_shown[index] for index in drawn] == sorted(last_shown[index] for index in drawn)
+
+
+def test_seen_quotes_keep_their_time_after_a_library_change(cli, books, library):
+    seen = cli.SeenQuotes(cli.The_Collection, cli.Quote_Store)
+    shown = [(book, book.get_quote(i)) for book in books[:3] for i in range(2)]
+    for book, quote in shown:
+        seen.record(book, quote)
+    state = seen.merge_into(None)
+    assert len(state[0]) == len(shown) and seen.shown == {}
+    texts = {cli.Quote_Store.texts[quote.index] for _, quote in shown}
+
+    # a new book in front moves every quote id
+    with open(library, encoding="utf8") as file:
+        data = json.load(file)
+    doc = copy.deepcopy(next(doc for doc in data["docs"] if doc["citations"]))
+    doc["uri"] = "content://new/1"
+    data["docs"].insert(0, doc)
+    with open(library, "w", encoding="utf8") as file:
+        json.dump(data, file)
+    cli.build_the_collection()
+    last_shown = cli.SeenQuotes(cli.The_Collection, cli.Quote_Store, state).last_shown
+    assert {cli.Quote_Store.texts[index] for index, shown_time in enumerate(last_shown) if shown_time} == texts
+
+
+def test_random_command_prefers_the_unseen_quotes(cli, library):
+    def draw(*options):
+        return {(record["book"], record["text"])
+                for record in run_json(library, *options, "random", "--count", "300", "--seed", "5")}
+
+    first = draw("--prefer", "unseen")
+    seen_path = f"{library}.{cli.SEEN_CACHE_NAME}"
+    assert os.path.exists(seen_path)
+    assert not first & draw("--prefer", "unseen")
+    with open(seen_path, "rb") as file:
+        saved = file.read()
+    draw("--no-seen-history")
+    with open(seen_path, "rb") as file:
+        assert file.read() == saved
+
+
+@pytest.mark.parametrize("length", ["Any length", "Short only"])
+def test_samplers_draw_from_their_own_pools(cli, books, length):
+    # a book drawn empty by one sampler is still full for the next one
+    for _ in range(3):
+        first = cli.QuoteSampler(books, length, "books")
+        first_drawn = [first.draw() for _ in range(first.total_left // 2)]
+        second_drawn = draw_all(cli.QuoteSampler(books, length, "books"))
+        first_drawn += draw_all(first)
+        for drawn in (first_drawn, second_drawn):
+            assert all(quote is not None for _, quote, _ in drawn)
+            indices = [quote.index for _, quote, _ in drawn]
+            assert len(indices) == len(set(indices)) == sum(
+                book.total_short_q if length == "Short only" else book.total_q for book in books)
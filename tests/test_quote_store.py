@@ -0,0 +1,49 @@
+"""
+QuoteStore holds every quote of a book in one contiguous range, long
+quotes first, in collection order, with the columns of the library file.
+"""
+import json
+
+import pytest
+
+
+@pytest.fixture
+def docs(cli, library):
+    cli.build_the_collection()
+    with open(library, encoding="utf8") as file:
+        return {doc["uri"]: doc for doc in json.load(file)["docs"]}
+
+
+def test_book_ranges_hold_the_quotes_of_the_doc(cli, docs):
+    store = cli.Quote_Store
+    position = 0
+    for book_id, book in enumerate(cli.The_Collection):
+        # the ranges follow each other in collection order
+        assert book.q_start == position
+        position += book.total_q
+        citations = docs[book.file_id]["citations"]
+        long_quotes = [c for c in citations if len(c["note_body"]) > cli.MAX_CHAR_IN_SHORT_QUOTE]
+        short_quotes = [c for c in citations if len(c["note_body"]) <= cli.MAX_CHAR_IN_SHORT_QUOTE]
+        assert (book.long_q_count, book.total_short_q) == (len(long_quotes), len(short_quotes))
+        for quote, citation in zip(book.get_all_quotes_list(), long_quotes + short_quotes):
+            assert (quote.text, quote.page, quote.insert_time) == \
+                (citation["note_body"], citation["note_page"], citation["note_insert_time"])
+            assert store.lengths[quote.index] == len(citation["note_body"])
+            assert store.book_ids[quote.index] == book_id
+    assert position == len(store) == cli.All_Quotes_Count
+
+
+def test_views_follow_the_book_order(cli, docs):
+    for book in cli.The_Collection:
+        all_quotes = [quote.index for quote in book.get_all_quotes_list()]
+        assert [quote.index for quote in book.quotes + book.short_quotes] == all_quotes
+        assert [book.get_quote(i).index for i in range(book.total_q)] == all_quotes
+        assert [book.get_quote(i, short_only=True).index for i in range(book.total_short_q)] == \
+            [quote.index for quote in book.short_quotes]
+        assert book.get_quote_range() == (book.q_start, book.q_start + book.total_q)
+
+
+def test_views_have_no_instance_dictionary(cli, docs):
+    book = next(book for book in cli.The_Collection if book.total_q)
+    for view in (book, book.get_quote(0)):
+        assert not hasattr(view, "__dict__")
@@ -0,0 +1,184 @@
+"""
+Search query syntax: words, "phrases", prefix*, OR, ~similar words and
+=part of a word, checked against a scan of every quote.
+"""
+import itertools
+import os
+import random
+
+import pytest
+
+from conftest import load_cli
+
+
+@pytest.fixture
+def index(cli, library):
+    cli.build_the_collection()
+    return cli.get_search_index()
+
+
+def scan(cli, index, matches):
+    # quote ids whose token list is accepted by matches(tokens)
+    return {quote_id for quote_id, text in enumerate(index.store.texts) if matches(cli.tokenize(text))}
+
+
+def contains_sequence(tokens, sequence):
+    return any(tokens[i:i + len(sequence)] == sequence for i in range(len(tokens) - len(sequence) + 1))
+
+
+def search_ids(index, query):
+    return [quote_id for quote_id, _ in index.search(query)]
+
+
+@pytest.mark.parametrize("query, matches", [
+    ("love", lambda tokens: "love" in tokens),
+    ("river stone", lambda tokens: {"river", "stone"} <= set(tokens)),
+    ('"the river"', lambda tokens: contains_sequence(tokens, ["the", "river"])),
+    ('"The  River!"', lambda tokens: contains_sequence(tokens, ["the", "river"])),
+    ("hear*", lambda tokens: any(token.startswith("hear") for token in tokens)),
+    ("death OR silence", lambda tokens: "death" in tokens or "silence" in tokens),
+    ('light "the house" OR mountain*', lambda tokens: ("light" in tokens and contains_sequence(tokens, ["the", "house"]))
+                                                     or any(token.startswith("mountain") for token in tokens)),
+    ("qqqzz", lambda tokens: False),
+    ])
+def test_query_matches_like_a_scan(cli, index, query, matches):
+    found = search_ids(index, query)
+    assert len(found) == len(set(found))
+    assert set(found) == scan(cli, index, matches)
+
+
+def test_results_are_ranked_by_score_then_quote_id(cli, index):
+    ranked = list(index.search("love OR heart"))
+    # more results than the first ones taken with the heap, the sorted rest is read too
+    assert len(ranked) > cli.SEARCH_FIRST_RESULTS
+    assert ranked == sorted(ranked, key=lambda item: (-item[1], item[0]))
+    assert ranked[0][1] > ranked[-1][1] > 0
+
+
+@pytest.mark.parametrize("first_results", [0, 1, 5, 1000])
+def test_ranked_quotes_keep_the_order_of_ties(cli, first_results):
+    cli.SEARCH_FIRST_RESULTS = first_results
+    rnd = random.Random(first_results)
+    quote_ids = sorted(rnd.sample(range(10000), 300))
+    scores = [rnd.choice([0.5, 1.25, 2.0, 3.5]) for _ in quote_ids]
+    ranked = cli.RankedQuotes(quote_ids, scores)
+    assert len(ranked) == 300
+    assert list(ranked) == sorted(zip(quote_ids, scores), key=lambda item: (-item[1], item[0]))
+    assert list(ranked.get_book_scores(quote_ids[10], quote_ids[20])) == list(zip(quote_ids[10:20], scores[10:20]))
+
+
+@pytest.mark.parametrize("query", ["love river", "the love", "death OR the", '"the river" light', "hear* the"])
+def test_scores_do_not_depend_on_the_posting_walk(cli, index, query):
+    # the matched quotes are looked up in the posting, or the posting is filtered
+    cli.SEARCH_LOOKUP_RATIO = 0
+    filtered = list(index.search(query))
+    cli.SEARCH_LOOKUP_RATIO = 10 ** 9
+    assert list(index.search(query)) == filtered
+
+
+@pytest.mark.parametrize("first_results", [1, 5, 40])
+@pytest.mark.parametrize("query", ["the", "love", "the and", "love OR river", "time world", "~hart"])
+def test_first_results_are_the_ones_of_every_match_scored(cli, index, query, first_results):
+    cli.SEARCH_FIRST_RESULTS = first_results
+    cli.SEARCH_THRESHOLD_RATIO = 1
+    results = index.search(query)
+    first = list(itertools.islice(results, first_results))
+    start, end = index.books[0].get_quote_range()[0], index.books[-1].get_quote_range()[1]
+    book_scores = list(results.get_book_scores(start, end))
+    # the postings were only read at their start
+    assert results._scores is None
+
+    scored = cli.RankedQuotes(results.quote_ids, results.scores)
+    assert first == list(scored)[:first_results]
+    assert book_scores == list(scored.get_book_scores(start, end))
+    assert list(results) == list(scored)
+
+
+def test_first_results_of_too_many_lookups_score_every_match(cli, index):
+    cli.SEARCH_THRESHOLD_RATIO = 10 ** 9
+    results = index.search("love OR river")
+    first = next(iter(results))
+    assert results._scores is not None
+    assert first == next(iter(cli.RankedQuotes(results.quote_ids, results.scores)))
+
+
+def test_groups_hold_every_match_once_books_by_best_quote(cli, index):
+    groups = list(cli.search_the_collection("love river"))
+    scores = dict(index.search("love river"))
+    quote_ids = [quote.index for _, quotes in groups for quote in quotes]
+    assert sorted(quote_ids) == sorted(scores)
+    best = [max(scores[quote.index] for quote in quotes) for _, quotes in groups]
+    assert best == sorted(best, reverse=True)
+    for book, quotes in groups:
+        assert all(book.q_start <= quote.index < book.q_start + book.total_q for quote in quotes)
+        assert [scores[quote.index] for quote in quotes] == sorted((scores[quote.index] for quote in quotes), reverse=True)
+
+
+def test_fuzzy_term_matches_similar_words(cli, index):
+    similar = cli.get_similar_words("hart")
+    assert "heart" in similar
+    assert set(search_ids(index, "~hart")) == scan(cli, index, lambda tokens: bool(set(similar) & set(tokens)))
+
+
+@pytest.mark.parametrize("word, max_distance", [("hart", 1), ("rivr", 1), ("montain", 2), ("lght", 1), ("xq", 1)])
+def test_similar_words_match_a_scan_of_the_vocabulary(cli, index, word, max_distance):
+    words = cli.get_trigram_index().words
+    expected = sorted((cli.get_edit_distance(word, candidate, max_distance), candidate) for candidate in words)
+    expected = [candidate for distance, candidate in expected if distance <= max_distance]
+    assert cli.get_trigram_index().find_similar(word, max_distance) == expected
+
+
+def test_edit_distance(cli):
+    assert cli.get_edit_distance("kitten", "sitting", 5) == 3
+    assert cli.get_edit_distance("kitten", "sitting", 2) == 3
+    assert cli.get_edit_distance("", "abc", 3) == 3
+    assert cli.get_edit_distance("river", "river", 0) == 0
+
+
+@pytest.mark.parametrize("piece, starts_word, ends_word", [
+    ("ount", False, False), ("river", True, False), ("ness", False, True), ("stone", True, True), ("zzz", False, False)])
+def test_words_containing_a_piece_match_a_scan(cli, index, piece, starts_word, ends_word):
+    words = cli.get_trigram_index().words
+    padded = f"{'$' if starts_word else ''}{piece}{'$' if ends_word else ''}"
+    assert cli.get_trigram_index().find_containing(piece, starts_word, ends_word) == \
+        [word for word in words if padded in f"${word}$"]
+    assert cli.get_trigram_index().find_containing("a") is None
+
+
+@pytest.mark.parametrize("text", ["ounta", "ver sto", "s, the", "e", "Zzz"])
+def test_part_of_word_search(cli, index, text):
+    books, groups, _, _ = cli.find_search_results(f"={text}")
+    found = {quote.index for _, quotes in groups for quote in quotes}
+    assert found == {quote_id for quote_id, quote_text in enumerate(index.store.texts) if text.lower() in quote_text.lower()}
+    assert books == [book for book in index.books if text.lower() in cli.get_book_text(book).lower()]
+
+
+def test_no_word_match_falls_back_to_part_of_word(cli, index):
+    _, groups, _, note = cli.find_search_results("ountai")
+    assert note == "Searched as part of words."
+    assert groups
+
+
+def test_no_match_falls_back_to_similar_words(cli, index):
+    _, groups, _, note = cli.find_search_results("mountian")
+    assert note.startswith("Did you mean: ")
+    assert "mountain" in note
+    assert groups
+
+
+def test_highlight_pattern_does_not_take_the_query_as_a_regex(cli):
+    pattern = cli.get_highlight_pattern('(love [a-z] "the river"')
+    assert [match.group() for match in pattern.finditer("Love the  river, (love) [a-z]")] == \
+        ["Love", "the  river", "love", "a-z"]
+
+
+def test_index_is_saved_and_reused_for_the_same_library(cli, library):
+    cli.load_the_collection()
+    cli.get_search_index()
+    assert os.path.exists(cli.get_cache_path(cli.SEARCH_INDEX_CACHE_NAME))
+
+    cli = load_cli()
+    cli.LIBRARY_FILE = library
+    cli.load_the_collection()
+    cli.SearchIndex._build = None
+    assert cli.get_search_index().search("love")
@@ -0,0 +1,99 @@
+"""
+SimilarQuotes finds the quotes of highest TF-IDF cosine similarity, like
+a comparison with every quote of The Collection.
+"""
+import math
+from collections import Counter
+
+import pytest
+
+from test_headless import run_json
+
+
+@pytest.fixture
+def collection(cli, library):
+    cli.build_the_collection()
+    return cli
+
+
+def get_vectors(cli):
+    # the TF-IDF vectors of every quote, computed from the texts
+    counts = [Counter(cli.tokenize(text)) for text in cli.Quote_Store.texts]
+    frequencies = Counter(token for quote_counts in counts for token in quote_counts)
+    idfs = {token: math.log((1 + len(counts)) / (1 + frequency)) + 1 for token, frequency in frequencies.items()}
+    vectors = [{token: (1 + math.log(count)) * idfs[token] for token, count in quote_counts.items()}
+               for quote_counts in counts]
+    return vectors, idfs
+
+
+def find_by_scan(cli, text, count, excluded=range(0)):
+    vectors, idfs = get_vectors(cli)
+    missing_idf = math.log(1 + len(vectors)) + 1
+    vector = {token: (1 + math.log(token_count)) * idfs.get(token, missing_idf)
+              for token, token_count in Counter(cli.tokenize(text)).items()}
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    results = []
+    for quote_id, other in enumerate(vectors):
+        dot = sum(weight * other.get(token, 0.0) for token, weight in vector.items())
+        if dot > 0 and quote_id not in excluded:
+            results.append((quote_id, dot / (norm * math.sqrt(sum(weight * weight for weight in other.values())))))
+    return sorted(results, key=lambda item: (-item[1], item[0]))[:count]
+
+
+def rounded(results):
+    return [(quote_id, round(similarity, 9)) for quote_id, similarity in results]
+
+
+def test_norms_match_the_vectors(collection):
+    vectors, _ = get_vectors(collection)
+    norms = collection.get_similar_quotes().norms
+    assert norms.tolist() == pytest.approx([math.sqrt(sum(weight * weight for weight in vector.values()))
+                                            for vector in vectors])
+
+
+@pytest.mark.parametrize("quote_id", [0, 17, 345, -1])
+def test_lookup_finds_the_most_similar_quotes(collection, quote_id):
+    texts = collection.Quote_Store.texts
+    quote_id %= len(texts)
+    similar = collection.get_similar_quotes()
+    # the quote itself is the best match
+    results = similar.find(texts[quote_id], 10)
+    assert results[0] == (quote_id, pytest.approx(1.0))
+    assert rounded(results) == rounded(find_by_scan(collection, texts[quote_id], 10))
+
+    excluded = range(quote_id, quote_id + 1)
+    assert rounded(similar.find(texts[quote_id], 10, excluded)) == rounded(
+        find_by_scan(collection, texts[quote_id], 10, excluded))
+
+
+def test_lookup_of_a_new_text(collection):
+    text = "the river under the mountain and a qqqzz stone"
+    assert rounded(collection.get_similar_quotes().find(text, 20)) == rounded(find_by_scan(collection, text, 20))
+    assert collection.get_similar_quotes().find("... !!! ...", 5) == []
+
+
+def test_small_budget_still_finds_candidates(collection):
+    collection.SIMILAR_POSTINGS_BUDGET = 1
+    text = collection.Quote_Store.texts[3]
+    results = collection.get_similar_quotes().find(text, 5)
+    assert results and results[0][0] == 3
+    assert [similarity for _, similarity in results] == sorted((similarity for _, similarity in results), reverse=True)
+
+
+def test_similar_quotes_of_other_books(collection):
+    book = max(collection.The_Collection, key=lambda book: book.total_q)
+    quote = book.get_quote(0)
+    results = collection.find_similar_quotes(book, quote, 8)
+    assert results and all(similar_book is not book for similar_book, _, _ in results)
+    same_book = collection.find_similar_quotes(book, quote, 8, same_book=True)
+    assert all(similar_quote.index != quote.index for _, similar_quote, _ in same_book)
+
+
+def test_similar_command(collection, library):
+    book = max(collection.The_Collection, key=lambda book: book.total_q)
+    sorted_by_page = sorted(book.get_all_quotes_list(), key=lambda quote: quote.page)
+    records = run_json(library, "similar", "--book", book.title, "--number", "2", "--top", "4")
+    assert records == [{"book": similar_book.title, "author": similar_book.author or "", "page": quote.page,
+                        "similarity": round(similarity, 4), "text": quote.text}
+                       for similar_book, quote, similarity in collection.find_similar_quotes(book, sorted_by_page[1], 4)]
+    assert len(records) == 4
@@ -0,0 +1,97 @@
+"""
+The snapshot is reused while the library file is unchanged and dropped
+as soon as it is not.
+"""
+import json
+import os
+
+from conftest import get_collection_state, load_cli
+
+
+def load_again(library):
+    # a new session: fresh module state, only the files are shared
+    cli = load_cli()
+    cli.LIBRARY_FILE = library
+    return cli
+
+
+def rewrite_library(library, change):
+    with open(library, encoding="utf8") as file:
+        data = json.load(file)
+    change(data)
+    with open(library, "w", encoding="utf8") as file:
+        json.dump(data, file)
+
+
+def test_snapshot_is_written_and_restores_the_collection(cli, library):
+    cli.load_the_collection()
+    built = get_collection_state(cli)
+    assert os.path.exists(cli.get_cache_path(cli.SNAPSHOT_CACHE_NAME))
+
+    cli = load_again(library)
+    assert cli.load_collection_snapshot()
+    assert get_collection_state(cli) == built
+
+
+def test_no_snapshot_builds_and_writes_nothing(cli, library):
+    cli.load_the_collection(use_snapshot=False)
+    assert cli.The_Collection
+    assert not os.path.exists(cli.get_cache_path(cli.SNAPSHOT_CACHE_NAME))
+
+
+def test_touched_library_keeps_the_snapshot(cli, library):
+    cli.load_the_collection()
+    stat = os.stat(library)
+    os.utime(library, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_again(library).load_collection_snapshot()
+
+    # the new modification time was stored, the hash is not needed again
+    cli = load_again(library)
+    cli.compute_file_hash = None
+    assert cli.load_collection_snapshot()
+
+
+def test_changed_library_drops_the_snapshot(cli, library):
+    cli.load_the_collection()
+    rewrite_library(library, lambda data: data["docs"][0]["data"].update(doc_file_name_title="Another title"))
+    assert not load_again(library).load_collection_snapshot()
+
+
+def test_same_size_other_content_drops_the_snapshot(cli, library):
+    cli.load_the_collection()
+    with open(library, "r+b") as file:
+        content = file.read()
+        position = content.index(b'"note_body": "') + len(b'"note_body": "')
+        file.seek(position)
+        file.write(b"X" if content[position:position + 1] != b"X" else b"Y")
+    assert not load_again(library).load_collection_snapshot()
+
+
+def test_other_format_version_or_damaged_snapshot_is_ignored(cli, library):
+    cli.load_the_collection()
+    payload = cli.read_cache_file(cli.SNAPSHOT_CACHE_NAME)
+    cli.write_cache_file(cli.SNAPSHOT_CACHE_NAME, payload, cli.CACHE_FORMAT_VERSION + 1)
+    assert not load_again(library).load_collection_snapshot()
+
+    with open(cli.get_cache_path(cli.SNAPSHOT_CACHE_NAME), "wb") as file:
+        file.write(cli.CACHE_MAGIC)
+    assert not load_again(library).load_collection_snapshot()
+
+
+def test_snapshot_texts_are_loaded_per_book(cli, library):
+    cli.load_the_collection()
+    built = [book.get_quote_texts() for book in cli.The_Collection]
+
+    cli = load_again(library)
+    assert cli.load_collection_snapshot()
+    texts = cli.Quote_Store.texts
+    assert isinstance(texts, cli.LazyQuoteTexts)
+    waiting = sum(block is not None for block in texts.blocks)
+    assert waiting == sum(book.total_q > 0 for book in cli.The_Collection)
+
+    position, book = next((position, book) for position, book in enumerate(cli.The_Collection) if book.total_q > 1)
+    assert book.get_quote(1).text == built[position][1]
+    assert sum(block is not None for block in texts.blocks) == waiting - 1
+    assert texts[-1] == [text for book_texts in built for text in book_texts][-1]
+    assert [book.get_quote_texts() for book in cli.The_Collection] == built
+    assert not any(texts.blocks)
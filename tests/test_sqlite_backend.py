@@ -0,0 +1,78 @@
+"""
+--backend sqlite gives the same output as the memory backend, and its
+database follows the library file.
+"""
+import json
+import subprocess
+import sys
+
+import pytest
+
+from conftest import SCRIPT_PATH, get_collection_state, load_cli
+
+SEARCH_QUERIES = ["love", "river stone", '"the river"', "hear*", "death OR silence", 'light "the house" OR mountain*',
+                  "=ounta", "ountai", "~hart", "mountian", "qqqzz"]
+
+
+def run_batch(library, backend, commands):
+    process = subprocess.run([sys.executable, SCRIPT_PATH, "--library", library, "--backend", backend, "batch"],
+                             input='\n'.join(commands) + '\n', capture_output=True, text=True, encoding="utf8")
+    assert process.returncode == 0, process.stderr
+    return [json.loads(line) for line in process.stdout.splitlines()]
+
+
+@pytest.fixture
+def collection(cli, library):
+    cli.build_the_collection()
+    return cli
+
+
+def test_commands_give_the_same_output(collection, library):
+    author = collection.Collection_Index.get_books(collection.Collection_Index.with_quotes)[0].author
+    book = max(collection.The_Collection, key=lambda book: book.total_q)
+    commands = ["stats"]
+    commands += [f"search {json.dumps(query)}" for query in SEARCH_QUERIES]
+    commands += [f"list --by {name}" for name in collection.LIST_PROPERTY_NAMES]
+    commands += ["random --count 40 --seed 2", "random --count 40 --seed 2 --length short",
+                 f"random --count 20 --seed 3 --author {json.dumps(author)}", f"export --book {json.dumps(book.title)}",
+                 f"similar --book {json.dumps(book.title)} --number 2 --top 5"]
+
+    memory = run_batch(library, "memory", commands)
+    sqlite = run_batch(library, "sqlite", commands)
+    assert [result["command"] for result in sqlite] == commands
+    assert all("records" in result for result in sqlite)
+    for memory_result, sqlite_result in zip(memory, sqlite):
+        assert sqlite_result == memory_result
+    # the second start reads the saved database
+    assert run_batch(library, "sqlite", commands) == memory
+
+
+def test_database_store_matches_the_built_collection(cli, library):
+    cli.build_the_collection()
+    built = get_collection_state(cli)
+
+    cli = load_cli()
+    cli.LIBRARY_FILE = library
+    cli.load_the_collection(backend="sqlite")
+    assert isinstance(cli.Quote_Store, cli.SqliteQuoteStore)
+    assert get_collection_state(cli) == built
+    store = cli.Quote_Store
+    assert store.texts[3:9] == built["texts"][3:9]
+    assert store.texts[-1] == built["texts"][-1]
+    with pytest.raises(IndexError):
+        store.pages[len(store)]
+
+
+def test_database_is_rebuilt_when_the_library_changes(cli, library):
+    cli.load_the_collection(backend="sqlite")
+    with open(library, encoding="utf8") as file:
+        data = json.load(file)
+    doc = next(doc for doc in data["docs"] if doc["data"]["doc_active"] == 1 and doc["citations"])
+    doc["citations"][0]["note_body"] = "A changed quote"
+    with open(library, "w", encoding="utf8") as file:
+        json.dump(data, file)
+
+    cli = load_cli()
+    cli.LIBRARY_FILE = library
+    cli.load_the_collection(backend="sqlite")
+    assert list(cli.Quote_Store.texts).count("A changed quote") == 1
@@ -0,0 +1,90 @@
+"""
+TerminalOutput wraps like textwrap and pages long views on a terminal.
+"""
+import io
+import sys
+import textwrap
+
+import pytest
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+@pytest.fixture
+def output(cli):
+    output = cli.TerminalOutput()
+    output.columns, output.lines = 40, 6
+    output.wrapper.width = 39
+    return output
+
+
+TEXTS = ["", " ", "word", "   starts with spaces", "ends with spaces   ", "two  spaces  between  words",
+         "a-hyphenated-word in a rather long line of text that goes on", "tab\tand\nnew line\rand \x0bmore",
+         "averyveryveryveryveryverylongwordwithoutanyspaceatallinsideit and more",
+         "exactly thirty-nine characters long ok!", "exactly thirty nine characters long ok!",
+         "forty characters long exactly, no more!!", "non breaking space and em—dash"]
+
+
+@pytest.mark.parametrize("width", [1, 5, 12, 39, 80])
+def test_wrap_gives_the_lines_of_textwrap(cli, library, output, width):
+    cli.build_the_collection()
+    output.wrapper.width = width
+    reference = textwrap.TextWrapper(width=width)
+    for text in TEXTS + list(cli.Quote_Store.texts):
+        assert output.wrap(text) == reference.wrap(text), text
+
+
+def run_paged(monkeypatch, output, answers, lines):
+    terminal = Terminal()
+    prompts = []
+    answers = iter(answers)
+    monkeypatch.setattr(sys, "stdin", Terminal())
+    monkeypatch.setattr(sys, "stdout", terminal)
+    monkeypatch.setattr("builtins.input", lambda prompt: prompts.append(prompt) or next(answers))
+    written = []
+    with output.paged():
+        for line in lines:
+            if not output.print(line):
+                break
+            written.append(line)
+    return terminal.getvalue(), prompts, written
+
+
+def test_long_output_stops_after_every_screen(cli, monkeypatch, output):
+    lines = [f"line {i}" for i in range(12)]
+    text, prompts, written = run_paged(monkeypatch, output, ["", ""], lines)
+    # a screen of 6 lines leaves one for the prompt
+    assert len(prompts) == 2
+    assert written == lines
+    assert text == ''.join(f"{line}\n" for line in lines)
+
+
+def test_x_stops_the_output(cli, monkeypatch, output):
+    lines = [f"line {i}" for i in range(12)]
+    text, prompts, written = run_paged(monkeypatch, output, ["x"], lines)
+    assert len(prompts) == 1
+    assert written == lines[:5]
+    assert text == ''.join(f"{line}\n" for line in lines[:5])
+    assert output.print("after the view")
+    output.flush()
+
+
+def test_long_lines_count_as_several_rows(cli, monkeypatch, output):
+    _, prompts, _ = run_paged(monkeypatch, output, ["", "", ""], ["x" * 100] * 4)
+    assert len(prompts) == 3
+
+
+def test_piped_output_is_not_paged(cli, monkeypatch, output, capsys):
+    with output.paged():
+        for i in range(50):
+            output.print(f"line {i}")
+    assert capsys.readouterr().out == ''.join(f"line {i}\n" for i in range(50))
+
+
+def test_no_pager_option_turns_paging_off(cli, monkeypatch, output):
+    cli.Paging_Enabled = False
+    _, prompts, written = run_paged(monkeypatch, output, [], [f"line {i}" for i in range(20)])
+    assert prompts == [] and len(written) == 20
@@ -0,0 +1,94 @@
+"""
+Watch mode: a changed library file rebuilds only the changed books and
+gives the same collection as a full build of the new file.
+"""
+import copy
+import json
+import os
+
+import pytest
+
+from conftest import get_collection_state, load_cli
+
+
+def edit_quote(data):
+    doc = next(doc for doc in data["docs"] if doc.get("citations"))
+    doc["citations"][0]["note_body"] += " edited"
+    doc["citations"].append({"note_body": "A new quote about rivers", "note_page": 3,
+                             "note_insert_time": 1700000000000})
+
+
+def retitle(data):
+    data["docs"][1]["data"]["doc_file_name_title"] = "Aaa new title"
+
+
+def add_book(data):
+    doc = copy.deepcopy(next(doc for doc in data["docs"] if doc.get("citations")))
+    doc["uri"] = "content://new/1"
+    data["docs"].insert(5, doc)
+
+
+def remove_book(data):
+    data["docs"].pop(3)
+
+
+def deactivate(data):
+    data["docs"][2]["data"]["doc_active"] = 0
+
+
+def move_to_folder(data):
+    data["colls"][0]["docs"].append(data["docs"][7]["uri"])
+
+
+@pytest.mark.parametrize("change, expected", [
+    (edit_quote, "0 books added, 1 changed, 0 removed"),
+    (retitle, "0 books added, 1 changed, 0 removed"),
+    (add_book, "1 books added, 0 changed, 0 removed"),
+    (remove_book, "0 books added, 0 changed, 1 removed"),
+    (deactivate, "0 books added, 0 changed, 1 removed"),
+    (move_to_folder, "0 books added, 0 changed, 0 removed"),
+    ])
+@pytest.mark.parametrize("from_snapshot", [False, True])
+def test_reload_matches_a_full_build(cli, library, change, expected, from_snapshot):
+    if from_snapshot:
+        # a snapshot saved without watch mode, loaded by a watching session
+        cli.load_the_collection()
+        cli = load_cli()
+        cli.LIBRARY_FILE = library
+    cli.watch_the_library()
+    cli.load_the_collection()
+    cli.get_search_index()
+
+    with open(library, encoding="utf8") as file:
+        data = json.load(file)
+    change(data)
+    with open(library, "w", encoding="utf8") as file:
+        json.dump(data, file)
+    stat = os.stat(library)
+    os.utime(library, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    note = cli.check_library_changes()
+    assert expected in note
+    assert cli.check_library_changes() is None
+    reloaded = get_collection_state(cli)
+    search_results = [(book.title, [quote.text for quote in quotes]) for book, quotes in cli.search_the_collection("river")]
+
+    cli.build_the_collection()
+    cli.prepare_derived_structures()
+    assert reloaded == get_collection_state(cli)
+    assert search_results == [(book.title, [quote.text for quote in quotes])
+                              for book, quotes in cli.search_the_collection("river")]
+
+
+def test_unreadable_file_is_read_again_at_the_next_check(cli, library):
+    cli.watch_the_library()
+    cli.load_the_collection()
+    with open(library, encoding="utf8") as file:
+        content = file.read()
+    with open(library, "w", encoding="utf8") as file:
+        file.write(content[:len(content) // 2])
+    assert "could not be read" in cli.check_library_changes()
+
+    with open(library, "w", encoding="utf8") as file:
+        file.write(content)
+    assert "0 books added, 0 changed, 0 removed" in cli.check_library_changes()
@@ -0,0 +1,57 @@
+"""
+WordStatistics gives the Top 30 words and their top books of the former
+regex based statistics code, ties included.
+"""
+import re
+from collections import Counter
+
+import pytest
+
+
+@pytest.fixture
+def statistics(cli, library):
+    cli.build_the_collection()
+    return cli.get_word_statistics()
+
+
+def count_words_with_regexes(cli):
+    # the statistics code before WordStatistics, kept here as the reference
+    all_text = ' '.join(quote.text for book in cli.The_Collection for quote in book.get_all_quotes_list())
+    pattern = r"\b(?:" + '|'.join(cli.WORDS_TO_OMIT) + r")\b"
+    words = re.findall(r"\b\w{4,}\b", re.sub(pattern, "", all_text, flags=re.IGNORECASE).lower())
+    top_30 = Counter(words).most_common(30)
+
+    result = []
+    for word, count in top_30:
+        max_count, book_string = 0, ""
+        for book in cli.The_Collection:
+            quotes_text = ' '.join(quote.text for quote in book.get_all_quotes_list()).lower()
+            word_count = Counter(re.findall(r"\b\w{4,}\b", quotes_text)).get(word, 0)
+            if word_count > max_count:
+                max_count, book_string = word_count, book.title
+        result.append((word, count, max_count, book_string))
+    return result
+
+
+def test_top_words_match_the_regex_counts(cli, statistics):
+    top = []
+    for word, count in statistics.counts.most_common(30):
+        max_count, book = statistics.get_top_book(word)
+        top.append((word, count, max_count, book.title if book else ""))
+    assert top == count_words_with_regexes(cli)
+
+
+def test_counts_per_book_add_up(cli, statistics):
+    total = Counter()
+    for book, book_counts in zip(cli.The_Collection, statistics.book_counts):
+        assert not cli.WORDS_TO_OMIT & set(book_counts)
+        assert all(len(word) >= 4 for word in book_counts)
+        total.update(book_counts)
+    assert total == statistics.counts
+    assert statistics.get_top_book("qqqzz") == (0, None)
+
+
+def test_statistics_are_kept_until_the_collection_is_reloaded(cli, statistics):
+    assert cli.get_word_statistics() is statistics
+    cli.build_the_collection()
+    assert cli.get_word_statistics() is not statistics